@@ -1,8 +1,22 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
-from app.routers import authentication, portfolio, prediction, metrics
+from app.services.alerts import start_alert_sender, stop_alert_sender
+from app.services.database import init_db
+from app.services.executors import shutdown_executors
+from app.routers import authentication, portfolio, prediction, metrics, jobs, health
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema migrations run once at startup, not as a side effect of importing
+    # the database module; the modelling and plotting stacks load on first use.
+    init_db()
+    start_alert_sender()
+    yield
+    await stop_alert_sender()
+    shutdown_executors()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS middleware
 origins = [
@@ -26,6 +40,8 @@ app.include_router(authentication.router, prefix="/auth", tags=["authentication"
 app.include_router(portfolio.router, prefix="/portfolio", tags=["portfolio"])
 app.include_router(prediction.router, prefix="/predict", tags=["prediction"])
 app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
+app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+app.include_router(health.router, prefix="/health", tags=["health"])
 
 @app.get("/")
 async def root():
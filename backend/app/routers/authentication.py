@@ -3,16 +3,28 @@ from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
 
 from app.services.auth import authenticate_user, create_access_token
-from app.services.database import add_user as add_user_service
+from app.services.database import add_user as add_user_service, run_db
+from app.services.hashing import HashingBusy, hash_password
 from app.models.user import User, Token, UserInDB # Import UserInDB
 
 router = APIRouter()
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+def _hashing_busy(e: HashingBusy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
 @router.post("/signup", response_model=User) # This should remain User for input validation
 async def signup(user: User):
-    if not add_user_service(user):
+    try:
+        hashed_password = await hash_password(user.password)
+    except HashingBusy as e:
+        raise _hashing_busy(e)
+    if not await run_db(add_user_service, user, hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
@@ -22,7 +34,10 @@ async def signup(user: User):
 
 @router.post("/login", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(email=form_data.username, password=form_data.password)
+    try:
+        user = await authenticate_user(email=form_data.username, password=form_data.password)
+    except HashingBusy as e:
+        raise _hashing_busy(e)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends
+from app.services.alerts import alert_stats
+from app.services.auth import get_current_user
+from app.services.database import run_db
+from app.services.executors import executor_stats
+from app.services.hashing import hashing_stats
+
+# Operational stats; they expose load and configuration, so only signed-in
+# users may read them
+router = APIRouter(dependencies=[Depends(get_current_user)])
+
+@router.get("/executors")
+async def get_executor_stats():
+    """Queue depth, active calls and average queue wait of each worker pool."""
+    return executor_stats()
+
+@router.get("/hashing")
+async def get_hashing_stats():
+    """bcrypt cost, hash pool admission limit and how many hashes were turned away."""
+    return hashing_stats()
+
+@router.get("/alerts")
+async def get_alert_stats():
+    """Whether alert delivery is configured and the outbox row count per status."""
+    return await run_db(alert_stats)
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from app.services.auth import get_current_user
+from app.models.user import UserInDB
+from app.services.jobs import cancel_job, get_job, list_jobs
+
+router = APIRouter()
+
+@router.get("/")
+async def get_jobs(current_user: UserInDB = Depends(get_current_user)):
+    """The user's retained jobs, oldest first, without their results."""
+    return [job.to_dict(include_result=False) for job in list_jobs(current_user.id)]
+
+@router.get("/{job_id}")
+async def get_job_status(job_id: str, current_user: UserInDB = Depends(get_current_user)):
+    job = get_job(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job.to_dict()
+
+@router.delete("/{job_id}")
+async def cancel_job_request(job_id: str, current_user: UserInDB = Depends(get_current_user)):
+    job = cancel_job(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job.to_dict(include_result=False)
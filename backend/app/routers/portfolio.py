@@ -1,129 +1,202 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, status
+from fastapi import APIRouter, Depends, HTTPException, File, Request, UploadFile, status
 from typing import List, Optional
 from app.services.portfolio_math import run_and_plot_strategy
+from app.services.plots import get_plot
+from app.services.backtest import DEFAULT_LOOKBACKS, backtest_rules, parse_list, run_backtest
 from app.services.investment_rule import run_investment_strategy
+from app.services.stress import check_paths
 from app.services.risk_checker import run_risk_check
 from app.services.auth import get_current_user
 from app.models.user import UserInDB
-from app.services.file_processing import process_uploaded_files, save_uploaded_files
-from app.services.database import add_metric, add_portfolio_data, update_user_uploaded_file_paths, add_investment_strategy_data
+from app.services.file_processing import load_price_bundle, process_uploaded_files, resolve_file_paths
+from app.services.database import add_metrics_bulk, add_portfolio_data, add_investment_strategy_data, get_user_uploads, run_db
+from app.services.executors import run_in_pool
+from app.services.jobs import JobLimitExceeded, run_job_inline, submit_job
 import base64
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
 router = APIRouter()
 
-@router.post("/analysis")
-async def portfolio_analysis(rule: str, files: List[UploadFile] | None = File(None), current_user: UserInDB = Depends(get_current_user)):
-    user_id = current_user.id
-    file_paths_to_process = []
+PLOT_FORMATS = ("base64", "url")
+
+def _submit(kind: str, user_id: int, func, *args):
+    try:
+        job = submit_job(kind, user_id, func, *args)
+    except JobLimitExceeded as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    return job.to_dict()
+
 
-    if files:
-        # New files uploaded, save them and update user's stored paths
-        saved_paths = await save_uploaded_files(files, user_id)
-        update_user_uploaded_file_paths(user_id, saved_paths)
-        file_paths_to_process = saved_paths
+# The tasks below run on job worker threads, so they use the synchronous
+# loaders and DB calls.
+def _analysis_task(user_id: int, rule: str, file_paths: List[str], plot_format: str = "base64"):
+    processed_data = load_price_bundle(file_paths)
+    
+    # Flatten data for database insertion
+    db_data = []
+    for series in processed_data:
+        if series.dates is None:
+            continue
+        for date, close in zip(series.date_strings().tolist(), series.close.tolist()):
+            db_data.append({
+                "user_id": user_id,
+                "symbol": series.symbol,
+                "date": date,
+                "close": close
+            })
+    add_portfolio_data(db_data)
+    
+    comparison_df, insights, weights, plot_id = run_and_plot_strategy(rule, processed_data, user_id)
+    add_metrics_bulk([(f"{rule}_weight_{w}", weights[w]) for w in weights], user_id, refresh_dashboard=False)
+
+    # Store analysis results in the database
+    analysis_result = {
+        "rule": rule,
+        "insights": insights,
+        "weights": weights,
+        # We don't store plot_path directly, but the insights/weights are key results
+    }
+    # Re-using this table for analysis results; this last write refreshes the dashboard
+    add_investment_strategy_data(user_id, analysis_result)
+
+    content = {
+        "comparison_data": comparison_df,
+        "insights": insights
+    }
+    if plot_format == "url":
+        # The image is served separately, cacheable by its content hash
+        content["plot_url"] = f"/portfolio/plots/{plot_id}"
     else:
-        # No new files, use previously uploaded files
-        if current_user.uploaded_file_paths:
-            file_paths_to_process = current_user.uploaded_file_paths
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No files provided and no previously uploaded files found for this user."
-            )
+        content["plot"] = base64.b64encode(get_plot(plot_id)).decode("utf-8")
+    return content
+
+
+def _check_plot_format(plot_format: str):
+    if plot_format not in PLOT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"plot_format must be one of {list(PLOT_FORMATS)}")
 
+
+def _check_paths(paths: Optional[int]):
+    # Checked before the run is queued, so an oversized request fails at once
     try:
-        processed_data = await process_uploaded_files(file_paths_to_process)
-        
-        # Flatten data for database insertion
-        db_data = []
-        for crypto in processed_data:
-            for row in crypto['data']:
-                db_data.append({
-                    "user_id": user_id,
-                    "symbol": crypto['symbol'],
-                    "date": row['date'],
-                    "close": row['close']
-                })
-        add_portfolio_data(db_data)
-        
-        comparison_df, insights, weights, plot_path = run_and_plot_strategy(rule, processed_data, user_id)
-        for w in weights:
-            add_metric(f"{rule}_weight_{w}", weights[w], user_id)
-
-        # Store analysis results in the database
-        analysis_result = {
-            "rule": rule,
-            "insights": insights,
-            "weights": weights,
-            # We don't store plot_path directly, but the insights/weights are key results
-        }
-        add_investment_strategy_data(user_id, analysis_result) # Re-using this table for analysis results
+        check_paths(paths)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
-        with open(plot_path, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
+def _investment_strategy_task(user_id: int, file_paths: List[str], paths: Optional[int] = None, seed: Optional[int] = None):
+    processed_data = load_price_bundle(file_paths)
+    result = run_investment_strategy(processed_data, n_paths=paths, seed=seed)
+    add_metrics_bulk(
+        [("investment_strategy_return", result["portfolio_return"])]
+        + [(f"investment_strategy_weight_{w}", result['weights'][w]) for w in result['weights']],
+        user_id,
+        refresh_dashboard=False,
+    )
+    
+    # Store investment strategy results in the database; this last write refreshes the dashboard
+    add_investment_strategy_data(user_id, result)
+    return result
 
-        return JSONResponse(content={
-            "plot": encoded_string,
-            "comparison_data": comparison_df,
-            "insights": insights
-        })
+
+@router.post("/analysis")
+async def portfolio_analysis(rule: str, files: List[UploadFile] | None = File(None), resample: Optional[str] = None, plot_format: str = "base64", current_user: UserInDB = Depends(get_current_user)):
+    """`plot_format=url` returns `plot_url` instead of embedding the PNG as base64."""
+    _check_plot_format(plot_format)
+    file_paths_to_process = await resolve_file_paths(files, resample, current_user)
+    try:
+        content = await run_job_inline(_analysis_task, current_user.id, rule, file_paths_to_process, plot_format)
+        return JSONResponse(content=content)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/analysis/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_portfolio_analysis_job(rule: str, files: List[UploadFile] | None = File(None), resample: Optional[str] = None, plot_format: str = "base64", current_user: UserInDB = Depends(get_current_user)):
+    """Queue a portfolio analysis and return its job; poll /jobs/{job_id} for the result."""
+    _check_plot_format(plot_format)
+    file_paths_to_process = await resolve_file_paths(files, resample, current_user)
+    return _submit("portfolio_analysis", current_user.id, _analysis_task, current_user.id, rule, file_paths_to_process, plot_format)
+
+@router.get("/uploads")
+async def list_uploads(current_user: UserInDB = Depends(get_current_user)):
+    """The files used when a request brings none: symbol, row count, date range and content hash of each."""
+    return await run_db(get_user_uploads, current_user.id)
+
+@router.get("/plots/{plot_id}")
+async def get_plot_image(plot_id: str, request: Request, current_user: UserInDB = Depends(get_current_user)):
+    """
+    Serve a rendered analysis plot. Ids are SHA-256 hashes of the plotted data,
+    so they cannot be enumerated, and the image never changes: clients may
+    cache it forever and revalidate with If-None-Match.
+    """
+    etag = f'"{plot_id}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    image = await run_in_pool("io", get_plot, plot_id)
+    if image is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Plot not found")
+    return Response(content=image, media_type="image/png", headers=headers)
+
 @router.post("/investment-strategy")
-async def investment_strategy(files: List[UploadFile] | None = File(None), current_user: UserInDB = Depends(get_current_user)):
-    user_id = current_user.id
-    file_paths_to_process = []
+async def investment_strategy(files: List[UploadFile] | None = File(None), resample: Optional[str] = None, paths: Optional[int] = None, seed: Optional[int] = None, current_user: UserInDB = Depends(get_current_user)):
+    """`paths` sets the Monte Carlo paths per stress scenario; a `seed` makes the stress test reproducible."""
+    _check_paths(paths)
+    file_paths_to_process = await resolve_file_paths(files, resample, current_user)
+    try:
+        return await run_job_inline(_investment_strategy_task, current_user.id, file_paths_to_process, paths, seed)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    if files:
-        saved_paths = await save_uploaded_files(files, user_id)
-        update_user_uploaded_file_paths(user_id, saved_paths)
-        file_paths_to_process = saved_paths
-    else:
-        if current_user.uploaded_file_paths:
-            file_paths_to_process = current_user.uploaded_file_paths
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No files provided and no previously uploaded files found for this user."
-            )
+@router.post("/investment-strategy/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_investment_strategy_job(files: List[UploadFile] | None = File(None), resample: Optional[str] = None, paths: Optional[int] = None, seed: Optional[int] = None, current_user: UserInDB = Depends(get_current_user)):
+    """Queue an investment strategy run and return its job; poll /jobs/{job_id} for the result."""
+    _check_paths(paths)
+    file_paths_to_process = await resolve_file_paths(files, resample, current_user)
+    return _submit("investment_strategy", current_user.id, _investment_strategy_task, current_user.id, file_paths_to_process, paths, seed)
+
+def _backtest_task(file_paths: List[str], rules: List[str], frequencies: List[str], lookbacks: List[int], cost_bps: float):
+    return run_backtest(load_price_bundle(file_paths), rules, frequencies, lookbacks, cost_bps)
+
+
+def _backtest_args(rules: Optional[str], rebalance: Optional[str], lookbacks: Optional[str]):
     try:
-        processed_data = await process_uploaded_files(file_paths_to_process)
-        result = run_investment_strategy(processed_data)
-        add_metric("investment_strategy_return", result["portfolio_return"], user_id)
-        for w in result['weights']:
-            add_metric(f"investment_strategy_weight_{w}", result['weights'][w], user_id)
-        
-        # Store investment strategy results in the database
-        add_investment_strategy_data(user_id, result)
-
-        return result
+        windows = [int(l) for l in parse_list(lookbacks, DEFAULT_LOOKBACKS)]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="lookbacks must be comma-separated integers")
+    return parse_list(rules, backtest_rules()), parse_list(rebalance, ("weekly",)), windows
+
+
+@router.post("/backtest")
+async def backtest(rules: Optional[str] = None, rebalance: Optional[str] = None, lookbacks: Optional[str] = None, cost_bps: float = 10.0, files: List[UploadFile] | None = File(None), resample: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
+    """
+    Backtest weighting rules with periodic rebalancing. `rules`, `rebalance`
+    (daily, weekly, monthly) and `lookbacks` take comma-separated values and
+    every combination is run; `cost_bps` is charged per unit of turnover.
+    """
+    args = _backtest_args(rules, rebalance, lookbacks)
+    file_paths_to_process = await resolve_file_paths(files, resample, current_user)
+    try:
+        return await run_job_inline(_backtest_task, file_paths_to_process, *args, cost_bps)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/backtest/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_backtest_job(rules: Optional[str] = None, rebalance: Optional[str] = None, lookbacks: Optional[str] = None, cost_bps: float = 10.0, files: List[UploadFile] | None = File(None), resample: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
+    """Queue a backtest and return its job; poll /jobs/{job_id} for the result."""
+    args = _backtest_args(rules, rebalance, lookbacks)
+    file_paths_to_process = await resolve_file_paths(files, resample, current_user)
+    return _submit("backtest", current_user.id, _backtest_task, file_paths_to_process, *args, cost_bps)
+
 @router.post("/risk-check")
-async def risk_check(files: List[UploadFile] | None = File(None), current_user: UserInDB = Depends(get_current_user)):
+async def risk_check(files: List[UploadFile] | None = File(None), resample: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
     user_id = current_user.id
-    file_paths_to_process = []
-
-    if files:
-        saved_paths = await save_uploaded_files(files, user_id)
-        update_user_uploaded_file_paths(user_id, saved_paths)
-        file_paths_to_process = saved_paths
-    else:
-        if current_user.uploaded_file_paths:
-            file_paths_to_process = current_user.uploaded_file_paths
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No files provided and no previously uploaded files found for this user."
-            )
+    file_paths_to_process = await resolve_file_paths(files, resample, current_user)
     try:
         processed_data = await process_uploaded_files(file_paths_to_process)
-        metrics, alert_message = run_risk_check(current_user.email, processed_data)
-        for m in metrics:
-            add_metric(f"risk_check_{m}", metrics[m], user_id)
+        # The alert is only queued here; the background sender emails it
+        metrics, alert_message = await run_job_inline(run_risk_check, current_user.email, processed_data, user_id=user_id)
+        await run_db(add_metrics_bulk, [(f"risk_check_{m}", metrics[m]) for m in metrics], user_id)
         return {
             "metrics": metrics,
             "alert_message": alert_message
@@ -1,39 +1,67 @@
+import json
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, status
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
-from app.services.predictor import run_predictor
+from app.services.predictor import iter_batch_forecasts, parse_horizons, run_predictor
 from app.services.auth import get_current_user
 from app.models.user import UserInDB # Import UserInDB
-from app.services.file_processing import process_uploaded_files, save_uploaded_files
-from app.services.database import add_prediction_data, update_user_uploaded_file_paths
+from app.services.file_processing import load_price_bundle, process_uploaded_files, resolve_file_paths
+from app.services.database import add_prediction_data
+from app.services.jobs import JobLimitExceeded, run_job_inline, submit_job
 
 router = APIRouter()
 
+
+def _predict_task(user_id: int, file_paths: List[str]):
+    # Runs on a job worker thread, so it uses the synchronous loaders and DB calls
+    processed_data = load_price_bundle(file_paths)
+    result = run_predictor(processed_data)
+    
+    # Store prediction results in the database
+    add_prediction_data(user_id, result)
+    return result
+
+
 @router.post("/predict")
-async def predict_returns(files: List[UploadFile] | None = File(None), current_user: UserInDB = Depends(get_current_user)):
-    user_id = current_user.id
-    file_paths_to_process = []
-
-    if files:
-        # New files uploaded, save them and update user's stored paths
-        saved_paths = await save_uploaded_files(files, user_id)
-        update_user_uploaded_file_paths(user_id, saved_paths)
-        file_paths_to_process = saved_paths
-    else:
-        # No new files, use previously uploaded files
-        if current_user.uploaded_file_paths:
-            file_paths_to_process = current_user.uploaded_file_paths
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No files provided and no previously uploaded files found for this user."
-            )
+async def predict_returns(files: List[UploadFile] | None = File(None), resample: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
+    file_paths_to_process = await resolve_file_paths(files, resample, current_user)
     try:
-        processed_data = await process_uploaded_files(file_paths_to_process)
-        result = run_predictor(processed_data)
-        
-        # Store prediction results in the database
-        add_prediction_data(user_id, result)
+        return await run_job_inline(_predict_task, current_user.id, file_paths_to_process)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/predict/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_prediction_job(files: List[UploadFile] | None = File(None), resample: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
+    """Queue a prediction and return its job; poll /jobs/{job_id} for the result."""
+    file_paths_to_process = await resolve_file_paths(files, resample, current_user)
+    try:
+        job = submit_job("prediction", current_user.id, _predict_task, current_user.id, file_paths_to_process)
+    except JobLimitExceeded as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    return job.to_dict()
 
-        return result
+
+@router.post("/batch")
+async def predict_batch(files: List[UploadFile] | None = File(None), horizons: str = "1,7,30", resample: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
+    """
+    Forecast every uploaded symbol over each of `horizons` periods ahead.
+
+    The response is newline-delimited JSON with one object per symbol, sent as
+    soon as that symbol's forecast is ready; failed symbols carry an `error`.
+    """
+    try:
+        horizons = parse_horizons(horizons)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    file_paths_to_process = await resolve_file_paths(files, resample, current_user)
+    try:
+        processed_data = await process_uploaded_files(file_paths_to_process)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        async for result in iter_batch_forecasts(processed_data, horizons):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
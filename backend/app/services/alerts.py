@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+import os
+import smtplib
+import time
+from collections import defaultdict
+from email.mime.text import MIMEText
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.services.database import (
+    alert_outbox_counts, claim_due_alerts, enqueue_alert, mark_alerts_failed, mark_alerts_sent, prune_alerts,
+)
+from app.services.executors import run_in_pool
+
+load_dotenv()
+
+# Risk alerts go through the alert_outbox table: requests only insert a row and
+# a background sender started with the application delivers them over one
+# reused SMTP connection, so a slow mail server never holds up a request.
+EMAIL_USER = os.getenv("EMAIL_USER")
+EMAIL_PASS = os.getenv("EMAIL_PASS")
+SMTP_SERVER = os.getenv("SMTP_SERVER")
+SMTP_PORT = os.getenv("SMTP_PORT")
+# STARTTLS and login are skipped for servers without them (e.g. a local relay
+# or an aiosmtpd stand-in); login only happens when credentials are set.
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() not in ("0", "false", "no")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 10))
+ALERT_FROM = os.getenv("ALERT_FROM", EMAIL_USER)
+ALERT_SUBJECT = "Crypto Risk Alert"
+
+# An identical alert to the same recipient within this many seconds is dropped.
+ALERT_DEDUP_WINDOW = float(os.getenv("ALERT_DEDUP_WINDOW", 3600))
+ALERT_BATCH_SIZE = int(os.getenv("ALERT_BATCH_SIZE", 50))
+ALERT_POLL_INTERVAL = float(os.getenv("ALERT_POLL_INTERVAL", 5))
+# Failed deliveries are retried after ALERT_RETRY_BASE seconds, doubling up to
+# ALERT_RETRY_MAX, and abandoned after ALERT_MAX_ATTEMPTS attempts.
+ALERT_MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", 5))
+ALERT_RETRY_BASE = float(os.getenv("ALERT_RETRY_BASE", 30))
+ALERT_RETRY_MAX = float(os.getenv("ALERT_RETRY_MAX", 3600))
+# A claimed batch not resolved within this many seconds is picked up again.
+ALERT_LEASE = float(os.getenv("ALERT_LEASE", 300))
+ALERT_SMTP_IDLE_TIMEOUT = float(os.getenv("ALERT_SMTP_IDLE_TIMEOUT", 60))
+ALERT_RETENTION = max(float(os.getenv("ALERT_RETENTION", 7 * 86400)), ALERT_DEDUP_WINDOW)
+
+
+def alerts_enabled() -> bool:
+    return bool(SMTP_SERVER and SMTP_PORT and ALERT_FROM)
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait after the `attempts`-th failed delivery."""
+    return min(ALERT_RETRY_BASE * 2 ** (attempts - 1), ALERT_RETRY_MAX)
+
+
+def queue_alert(user_id: Optional[int], recipient: str, message: Optional[str]) -> bool:
+    """
+    Put an alert in the outbox for the background sender; blocking DB call.
+
+    Returns False when there is nothing to send, delivery is not configured,
+    or the same alert already went to `recipient` within ALERT_DEDUP_WINDOW.
+    """
+    if not (message and recipient and alerts_enabled()):
+        return False
+    dedup_key = hashlib.sha256(message.encode()).hexdigest()
+    queued = enqueue_alert(user_id, recipient, ALERT_SUBJECT, message, dedup_key, ALERT_DEDUP_WINDOW, time.time())
+    if queued and _sender is not None:
+        _sender.wake()
+    return queued
+
+
+def compose(recipient: str, alerts: List[dict]) -> MIMEText:
+    """One email for all of a recipient's alerts in a batch."""
+    email = MIMEText("\n\n".join(alert["body"] for alert in alerts))
+    subject = alerts[0]["subject"]
+    email["Subject"] = subject if len(alerts) == 1 else f"{subject} ({len(alerts)} alerts)"
+    email["From"] = ALERT_FROM
+    email["To"] = recipient
+    return email
+
+
+class SmtpConnection:
+    """An SMTP session opened on first use and kept for later sends."""
+
+    def __init__(self):
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    def _open(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(SMTP_SERVER, int(SMTP_PORT), timeout=SMTP_TIMEOUT)
+        try:
+            if SMTP_STARTTLS:
+                smtp.starttls()
+            if EMAIL_USER and EMAIL_PASS:
+                smtp.login(EMAIL_USER, EMAIL_PASS)
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    def send(self, email: MIMEText):
+        if self._smtp is None:
+            self._smtp = self._open()
+        try:
+            self._smtp.send_message(email)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped the idle session; reconnect once
+            self._smtp = self._open()
+            self._smtp.send_message(email)
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > ALERT_SMTP_IDLE_TIMEOUT:
+            self.close()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+            self._smtp = None
+
+
+class AlertSender:
+    """Background task delivering due outbox alerts, woken early by new alerts."""
+
+    def __init__(self):
+        self.connection = SmtpConnection()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._last_prune = 0.0
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        """Thread-safe: deliver now instead of at the next poll."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def stop(self):
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        await run_in_pool("io", self.connection.close)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                delivered = await run_in_pool("io", self.deliver_due)
+            except Exception as e:
+                print(f"Alert delivery failed: {e}")
+                delivered = 0
+            if delivered >= ALERT_BATCH_SIZE:
+                continue  # more may be due
+            try:
+                await asyncio.wait_for(self._wake.wait(), ALERT_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def deliver_due(self) -> int:
+        """Send one batch of due alerts, grouped per recipient; blocking. Returns the batch size."""
+        now = time.time()
+        alerts = claim_due_alerts(ALERT_BATCH_SIZE, ALERT_LEASE, now)
+        by_recipient: Dict[str, List[dict]] = defaultdict(list)
+        for alert in alerts:
+            by_recipient[alert["recipient"]].append(alert)
+        for recipient, group in by_recipient.items():
+            try:
+                self.connection.send(compose(recipient, group))
+            except Exception as e:
+                # The session state is unknown after an error; start a new one next time
+                self.connection.close()
+                failed_at = time.time()
+                for alert in group:
+                    attempts = alert["attempts"] + 1
+                    retry_at = failed_at + retry_delay(attempts) if attempts < ALERT_MAX_ATTEMPTS else None
+                    mark_alerts_failed([alert["id"]], str(e), retry_at)
+                continue
+            mark_alerts_sent([alert["id"] for alert in group], time.time())
+        if not alerts:
+            self.connection.close_if_idle()
+        if now - self._last_prune > 3600:
+            prune_alerts(now - ALERT_RETENTION)
+            self._last_prune = now
+        return len(alerts)
+
+
+_sender: Optional[AlertSender] = None
+
+
+def start_alert_sender() -> Optional[AlertSender]:
+    """Start the background sender on the running loop (from the lifespan) when SMTP is configured."""
+    global _sender
+    if _sender is None and alerts_enabled():
+        _sender = AlertSender()
+        _sender.start()
+    return _sender
+
+
+async def stop_alert_sender():
+    global _sender
+    sender, _sender = _sender, None
+    if sender is not None:
+        await sender.stop()
+
+
+def alert_stats() -> dict:
+    return {"enabled": alerts_enabled(), "running": _sender is not None, "outbox": alert_outbox_counts()}
@@ -0,0 +1,85 @@
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.price_series import PriceSeries
+
+# --- Alignment engine ---
+# Every multi-asset service lines its symbols up on one date index here:
+#   union        - every date any symbol has; rows where no symbol has a value are dropped
+#   intersection - only dates on which every symbol has a value
+# The index is built in one sort of all dates, each column is scattered into a
+# preallocated (dates x symbols) array, and the fill steps run on the whole
+# array at once instead of merging frames symbol by symbol.
+ALIGN_MODES = ("union", "intersection")
+FILL_METHODS = ("ffill", "bfill")
+
+
+def _union_index(dates: List[np.ndarray]) -> np.ndarray:
+    """Sorted distinct dates of all columns."""
+    # Each column is already in date order, and a stable sort (timsort) merges
+    # those runs instead of sorting from scratch as np.unique would.
+    ticks = np.sort(np.concatenate(dates).view(np.int64), kind="stable")
+    distinct = np.empty(len(ticks), dtype=bool)
+    distinct[:1] = True
+    np.not_equal(ticks[1:], ticks[:-1], out=distinct[1:])
+    return ticks[distinct].view("datetime64[ns]")
+
+
+def _ffill(matrix: np.ndarray) -> np.ndarray:
+    """Carry the last value down each column over NaNs (leading NaNs stay)."""
+    rows = np.where(np.isnan(matrix), 0, np.arange(len(matrix))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return np.take_along_axis(matrix, rows, axis=0)
+
+
+def _bfill(matrix: np.ndarray) -> np.ndarray:
+    return _ffill(matrix[::-1])[::-1]
+
+
+def align_arrays(dates: Sequence[np.ndarray], values: Sequence[np.ndarray], how: str = "union",
+                 fill: Sequence[str] = ()) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Align one value array per column on their dates.
+
+    Returns (sorted datetime64[ns] index, float64 matrix of index x columns).
+    A column with repeated dates keeps the last value of each. `fill` is
+    applied in order after the rows are selected, e.g. ("ffill", "bfill").
+    """
+    if how not in ALIGN_MODES:
+        raise ValueError(f"Unsupported alignment: {how}. Expected one of {list(ALIGN_MODES)}")
+    for method in fill:
+        if method not in FILL_METHODS:
+            raise ValueError(f"Unsupported fill method: {method}. Expected one of {list(FILL_METHODS)}")
+    dates = [np.asarray(d, dtype="datetime64[ns]") for d in dates]
+    if not dates:
+        return np.empty(0, dtype="datetime64[ns]"), np.empty((0, 0))
+
+    index = _union_index(dates)
+    matrix = np.full((len(index), len(dates)), np.nan)
+    for j, (column_dates, column_values) in enumerate(zip(dates, values)):
+        matrix[np.searchsorted(index, column_dates), j] = column_values
+
+    missing = np.isnan(matrix)
+    keep = ~missing.any(axis=1) if how == "intersection" else ~missing.all(axis=1)
+    if not keep.all():
+        index, matrix = index[keep], matrix[keep]
+    for method in fill:
+        matrix = _ffill(matrix) if method == "ffill" else _bfill(matrix)
+    return index, matrix
+
+
+def aligned_frame(series: Iterable[PriceSeries], how: str = "union", fill: Sequence[str] = (),
+                  names: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Close prices of `series` (which must all have dates) as one DataFrame
+    indexed by `date`, one column per series named by `names` or the symbols.
+    """
+    series = list(series)
+    if names is None:
+        names = [s.symbol for s in series]
+    if not series:
+        return pd.DataFrame()
+    index, matrix = align_arrays([s.dates for s in series], [s.close for s in series], how, fill)
+    return pd.DataFrame(matrix, index=pd.DatetimeIndex(index, name="date"), columns=names, copy=False)
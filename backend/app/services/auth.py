@@ -1,4 +1,3 @@
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
@@ -6,19 +5,20 @@ from datetime import datetime, timedelta
 from typing import Optional
 
 from app.models.user import UserInDB # Import UserInDB instead of User
-from app.services.database import get_user, add_user
+from app.services.database import get_user, add_user, run_db, update_user_password
+from app.services import hashing, user_cache
 
 # --- Configuration ---
 SECRET_KEY = "your-secret-key"  # Replace with a strong, securely stored secret
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 # --- Authentication Functions ---
+# Hashing lives in hashing.py (one shared bcrypt context and the bounded hash pool)
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return hashing.pwd_context.verify(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -30,15 +30,27 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def authenticate_user(email: str, password: str):
-    user_data = get_user(email)
+async def authenticate_user(email: str, password: str):
+    user_data = await run_db(get_user, email)
     if not user_data:
         return False
-    if not verify_password(password, user_data["hashed_password"]):
+    # bcrypt is deliberately slow; keep it off the event loop and the DB threads.
+    # Raises hashing.HashingBusy when the hash pool is saturated.
+    valid, new_hash = await hashing.verify_and_update(password, user_data["hashed_password"])
+    if not valid:
         return False
+    if new_hash:
+        # Stored with an outdated cost (BCRYPT_ROUNDS changed); upgrade it now
+        # that the plain password is at hand
+        await run_db(update_user_password, user_data["id"], new_hash)
+        user_data["hashed_password"] = new_hash
     return UserInDB(**user_data) # Return UserInDB instance
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB: # Type hint for return
+    # A token seen before resolves from the cache without decoding or a query
+    user = user_cache.get(token)
+    if user is not None:
+        return user
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -51,8 +63,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB: # T
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user_data = get_user(email=email)
+    generation = user_cache.generation()
+    user_data = await run_db(get_user, email=email)
     if user_data is None:
         raise credentials_exception
-    return UserInDB(**user_data) # Return UserInDB instance
-
+    user = UserInDB(**user_data) # Return UserInDB instance
+    user_cache.put(token, user, payload["exp"], generation)
+    return user
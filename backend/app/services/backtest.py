@@ -0,0 +1,266 @@
+import itertools
+import os
+import shutil
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.services.executors import get_process_pool, reset_process_pool
+from app.services.portfolio_math import (WEIGHTING_RULES, WindowStats, fetch_prices_from_request, percent_change,
+                                         rule_weights, window_rule_weights)
+
+# Rebalance at the first bar of each calendar period of this unit. Weeks start
+# on Monday (see rebalance_bars).
+REBALANCE_UNITS = {"daily": "D", "weekly": "W", "monthly": "M"}
+# Besides the rules registered with portfolio_math.weighting_rule, the
+# investment strategy's uncapped Sharpe weights can be backtested.
+SHARPE_RULE = "Sharpe"
+DEFAULT_LOOKBACKS = (30,)
+# Upper bound on rules x rebalance frequencies x lookbacks in one request.
+MAX_BACKTEST_COMBINATIONS = int(os.getenv("MAX_BACKTEST_COMBINATIONS", 64))
+
+
+def backtest_rules() -> List[str]:
+    """Every rule that can be backtested, including rules registered after import."""
+    return [*WEIGHTING_RULES, SHARPE_RULE]
+
+
+def _sharpe_from_moments(mean: np.ndarray, vol: np.ndarray) -> np.ndarray:
+    sharpe = np.divide(mean, vol, out=np.zeros_like(mean), where=vol > 0).clip(min=0)
+    if sharpe.sum() > 0:
+        return sharpe / sharpe.sum()
+    return np.full(len(mean), 1 / len(mean))
+
+
+def _sharpe_weights(prices: np.ndarray) -> np.ndarray:
+    """NumPy form of investment_rule.sharpe_weights: log returns, ddof=1, no cap."""
+    returns = np.diff(np.log(prices), axis=0)
+    return _sharpe_from_moments(returns.mean(axis=0), returns.std(axis=0, ddof=1))
+
+
+class _PrefixMoments:
+    """
+    Column prefix sums of a (bars x assets) matrix and of its squares, so the
+    mean and population variance of any run of rows cost O(assets). Values are
+    centred on the column means first, which keeps the variance difference
+    well clear of float64 cancellation.
+    """
+
+    def __init__(self, values: np.ndarray):
+        self.shift = values.mean(axis=0)
+        centred = values - self.shift
+        zero = np.zeros((1, values.shape[1]))
+        self.sums = np.concatenate((zero, np.cumsum(centred, axis=0)))
+        self.squares = np.concatenate((zero, np.cumsum(centred * centred, axis=0)))
+
+    def window(self, a: int, b: int):
+        """(mean, population variance) of rows a .. b - 1."""
+        n = b - a
+        mean = (self.sums[b] - self.sums[a]) / n
+        mean_square = (self.squares[b] - self.squares[a]) / n
+        var = mean_square - mean * mean
+        # Residue of the subtraction for a column that did not move
+        var[var <= 1e-10 * mean_square] = 0.0
+        return mean + self.shift, var
+
+
+class RollingWindows:
+    """
+    Running statistics of every lookback window of one price matrix: percent
+    return moments for rules registered with `portfolio_math.window_rule`, log
+    return moments for the Sharpe rule. Built once per simulation in O(bars x
+    assets), so a rebalance no longer rescans its window.
+    """
+
+    def __init__(self, prices: np.ndarray, log_returns: bool = False):
+        self.prices = prices
+        self.returns = _PrefixMoments(percent_change(prices))
+        self.log_returns = _PrefixMoments(np.diff(np.log(prices), axis=0)) if log_returns else None
+
+    def stats(self, t: int, lookback: int) -> WindowStats:
+        mean, var = self.returns.window(t - lookback, t)
+        return WindowStats(np.asarray(self.prices[t - lookback]), np.asarray(self.prices[t]), lookback, mean, var)
+
+    def sharpe_weights(self, t: int, lookback: int) -> np.ndarray:
+        mean, var = self.log_returns.window(t - lookback, t)
+        return _sharpe_from_moments(mean, np.sqrt(var * lookback / (lookback - 1)))
+
+
+def _target_weights(rule: str, prices: np.ndarray, t: int, lookback: int,
+                    windows: Optional[RollingWindows] = None) -> np.ndarray:
+    """
+    Weights chosen on bar `t` from the `lookback` returns that end at it: the
+    rule sees prices t - lookback .. t as if they were the whole upload. With
+    `windows`, rules that have a stats form are given the running window
+    statistics; the rest get the window's prices and returns.
+    """
+    if windows is not None:
+        if rule == SHARPE_RULE:
+            return windows.sharpe_weights(t, lookback)
+        weights = window_rule_weights(rule, windows.stats(t, lookback))
+        if weights is not None:
+            return weights
+    window = np.asarray(prices[t - lookback:t + 1])
+    if rule == SHARPE_RULE:
+        return _sharpe_weights(window)
+    return rule_weights(rule, window, percent_change(window))
+
+
+def simulate(prices: np.ndarray, rule: str, lookback: int, rebalance_at: np.ndarray,
+             start: int, cost_bps: float, incremental: bool = True):
+    """
+    Run one rule from bar `start` to the last bar, rebalancing on the bars in
+    `rebalance_at`. Between rebalances the holdings drift with prices, so each
+    holding period is one cumulative product and one matrix-vector product.
+    `incremental=False` recomputes every window from its prices instead of
+    using RollingWindows.
+
+    Returns (equity curve from `start`, one-way turnover of each rebalance).
+    """
+    n_days = prices.shape[0]
+    equity = np.empty(n_days - start)
+    equity[0] = 1.0
+    turnovers = []
+    held = None  # drifted weights at the current bar
+    windows = RollingWindows(prices, log_returns=rule == SHARPE_RULE) if incremental else None
+
+    bounds = list(rebalance_at) + [n_days - 1]
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        target = _target_weights(rule, prices, a, lookback, windows)
+        if held is not None:
+            turnover = 0.5 * float(np.abs(target - held).sum())
+            turnovers.append(turnover)
+            equity[a - start] *= 1 - turnover * cost_bps / 1e4
+        # Growth of each asset from bar a to every bar in (a, b]
+        growth = prices[a + 1:b + 1] / prices[a]
+        values = growth @ target
+        equity[a + 1 - start:b + 1 - start] = equity[a - start] * values
+        held = target * growth[-1] / values[-1]
+    return equity, np.asarray(turnovers)
+
+
+def summarize(equity: np.ndarray, turnovers: np.ndarray, periods_per_year: float) -> dict:
+    returns = equity[1:] / equity[:-1] - 1
+    vol = float(returns.std(ddof=1)) if len(returns) > 1 else 0.0
+    years = len(returns) / periods_per_year
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+    return {
+        "total_return": float(equity[-1] - 1),
+        "cagr": float(equity[-1] ** (1 / years) - 1) if years > 0 and equity[-1] > 0 else 0.0,
+        "volatility": vol * np.sqrt(periods_per_year),
+        "sharpe": float(returns.mean() / vol * np.sqrt(periods_per_year)) if vol > 0 else 0.0,
+        "max_drawdown": float(drawdown.min()),
+        "rebalances": int(len(turnovers)),
+        "total_turnover": float(turnovers.sum()),
+        "avg_turnover": float(turnovers.mean()) if len(turnovers) else 0.0,
+    }
+
+
+def _run_combination(prices_path: str, rule: str, lookback: int, rebalance_at: np.ndarray, start: int,
+                     cost_bps: float, periods_per_year: float):
+    """Pool entry point: map the shared price matrix and run one rule/parameter combination."""
+    prices = np.load(prices_path, mmap_mode="r")
+    equity, turnovers = simulate(prices, rule, lookback, rebalance_at, start, cost_bps)
+    return equity, summarize(equity, turnovers, periods_per_year)
+
+
+def rebalance_bars(dates: np.ndarray, frequency: str, start: int) -> np.ndarray:
+    """Bars from `start` on that open a new calendar period, always including `start`."""
+    if frequency not in REBALANCE_UNITS:
+        raise ValueError(f"Unsupported rebalance frequency: {frequency}. Expected one of {list(REBALANCE_UNITS)}")
+    periods = dates[start:]
+    if frequency == "weekly":
+        # NumPy counts weeks from 1970-01-01, a Thursday; shifting by three days
+        # makes every week run Monday to Sunday.
+        periods = periods + np.timedelta64(3, "D")
+    periods = periods.astype(f"datetime64[{REBALANCE_UNITS[frequency]}]")
+    new_period = np.concatenate(([True], periods[1:] != periods[:-1]))
+    bars = start + np.flatnonzero(new_period)
+    # The last bar has nothing left to hold
+    return bars[bars < len(dates) - 1]
+
+
+def run_backtest(uploaded_data, rules: Optional[Sequence[str]] = None, frequencies: Sequence[str] = ("weekly",),
+                 lookbacks: Sequence[int] = DEFAULT_LOOKBACKS, cost_bps: float = 10.0,
+                 parallel: bool = True) -> dict:
+    """
+    Backtest every rule x rebalance frequency x lookback on the uploaded prices.
+
+    All combinations start on the same bar, after the longest lookback, so their
+    equity curves share one date axis. Turnover is one-way (half the sum of
+    absolute weight changes against the drifted holdings) and costs `cost_bps`
+    basis points of equity per unit of turnover. With `parallel`, combinations
+    fan out over the analytics process pool.
+    """
+    rules = list(dict.fromkeys(backtest_rules() if rules is None else rules))
+    frequencies = list(dict.fromkeys(frequencies))
+    lookbacks = sorted({int(l) for l in lookbacks})
+    available = backtest_rules()
+    for rule in rules:
+        if rule not in available:
+            raise ValueError(f"Unknown rule: {rule}. Expected one of {available}")
+    if not lookbacks or lookbacks[0] < 2:
+        raise ValueError("Lookback windows must be at least 2 bars")
+    if cost_bps < 0:
+        raise ValueError("cost_bps must not be negative")
+    combinations = list(itertools.product(rules, frequencies, lookbacks))
+    if not combinations or len(combinations) > MAX_BACKTEST_COMBINATIONS:
+        raise ValueError(f"Request between 1 and {MAX_BACKTEST_COMBINATIONS} rule/frequency/lookback combinations")
+
+    prices_df = fetch_prices_from_request(uploaded_data)
+    if prices_df.empty:
+        raise ValueError("No price data available")
+    prices = np.ascontiguousarray(prices_df.to_numpy(dtype=np.float64))
+    dates = prices_df.index.to_numpy(dtype="datetime64[ns]")
+    # Bar t decides with returns [t - lookback, t), i.e. prices up to bar t
+    start = lookbacks[-1]
+    if len(prices) < start + 2:
+        raise ValueError(f"Need at least {start + 2} aligned price rows for a {start}-bar lookback")
+    rebalance_at = {f: rebalance_bars(dates, f, start) for f in frequencies}
+
+    spacing_days = float(np.median(np.diff(dates).astype("timedelta64[s]").astype(np.float64))) / 86400
+    periods_per_year = 365.0 / spacing_days if spacing_days > 0 else 365.0
+
+    # Pool workers memory-map one copy of the price matrix instead of each
+    # receiving it pickled
+    directory = tempfile.mkdtemp(prefix="backtest-")
+    try:
+        prices_path = os.path.join(directory, "prices.npy")
+        np.save(prices_path, prices)
+        args = [(prices_path, rule, lookback, rebalance_at[freq], start, cost_bps, periods_per_year)
+                for rule, freq, lookback in combinations]
+        outcomes = _run_all(args, parallel)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    results = []
+    for (rule, freq, lookback), (equity, stats) in zip(combinations, outcomes):
+        results.append({
+            "rule": rule,
+            "rebalance": freq,
+            "lookback": lookback,
+            "stats": {k: round(v, 6) if isinstance(v, float) else v for k, v in stats.items()},
+            "equity_curve": np.round(equity, 6).tolist(),
+        })
+    date_strings = np.datetime_as_string(dates[start:], unit="D").tolist()
+    return {"dates": date_strings, "symbols": list(prices_df.columns), "cost_bps": cost_bps, "results": results}
+
+
+def _run_all(args: List[tuple], parallel: bool) -> list:
+    pool = get_process_pool() if parallel and len(args) > 1 else None
+    if pool is not None:
+        try:
+            # Results come back in submission order, so the output is deterministic
+            return list(pool.map(_run_combination, *zip(*args)))
+        except BrokenProcessPool:
+            reset_process_pool(pool)
+    return [_run_combination(*a) for a in args]
+
+
+def parse_list(value: Optional[str], default: Sequence) -> list:
+    """Split a comma-separated query value, falling back to `default` when empty."""
+    if not value:
+        return list(default)
+    return [item.strip() for item in value.split(",") if item.strip()]
@@ -0,0 +1,351 @@
+import hashlib
+import io
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.services.parse_cache import (
+    REQUIRED_COLUMNS, ParsedFile, column_file_name, commit_sidecar, sidecar_dir, typed_columns,
+)
+
+# Complete lines are handed to read_csv in batches of roughly this many bytes,
+# which bounds the memory used while an upload is being received.
+STREAM_BATCH_BYTES = int(os.getenv("STREAM_BATCH_BYTES", 4 * 1024 * 1024))
+
+# Bar sizes accepted for on-the-fly aggregation, mapped to NumPy datetime units.
+RESAMPLE_UNITS = {"minute": "m", "hour": "h", "day": "D"}
+
+_COLUMN_DTYPES = {'date': np.dtype('datetime64[ns]'), 'open': np.dtype(np.float64), 'high': np.dtype(np.float64),
+                  'low': np.dtype(np.float64), 'close': np.dtype(np.float64), 'unix': np.dtype(np.float64)}
+
+
+class _NpyColumnWriter:
+    """
+    Append-only writer for a 1-D .npy file whose length is only known at the end.
+
+    Up to `spool_bytes` of values are held in memory and the file is only
+    created once they are exceeded or on `close`, so an aborted small write
+    never touches the disk.
+    """
+
+    HEADER_BYTES = 128
+
+    def __init__(self, path: str, dtype: np.dtype, spool_bytes: int = 0):
+        self.path = path
+        self.dtype = dtype
+        self.count = 0
+        self.spool_bytes = spool_bytes
+        self._file = None
+        self._spooled: List[bytes] = []
+        self._spooled_bytes = 0
+        if spool_bytes <= 0:
+            self._open()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'wb')
+        self._file.write(b' ' * self.HEADER_BYTES)
+        for data in self._spooled:
+            self._file.write(data)
+        self._spooled = []
+
+    def append(self, values: np.ndarray):
+        data = np.ascontiguousarray(values, dtype=self.dtype).tobytes()
+        self.count += len(values)
+        if self._file is not None:
+            self._file.write(data)
+            return
+        self._spooled.append(data)
+        self._spooled_bytes += len(data)
+        if self._spooled_bytes > self.spool_bytes:
+            self._open()
+
+    def close(self):
+        if self._file is None:
+            self._open()
+        header = repr({'descr': np.lib.format.dtype_to_descr(self.dtype),
+                       'fortran_order': False, 'shape': (self.count,)})
+        # Version 1.0 header: magic, version, uint16 length, then the dict padded
+        # with spaces and terminated by a newline.
+        prefix = b'\x93NUMPY\x01\x00'
+        body_len = self.HEADER_BYTES - len(prefix) - 2
+        body = header.encode('latin1').ljust(body_len - 1) + b'\n'
+        self._file.seek(0)
+        self._file.write(prefix + body_len.to_bytes(2, 'little') + body)
+        self._file.close()
+
+    def abort(self):
+        self._spooled = []
+        if self._file is None:
+            return
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class StreamingCsvIngest:
+    """
+    Parse an uploaded CSV incrementally while it is being received.
+
+    Feed raw upload chunks to `feed` and persist the bytes it returns to `path`;
+    call `finish` after the last chunk and `commit` once the file is closed. The
+    header is validated as soon as it arrives, complete lines are parsed in
+    batches of `batch_bytes`, and the typed columns are appended straight into
+    the parse-cache sidecar, so later requests never re-read the CSV.
+
+    With `resample` set to "minute", "hour" or "day" the rows are aggregated
+    into OHLC bars on the fly and only the bars are stored, so memory and disk
+    use depend on the number of bars rather than the size of the upload.
+
+    With `spool_bytes` the parsed columns are kept in memory up to that size
+    in total, so an ingest that is aborted (e.g. because the content turns out
+    to be stored already) writes nothing.
+    """
+
+    def __init__(self, path: str, filename: str, resample: Optional[str] = None,
+                 batch_bytes: int = STREAM_BATCH_BYTES, spool_bytes: int = 0):
+        if resample is not None and resample not in RESAMPLE_UNITS:
+            raise ValueError(f"Unsupported resample interval: {resample}. Expected one of {sorted(RESAMPLE_UNITS)}")
+        self.path = path
+        self.filename = filename
+        self.resample = resample
+        self.batch_bytes = batch_bytes
+        self.symbol: Optional[str] = None
+        self.row_count = 0
+        self.first_date: Optional[np.datetime64] = None
+        self.last_date: Optional[np.datetime64] = None
+
+        self._buffer = bytearray()
+        self._header: Optional[bytes] = None
+        self._columns: List[str] = []
+        self._volume_columns: List[str] = []
+        self._digest = hashlib.sha256()
+        self._pending: "OrderedDict[np.datetime64, dict]" = OrderedDict()
+        self._direction = None  # +1 ascending, -1 descending, 0 unordered
+        self._last_bucket = None
+
+        directory = sidecar_dir(path)
+        column_spool_bytes = spool_bytes // len(_COLUMN_DTYPES)
+        self._writers: Dict[str, _NpyColumnWriter] = {
+            name: _NpyColumnWriter(os.path.join(directory, f"{name}.{os.getpid()}.{id(self)}.tmp"), dtype,
+                                   column_spool_bytes)
+            for name, dtype in _COLUMN_DTYPES.items()
+        }
+
+    # --- Public API ---
+    def feed(self, chunk: bytes) -> bytes:
+        """Consume one upload chunk and return the bytes to append to the stored file."""
+        self._buffer += chunk
+        out = b''
+        if self._header is None:
+            newline = self._buffer.find(b'\n')
+            if newline >= 0:
+                self._read_header(bytes(self._buffer[:newline + 1]))
+                del self._buffer[:newline + 1]
+                if self.resample is not None:
+                    out = self._bar_header()
+        if self._header is not None and len(self._buffer) >= self.batch_bytes:
+            cut = self._buffer.rfind(b'\n') + 1
+            if cut:
+                lines = bytes(self._buffer[:cut])
+                del self._buffer[:cut]
+                out += self._parse_batch(lines)
+        # Raw mode stores the upload verbatim; parsing only feeds the sidecar.
+        return self._emit(chunk if self.resample is None else out)
+
+    def finish(self) -> bytes:
+        """Parse any buffered tail and return the last bytes to store."""
+        if self._header is None:
+            if not self._buffer.strip():
+                raise ValueError(f"File {self.filename} is empty")
+            self._read_header(bytes(self._buffer) + b'\n')
+            self._buffer.clear()
+            out = b'' if self.resample is None else self._bar_header()
+        else:
+            out = b''
+        if self._buffer.strip():
+            out += self._parse_batch(bytes(self._buffer))
+        self._buffer.clear()
+        if self.resample is not None:
+            out += self._flush_bars(final=True)
+        if self.row_count == 0:
+            raise ValueError(f"File {self.filename} contains no data rows")
+        return self._emit(b'' if self.resample is None else out)
+
+    @property
+    def sha256(self) -> str:
+        """Hash of the bytes returned so far; the stored file's hash after `finish`."""
+        return self._digest.hexdigest()
+
+    def commit(self, path: Optional[str] = None) -> ParsedFile:
+        """
+        Publish the sidecar columns for the file now fully written at `path`,
+        by default the path given to the constructor (pass the new one if the
+        file was moved after writing).
+        """
+        path = path or self.path
+        sha256 = self.sha256
+        directory = sidecar_dir(path)
+        os.makedirs(directory, exist_ok=True)
+        file_names = {}
+        for name, writer in self._writers.items():
+            writer.close()
+            file_name = column_file_name(name, sha256)
+            os.replace(writer.path, os.path.join(directory, file_name))
+            file_names[name] = file_name
+        if path != self.path:
+            self._remove_work_dir()
+        parsed = commit_sidecar(path, self.symbol, sha256, file_names)
+        if parsed is None:
+            raise ValueError(f"Failed to index uploaded file {self.filename}")
+        return parsed
+
+    def abort(self):
+        for writer in self._writers.values():
+            writer.abort()
+        self._remove_work_dir()
+
+    def _remove_work_dir(self):
+        try:
+            os.rmdir(sidecar_dir(self.path))
+        except OSError:
+            pass  # never created, or holds a committed sidecar
+
+    # --- Parsing ---
+    def _emit(self, data: bytes) -> bytes:
+        self._digest.update(data)
+        return data
+
+    def _read_header(self, line: bytes):
+        self._header = line
+        self._columns = [col.strip().strip('"').strip().lower() for col in line.decode('utf-8-sig').strip().split(',')]
+        if not REQUIRED_COLUMNS.issubset(self._columns):
+            raise ValueError(f"File {self.filename} is missing one or more required columns: {REQUIRED_COLUMNS}")
+        self._volume_columns = [col for col in self._columns if col.startswith('volume')]
+
+    def _parse_batch(self, lines: bytes) -> bytes:
+        df = pd.read_csv(io.BytesIO(self._header + lines))
+        df.columns = self._columns
+        if df.empty:
+            return b''
+        if self.symbol is None:
+            self.symbol = str(df['symbol'].iloc[0])
+        columns = typed_columns(df)
+
+        if self.resample is None:
+            self._append(columns)
+            self.row_count += len(df)
+            return b''
+
+        for col in self._volume_columns:
+            columns[col] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)
+        self._aggregate(columns)
+        return self._flush_bars(final=False)
+
+    def _append(self, columns: Dict[str, np.ndarray]):
+        for name, writer in self._writers.items():
+            writer.append(columns[name])
+        dates = columns['date'][~np.isnat(columns['date'])]
+        if dates.size:
+            first, last = dates.min(), dates.max()
+            self.first_date = first if self.first_date is None else min(self.first_date, first)
+            self.last_date = last if self.last_date is None else max(self.last_date, last)
+
+    # --- Resampling ---
+    def _aggregate(self, columns: Dict[str, np.ndarray]):
+        valid = ~np.isnat(columns['date'])
+        if not valid.any():
+            return
+        dates = columns['date'][valid]
+        buckets = dates.astype(f"datetime64[{RESAMPLE_UNITS[self.resample]}]").astype('datetime64[ns]')
+
+        frame = pd.DataFrame({'bucket': buckets, 'ts': dates})
+        for name in ('open', 'high', 'low', 'close', 'unix', *self._volume_columns):
+            frame[name] = columns[name][valid]
+        grouped = frame.groupby('bucket', sort=False)
+        first = frame.loc[grouped['ts'].idxmin()].set_index('bucket')
+        last = frame.loc[grouped['ts'].idxmax()].set_index('bucket')
+        highs = grouped['high'].max()
+        lows = grouped['low'].min()
+        volumes = grouped[self._volume_columns].sum() if self._volume_columns else None
+
+        for bucket in first.index:
+            bar = {
+                'first_ts': first.at[bucket, 'ts'], 'last_ts': last.at[bucket, 'ts'],
+                'open': first.at[bucket, 'open'], 'close': last.at[bucket, 'close'],
+                'unix': first.at[bucket, 'unix'], 'high': highs[bucket], 'low': lows[bucket],
+                'volumes': volumes.loc[bucket].to_numpy() if volumes is not None else None,
+            }
+            current = self._pending.get(bucket)
+            if current is None:
+                self._pending[bucket] = bar
+                continue
+            if bar['first_ts'] < current['first_ts']:
+                current.update(first_ts=bar['first_ts'], open=bar['open'], unix=bar['unix'])
+            if bar['last_ts'] > current['last_ts']:
+                current.update(last_ts=bar['last_ts'], close=bar['close'])
+            current['high'] = np.fmax(current['high'], bar['high'])
+            current['low'] = np.fmin(current['low'], bar['low'])
+            if current['volumes'] is not None:
+                current['volumes'] = current['volumes'] + bar['volumes']
+
+        self._track_order(buckets)
+
+    def _track_order(self, buckets: np.ndarray):
+        if self._direction == 0:
+            return
+        seq = buckets if self._last_bucket is None else np.concatenate(([self._last_bucket], buckets))
+        steps = np.sign(np.diff(seq.astype(np.int64)))
+        steps = steps[steps != 0]
+        if steps.size:
+            direction = int(steps[0]) if (steps == steps[0]).all() else 0
+            if self._direction is None:
+                self._direction = direction
+            elif direction != self._direction:
+                self._direction = 0
+        self._last_bucket = buckets[-1]
+
+    def _flush_bars(self, final: bool) -> bytes:
+        if final:
+            keys = sorted(self._pending, reverse=self._direction == -1)
+        elif self._direction:
+            # Rows arrive in time order, so every bar except the latest is complete.
+            keys = [key for key in self._pending if key != self._last_bucket]
+        else:
+            # Unordered input: keep accumulating bars until the upload ends.
+            return b''
+        if not keys:
+            return b''
+        bars = [self._pending.pop(key) for key in keys]
+
+        dates = np.array(keys, dtype='datetime64[ns]')
+        columns = {
+            'date': dates,
+            'open': np.array([b['open'] for b in bars], dtype=np.float64),
+            'high': np.array([b['high'] for b in bars], dtype=np.float64),
+            'low': np.array([b['low'] for b in bars], dtype=np.float64),
+            'close': np.array([b['close'] for b in bars], dtype=np.float64),
+            'unix': np.array([b['unix'] for b in bars], dtype=np.float64),
+        }
+        self._append(columns)
+        self.row_count += len(bars)
+
+        out = pd.DataFrame({
+            'unix': pd.array(np.round(columns['unix']), dtype='Int64'),
+            'date': np.char.replace(np.datetime_as_string(dates, unit='D' if self.resample == 'day' else 's'), 'T', ' '),
+            'symbol': self.symbol,
+            'open': columns['open'], 'high': columns['high'], 'low': columns['low'], 'close': columns['close'],
+        })
+        if self._volume_columns:
+            volumes = np.array([b['volumes'] for b in bars], dtype=np.float64)
+            for i, col in enumerate(self._volume_columns):
+                out[col] = volumes[:, i]
+        return out.to_csv(header=False, index=False).encode('utf-8')
+
+    def _bar_header(self) -> bytes:
+        return (','.join(['unix', 'date', 'symbol', 'open', 'high', 'low', 'close', *self._volume_columns]) + '\n').encode('utf-8')
@@ -1,199 +1,194 @@
+import hashlib
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
 from app.models.user import User
-from passlib.context import CryptContext
+from app.services.executors import run_in_pool
+from app.services.migrations import apply_migrations
+from app.services import user_cache
+from app.services.hashing import hash_password_sync
+from app.services.upload_store import blob_path
 import json
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 # Get the base directory (backend folder)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DATABASE_URL = os.path.join(BASE_DIR, "db", "user.db")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# --- Initialization Functions ---
-def init_user_db():
-    # Ensure the db directory exists
-    os.makedirs(os.path.dirname(DATABASE_URL), exist_ok=True)
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            uploaded_file_paths TEXT DEFAULT '[]'
-        )
-    """)
-    conn.commit()
-    conn.close()
+# --- Connection Management ---
+# Each thread keeps one long-lived connection (so prepared statements are reused
+# across calls) and async handlers reach the database through the bounded "db"
+# thread pool (DB_POOL_SIZE, see executors.py) instead of blocking the event loop.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",       # readers no longer block the single writer
+    "PRAGMA synchronous=NORMAL",     # fsync on checkpoint only; safe with WAL
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16384",      # 16 MiB page cache per connection
+    "PRAGMA mmap_size=268435456",    # 256 MiB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+)
 
-def init_metrics_db():
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS metrics (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            value REAL NOT NULL,
-            user_id INTEGER NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    """)
-    conn.commit()
-    conn.close()
+_local = threading.local()
 
-def init_portfolio_db():
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS portfolio_data (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            symbol TEXT NOT NULL,
-            date TEXT NOT NULL,
-            close REAL NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    """)
-    conn.commit()
-    conn.close()
+def get_connection() -> sqlite3.Connection:
+    """Return this thread's pooled connection, opening and tuning it on first use."""
+    conn = getattr(_local, "conn", None)
+    # A connection must never cross a fork, so worker processes open their own.
+    if conn is None or _local.pid != os.getpid() or _local.path != DATABASE_URL:
+        os.makedirs(os.path.dirname(DATABASE_URL), exist_ok=True)
+        conn = sqlite3.connect(DATABASE_URL, timeout=5.0, cached_statements=256)
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        _local.conn, _local.pid, _local.path = conn, os.getpid(), DATABASE_URL
+    return conn
 
-def init_prediction_db():
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS prediction_results (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            result TEXT NOT NULL, -- Storing complex results as JSON string
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    """)
-    conn.commit()
-    conn.close()
+@contextmanager
+def connection():
+    """Borrow the thread's connection; an exception rolls back any open transaction."""
+    conn = get_connection()
+    try:
+        yield conn
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
 
-def init_investment_strategy_db():
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS investment_strategy_results (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            result TEXT NOT NULL, -- Storing complex results as JSON string
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    """)
-    conn.commit()
-    conn.close()
+async def run_db(func, *args, **kwargs):
+    """Run a blocking database function on the DB thread pool."""
+    return await run_in_pool("db", func, *args, **kwargs)
+
+# --- Initialization ---
+def init_db():
+    """
+    Create or upgrade the schema via the versioned migrations in `migrations.py`.
+
+    Called once per process from the application lifespan (see main.py);
+    scripts that use this module directly must call it themselves.
+    """
+    with connection() as conn:
+        return apply_migrations(conn)
 
 # --- Utility for limiting rows ---
 def _limit_rows(conn, table_name: str, user_id: int, limit: int):
     c = conn.cursor()
     # Delete oldest entries beyond the limit for the specific user
-    # Try with timestamp first, fall back to id if timestamp column doesn't exist
-    try:
-        c.execute(f"""
-            DELETE FROM {table_name}
-            WHERE id IN (
-                SELECT id FROM {table_name}
-                WHERE user_id = ?
-                ORDER BY timestamp DESC
-                LIMIT -1 OFFSET ?
-            )
-        """, (user_id, limit))
-    except sqlite3.OperationalError:
-        # timestamp column doesn't exist, order by id instead
-        c.execute(f"""
-            DELETE FROM {table_name}
-            WHERE id IN (
-                SELECT id FROM {table_name}
-                WHERE user_id = ?
-                ORDER BY id DESC
-                LIMIT -1 OFFSET ?
-            )
-        """, (user_id, limit))
-    conn.commit()
+    # (served by the table's (user_id, timestamp DESC) index)
+    c.execute(f"""
+        DELETE FROM {table_name}
+        WHERE id IN (
+            SELECT id FROM {table_name}
+            WHERE user_id = ?
+            ORDER BY timestamp DESC
+            LIMIT -1 OFFSET ?
+        )
+    """, (user_id, limit))
 
 # --- CRUD for Users ---
 def get_user(email: str):
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    c.execute("SELECT id, name, email, password, uploaded_file_paths FROM users WHERE email=?", (email,))
-    user_data = c.fetchone()
-    conn.close()
-    if user_data:
-        return {
-            "id": user_data[0],
-            "name": user_data[1],
-            "email": user_data[2],
-            "hashed_password": user_data[3],
-            "uploaded_file_paths": json.loads(user_data[4]) if user_data[4] else []
-        }
-    return None
-
-def add_user(user: User):
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    try:
-        hashed_password = pwd_context.hash(user.password)
-        c.execute("INSERT INTO users (name, email, password, uploaded_file_paths) VALUES (?, ?, ?, ?)",
-                  (user.name, user.email, hashed_password, json.dumps([])))
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, name, email, password, uploaded_file_paths FROM users WHERE email=?", (email,))
+        user_data = c.fetchone()
+        if user_data is None:
+            return None
+        c.execute("SELECT sha256 FROM uploads WHERE user_id = ? ORDER BY id", (user_data[0],))
+        upload_paths = [blob_path(row[0]) for row in c.fetchall()]
+    return {
+        "id": user_data[0],
+        "name": user_data[1],
+        "email": user_data[2],
+        "hashed_password": user_data[3],
+        # Users who have not uploaded since the uploads table was added keep their legacy list
+        "uploaded_file_paths": upload_paths or (json.loads(user_data[4]) if user_data[4] else [])
+    }
+
+def add_user(user: User, hashed_password: Optional[str] = None):
+    """Insert the user; pass `hashed_password` to keep bcrypt off the DB threads."""
+    if hashed_password is None:
+        hashed_password = hash_password_sync(user.password)
+    with connection() as conn:
+        c = conn.cursor()
+        try:
+            c.execute("INSERT INTO users (name, email, password, uploaded_file_paths) VALUES (?, ?, ?, ?)",
+                      (user.name, user.email, hashed_password, json.dumps([])))
+            conn.commit()
+            user_cache.invalidate(email=user.email)
+            return True
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return False
+
+def update_user_password(user_id: int, hashed_password: str):
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("UPDATE users SET password = ? WHERE id = ?", (hashed_password, user_id))
         conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
-
-def update_user_uploaded_file_paths(user_id: int, file_paths: List[str]):
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    c.execute("UPDATE users SET uploaded_file_paths = ? WHERE id = ?", (json.dumps(file_paths), user_id))
-    conn.commit()
-    conn.close()
+    user_cache.invalidate(user_id=user_id)
+
+# --- CRUD for Uploads ---
+UPLOAD_COLUMNS = ("filename", "sha256", "symbol", "row_count", "first_date", "last_date", "size_bytes")
+
+def replace_user_uploads(user_id: int, uploads: List[Dict[str, Any]]):
+    """Make `uploads` (records from `save_uploaded_files`) the user's current files."""
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM uploads WHERE user_id = ?", (user_id,))
+        c.executemany(
+            f"INSERT INTO uploads (user_id, {', '.join(UPLOAD_COLUMNS)}) VALUES (?{', ?' * len(UPLOAD_COLUMNS)})",
+            [(user_id, *(upload[column] for column in UPLOAD_COLUMNS)) for upload in uploads],
+        )
+        c.execute("UPDATE users SET uploaded_file_paths = '[]' WHERE id = ?", (user_id,))
+        conn.commit()
+    user_cache.invalidate(user_id=user_id)
+
+def get_user_uploads(user_id: int) -> List[Dict[str, Any]]:
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT {', '.join(UPLOAD_COLUMNS)}, created_at FROM uploads WHERE user_id = ? ORDER BY id", (user_id,))
+        return [dict(zip((*UPLOAD_COLUMNS, "created_at"), row)) for row in c.fetchall()]
 
 # --- CRUD for Metrics ---
 def add_metric(name: str, value: float, user_id: int, max_rows: int = 120):
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    c.execute("INSERT INTO metrics (name, value, user_id) VALUES (?, ?, ?)", (name, value, user_id))
-    conn.commit()
-    _limit_rows(conn, "metrics", user_id, max_rows)
-    conn.close()
+    add_metrics_bulk([(name, value)], user_id, max_rows)
+
+def add_metrics_bulk(metrics: List[Tuple[str, float]], user_id: int, max_rows: int = 120, refresh_dashboard: bool = True):
+    """Insert a batch of (name, value) metrics in one transaction and prune the user's rows once."""
+    if not metrics:
+        return
+    with connection() as conn:
+        c = conn.cursor()
+        c.executemany("INSERT INTO metrics (name, value, user_id) VALUES (?, ?, ?)",
+                      [(name, value, user_id) for name, value in metrics])
+        # The inserts, the prune and the dashboard refresh land in a single transaction
+        _limit_rows(conn, "metrics", user_id, max_rows)
+        if refresh_dashboard:
+            _refresh_dashboard(conn, user_id)
+        conn.commit()
 
 def get_metrics(user_id: int, limit: Optional[int] = None):
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    if limit:
-        c.execute("SELECT name, value, timestamp FROM metrics WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?", (user_id, limit))
-    else:
-        c.execute("SELECT name, value, timestamp FROM metrics WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
-    metrics = [{"name": row[0], "value": row[1], "timestamp": row[2]} for row in c.fetchall()]
-    conn.close()
+    with connection() as conn:
+        c = conn.cursor()
+        if limit:
+            c.execute("SELECT name, value, timestamp FROM metrics WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?", (user_id, limit))
+        else:
+            c.execute("SELECT name, value, timestamp FROM metrics WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
+        metrics = [{"name": row[0], "value": row[1], "timestamp": row[2]} for row in c.fetchall()]
     return metrics
 
 # --- CRUD for Portfolio Data ---
 def add_portfolio_data(data: list, max_rows: int = 120):
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    user_id = data[0]['user_id']
-    for row in data:
-        c.execute("INSERT INTO portfolio_data (user_id, symbol, date, close) VALUES (?, ?, ?, ?)",
-                  (row['user_id'], row['symbol'], row['date'], row['close']))
-    conn.commit()
-    _limit_rows(conn, "portfolio_data", user_id, max_rows)
-    conn.close()
+    with connection() as conn:
+        c = conn.cursor()
+        user_id = data[0]['user_id']
+        c.executemany("INSERT INTO portfolio_data (user_id, symbol, date, close) VALUES (?, ?, ?, ?)",
+                      [(row['user_id'], row['symbol'], row['date'], row['close']) for row in data])
+        _limit_rows(conn, "portfolio_data", user_id, max_rows)
+        conn.commit()
 
 def get_latest_portfolio_analysis(user_id: int, limit: Optional[int] = None):
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    # Try to select date and timestamp if the column exists; if not, fall back to date-only.
-    try:
+    with connection() as conn:
+        c = conn.cursor()
         if limit:
             c.execute("""
                 SELECT DISTINCT date, timestamp FROM portfolio_data
@@ -208,71 +203,164 @@ def get_latest_portfolio_analysis(user_id: int, limit: Optional[int] = None):
                 ORDER BY timestamp DESC
             """, (user_id,))
         results = [{"date": row[0], "timestamp": row[1]} for row in c.fetchall()]
-    except sqlite3.OperationalError:
-        # Likely the 'timestamp' column doesn't exist in older DBs; return date-only results.
-        if limit:
-            c.execute("""
-                SELECT DISTINCT date FROM portfolio_data
-                WHERE user_id = ?
-                ORDER BY date DESC
-                LIMIT ?
-            """, (user_id, limit))
-        else:
-            c.execute("""
-                SELECT DISTINCT date FROM portfolio_data
-                WHERE user_id = ?
-                ORDER BY date DESC
-            """, (user_id,))
-        results = [{"date": row[0], "timestamp": None} for row in c.fetchall()]
-
-    conn.close()
     return results
 
 # --- CRUD for Prediction Results ---
 def add_prediction_data(user_id: int, result: Dict[str, Any], max_rows: int = 120):
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    c.execute("INSERT INTO prediction_results (user_id, result) VALUES (?, ?)",
-              (user_id, json.dumps(result)))
-    conn.commit()
-    _limit_rows(conn, "prediction_results", user_id, max_rows)
-    conn.close()
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("INSERT INTO prediction_results (user_id, result) VALUES (?, ?)",
+                  (user_id, json.dumps(result)))
+        _limit_rows(conn, "prediction_results", user_id, max_rows)
+        _refresh_dashboard(conn, user_id)
+        conn.commit()
 
 def get_latest_prediction(user_id: int, limit: Optional[int] = None):
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    if limit:
-        c.execute("SELECT result, timestamp FROM prediction_results WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?", (user_id, limit))
-    else:
-        c.execute("SELECT result, timestamp FROM prediction_results WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
-    results = [{"result": json.loads(row[0]), "timestamp": row[1]} for row in c.fetchall()]
-    conn.close()
+    with connection() as conn:
+        c = conn.cursor()
+        if limit:
+            c.execute("SELECT result, timestamp FROM prediction_results WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?", (user_id, limit))
+        else:
+            c.execute("SELECT result, timestamp FROM prediction_results WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
+        results = [{"result": json.loads(row[0]), "timestamp": row[1]} for row in c.fetchall()]
     return results
 
 # --- CRUD for Investment Strategy Results ---
-def add_investment_strategy_data(user_id: int, result: Dict[str, Any], max_rows: int = 120):
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    c.execute("INSERT INTO investment_strategy_results (user_id, result) VALUES (?, ?)",
-              (user_id, json.dumps(result)))
-    conn.commit()
-    _limit_rows(conn, "investment_strategy_results", user_id, max_rows)
-    conn.close()
+def add_investment_strategy_data(user_id: int, result: Dict[str, Any], max_rows: int = 120, refresh_dashboard: bool = True):
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("INSERT INTO investment_strategy_results (user_id, result) VALUES (?, ?)",
+                  (user_id, json.dumps(result)))
+        _limit_rows(conn, "investment_strategy_results", user_id, max_rows)
+        if refresh_dashboard:
+            _refresh_dashboard(conn, user_id)
+        conn.commit()
 
 def get_latest_investment_strategy(user_id: int, limit: Optional[int] = None):
-    conn = sqlite3.connect(DATABASE_URL)
-    c = conn.cursor()
-    if limit:
-        c.execute("SELECT result, timestamp FROM investment_strategy_results WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?", (user_id, limit))
-    else:
-        c.execute("SELECT result, timestamp FROM investment_strategy_results WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
-    results = [{"result": json.loads(row[0]), "timestamp": row[1]} for row in c.fetchall()]
-    conn.close()
+    with connection() as conn:
+        c = conn.cursor()
+        if limit:
+            c.execute("SELECT result, timestamp FROM investment_strategy_results WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?", (user_id, limit))
+        else:
+            c.execute("SELECT result, timestamp FROM investment_strategy_results WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
+        results = [{"result": json.loads(row[0]), "timestamp": row[1]} for row in c.fetchall()]
     return results
 
-# --- Initialize all databases ---
-init_user_db()
-init_metrics_db()
-init_portfolio_db()
-init_prediction_db()
-init_investment_strategy_db()
+# --- Dashboard Snapshot ---
+# /metrics/dashboard serves one pre-serialized row per user. The writers of
+# the tables it shows rebuild the row in the same transaction, so a read is a
+# single primary-key lookup with no JSON decoding. A request that writes
+# several tables passes refresh_dashboard=False to all but its last write, and
+# add_portfolio_data never refreshes: its rows are only written ahead of an
+# analysis result, whose write rebuilds the row once.
+DASHBOARD_ROWS = 5
+
+def _refresh_dashboard(conn, user_id: int):
+    body = json.dumps({
+        "metrics": get_metrics(user_id, limit=DASHBOARD_ROWS),
+        "portfolio_analysis": get_latest_portfolio_analysis(user_id, limit=DASHBOARD_ROWS),
+        "investment_strategy": get_latest_investment_strategy(user_id, limit=DASHBOARD_ROWS),
+        "prediction": get_latest_prediction(user_id, limit=DASHBOARD_ROWS),
+    })
+    etag = hashlib.sha256(body.encode()).hexdigest()[:32]
+    conn.execute("""
+        INSERT INTO dashboard_snapshots (user_id, body, etag) VALUES (?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET body = excluded.body, etag = excluded.etag, updated_at = CURRENT_TIMESTAMP
+    """, (user_id, body, etag))
+    return body, etag
+
+def get_dashboard_snapshot(user_id: int) -> Tuple[str, str]:
+    """Return the user's dashboard as (JSON text, etag), materializing it on first read."""
+    with connection() as conn:
+        row = conn.execute("SELECT body, etag FROM dashboard_snapshots WHERE user_id = ?", (user_id,)).fetchone()
+        if row:
+            return row
+        snapshot = _refresh_dashboard(conn, user_id)
+        conn.commit()
+    return snapshot
+
+# --- Incremental Risk State ---
+def get_risk_state(user_id: int, portfolio_key: str) -> Optional[Dict[str, Any]]:
+    with connection() as conn:
+        row = conn.execute("SELECT state FROM risk_state WHERE user_id = ? AND portfolio_key = ?",
+                           (user_id, portfolio_key)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def save_risk_state(user_id: int, portfolio_key: str, state: Dict[str, Any]):
+    with connection() as conn:
+        conn.execute("""
+            INSERT INTO risk_state (user_id, portfolio_key, state) VALUES (?, ?, ?)
+            ON CONFLICT (user_id, portfolio_key)
+            DO UPDATE SET state = excluded.state, updated_at = CURRENT_TIMESTAMP
+        """, (user_id, portfolio_key, json.dumps(state)))
+        conn.commit()
+
+# --- Alert Outbox ---
+def enqueue_alert(user_id: Optional[int], recipient: str, subject: str, body: str, dedup_key: str,
+                  dedup_window: float, now: float) -> bool:
+    """
+    Queue an alert unless the recipient got one with the same `dedup_key` in
+    the last `dedup_window` seconds. Returns True if it was queued.
+    """
+    with connection() as conn:
+        # IMMEDIATE so two requests cannot both pass the duplicate check
+        conn.execute("BEGIN IMMEDIATE")
+        duplicate = conn.execute("""
+            SELECT 1 FROM alert_outbox
+            WHERE recipient = ? AND dedup_key = ? AND created_at > ? AND status != 'failed'
+            LIMIT 1
+        """, (recipient, dedup_key, now - dedup_window)).fetchone()
+        if not duplicate:
+            conn.execute("""
+                INSERT INTO alert_outbox (user_id, recipient, subject, body, dedup_key, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, recipient, subject, body, dedup_key, now, now))
+        conn.commit()
+    return not duplicate
+
+def claim_due_alerts(limit: int, lease: float, now: float) -> List[Dict[str, Any]]:
+    """
+    Lease up to `limit` due alerts to the caller, oldest first. A claim that is
+    not resolved within `lease` seconds (e.g. the sender crashed) becomes due again.
+    """
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute("""
+            UPDATE alert_outbox SET status = 'sending', next_attempt_at = ?
+            WHERE id IN (
+                SELECT id FROM alert_outbox
+                WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+                ORDER BY next_attempt_at LIMIT ?
+            )
+            RETURNING id, user_id, recipient, subject, body, attempts
+        """, (now + lease, now, limit)).fetchall()
+        conn.commit()
+    columns = ("id", "user_id", "recipient", "subject", "body", "attempts")
+    return sorted((dict(zip(columns, row)) for row in rows), key=lambda alert: alert["id"])
+
+def mark_alerts_sent(alert_ids: List[int], now: float):
+    with connection() as conn:
+        conn.executemany("UPDATE alert_outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1, last_error = NULL WHERE id = ?",
+                         [(now, alert_id) for alert_id in alert_ids])
+        conn.commit()
+
+def mark_alerts_failed(alert_ids: List[int], error: str, retry_at: Optional[float]):
+    """Record a failed attempt; retry at `retry_at`, or give up when it is None."""
+    with connection() as conn:
+        if retry_at is None:
+            conn.executemany("UPDATE alert_outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+                             [(error, alert_id) for alert_id in alert_ids])
+        else:
+            conn.executemany("UPDATE alert_outbox SET status = 'pending', attempts = attempts + 1, last_error = ?, next_attempt_at = ? WHERE id = ?",
+                             [(error, retry_at, alert_id) for alert_id in alert_ids])
+        conn.commit()
+
+def alert_outbox_counts() -> Dict[str, int]:
+    with connection() as conn:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM alert_outbox GROUP BY status").fetchall())
+
+def prune_alerts(before: float):
+    """Delete delivered and abandoned alerts created before `before`."""
+    with connection() as conn:
+        conn.execute("DELETE FROM alert_outbox WHERE status IN ('sent', 'failed') AND created_at < ?", (before,))
+        conn.commit()
@@ -0,0 +1,151 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional
+
+# Blocking calls from async handlers go to a thread pool sized for their kind,
+# so slow work of one kind cannot starve the others:
+#   db   - SQLite queries (each thread keeps its own connection)
+#   hash - password hashing (bcrypt is CPU-bound by design)
+#   io   - file and network I/O such as loading uploads and SMTP
+#   jobs - the analytics job workers (see jobs.py)
+THREAD_POOL_SIZES = {
+    "db": int(os.getenv("DB_POOL_SIZE", 4)),
+    "hash": int(os.getenv("HASH_POOL_SIZE", os.cpu_count() or 1)),
+    "io": int(os.getenv("IO_POOL_SIZE", 8)),
+    "jobs": int(os.getenv("JOB_WORKERS", 2)),
+}
+
+# Size of the process pool shared by CPU-bound analytics (model fitting).
+# 0 disables the pool and callers run their work in-process.
+ANALYTICS_PROCESS_WORKERS = int(os.getenv("ANALYTICS_PROCESS_WORKERS", os.cpu_count() or 1))
+# Workers are spawned rather than forked: the API process runs threads (the
+# database pool, the event loop) whose locks must not leak into children.
+ANALYTICS_START_METHOD = os.getenv("ANALYTICS_START_METHOD", "spawn")
+
+_lock = threading.Lock()
+_process_pool: Optional[ProcessPoolExecutor] = None
+_thread_pools: Dict[str, "InstrumentedThreadPool"] = {}
+
+
+class InstrumentedThreadPool(ThreadPoolExecutor):
+    """ThreadPoolExecutor that counts queued, running and completed calls."""
+
+    def __init__(self, name: str, max_workers: int):
+        super().__init__(max_workers=max_workers, thread_name_prefix=name)
+        self.name = name
+        self.workers = max_workers
+        self._stats_lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.max_queued = 0
+        self.wait_seconds = 0.0
+
+    def submit(self, fn, /, *args, **kwargs):
+        enqueued = time.perf_counter()
+
+        def call():
+            with self._stats_lock:
+                self.queued -= 1
+                self.active += 1
+                self.wait_seconds += time.perf_counter() - enqueued
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._stats_lock:
+                    self.active -= 1
+                    self.completed += 1
+
+        with self._stats_lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        future = super().submit(call)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        # A call cancelled while queued never runs, so take it off the queue here
+        if future.cancelled():
+            with self._stats_lock:
+                self.queued -= 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            started = self.completed + self.active
+            return {
+                "workers": self.workers,
+                "queued": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "max_queued": self.max_queued,
+                "avg_wait_ms": round(1000 * self.wait_seconds / started, 3) if started else 0.0,
+            }
+
+
+def get_thread_pool(name: str) -> InstrumentedThreadPool:
+    """Return the named thread pool (see THREAD_POOL_SIZES), creating it on first use."""
+    with _lock:
+        pool = _thread_pools.get(name)
+        if pool is None:
+            pool = _thread_pools[name] = InstrumentedThreadPool(name, THREAD_POOL_SIZES[name])
+        return pool
+
+
+async def run_in_pool(name: str, func, *args, **kwargs):
+    """Run a blocking call on the named thread pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_thread_pool(name), functools.partial(func, *args, **kwargs))
+
+
+def executor_stats() -> dict:
+    """Queue depth and throughput of every pool started in this process."""
+    with _lock:
+        pools = dict(_thread_pools)
+        process_pool = _process_pool
+    stats = {name: pool.stats() for name, pool in pools.items()}
+    if process_pool is not None:
+        stats["process"] = {"workers": ANALYTICS_PROCESS_WORKERS}
+    return stats
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Return the process pool shared across requests, creating it on first use."""
+    global _process_pool
+    if ANALYTICS_PROCESS_WORKERS <= 0:
+        return None
+    with _lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=ANALYTICS_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context(ANALYTICS_START_METHOD),
+            )
+        return _process_pool
+
+
+def reset_process_pool(pool: Optional[ProcessPoolExecutor] = None):
+    """
+    Drop the shared pool so the next `get_process_pool` starts a fresh one.
+
+    Called after a worker died (BrokenProcessPool); pass the pool that failed
+    so that concurrent callers do not reset a pool that is already new.
+    """
+    global _process_pool
+    with _lock:
+        if _process_pool is None or (pool is not None and pool is not _process_pool):
+            return
+        stale, _process_pool = _process_pool, None
+    stale.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_executors():
+    reset_process_pool()
+    with _lock:
+        pools = list(_thread_pools.values())
+        _thread_pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
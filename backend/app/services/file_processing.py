@@ -1,51 +1,173 @@
+import hashlib
 import io
 import os
-from typing import List, Union
-from fastapi import UploadFile
-import pandas as pd
+import uuid
+from typing import List, Optional, Union
+from fastapi import HTTPException, UploadFile, status
+import numpy as np
 import aiofiles
 
-# Get the base directory (backend folder)
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-UPLOAD_DIR = os.path.join(BASE_DIR, "data", "user_uploads")
-
-async def save_uploaded_files(files: List[UploadFile], user_id: int) -> List[str]:
-    """Saves uploaded files to a user-specific directory."""
-    user_upload_dir = os.path.join(UPLOAD_DIR, str(user_id))
-    os.makedirs(user_upload_dir, exist_ok=True)
-    saved_file_paths = []
-    for file in files:
-        file_path = os.path.join(user_upload_dir, file.filename)
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            while content := await file.read(1024):  # async read file in chunks
-                await out_file.write(content)
-        saved_file_paths.append(file_path)
-    return saved_file_paths
-
-async def process_uploaded_files(files_or_paths: List[Union[UploadFile, str]]):
+from app.services.parse_cache import ParsedFile, load_parsed, parse_csv, sidecar_dir, typed_columns
+from app.models.user import UserInDB
+from app.services.csv_stream import StreamingCsvIngest
+from app.services.database import replace_user_uploads, run_db
+from app.services.executors import run_in_pool
+from app.services.price_series import PriceBundle, PriceSeries
+from app.services.upload_store import INCOMING_DIR, blob_path
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Up to this many bytes of an upload, and as many again of its parsed columns,
+# are held in memory until its hash is known, so re-uploading content that is
+# already stored writes nothing to disk.
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", 32 * 1024 * 1024))
+
+
+class _UploadSpool:
+    """Bytes of one upload, kept in memory up to `limit` and appended to `path` beyond it."""
+
+    def __init__(self, path: str, limit: int):
+        self.path = path
+        self.limit = limit
+        self.size = 0
+        self._buffer = bytearray()
+        self._file = None
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self._file is None:
+            self._buffer += data
+            if len(self._buffer) <= self.limit:
+                return
+            data = await self._open()
+        await self._file.write(data)
+
+    async def _open(self) -> bytes:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = await aiofiles.open(self.path, 'wb')
+        data, self._buffer = bytes(self._buffer), bytearray()
+        return data
+
+    async def move_to(self, path: str):
+        """Write out the complete upload and move it to `path`."""
+        if self._file is None:
+            data = await self._open()
+            await self._file.write(data)
+        await self._file.close()
+        self._file = None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.path, path)
+
+    async def discard(self):
+        self._buffer = bytearray()
+        if self._file is None:
+            return
+        await self._file.close()
+        self._file = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _has_sidecar(path: str) -> bool:
+    return os.path.exists(os.path.join(sidecar_dir(path), "meta.json"))
+
+
+def _date_string(value) -> Optional[str]:
+    return None if value is None else str(np.datetime_as_string(value, unit='s')).replace('T', ' ')
+
+
+async def save_uploaded_files(files: List[UploadFile], resample: Optional[str] = None) -> List[dict]:
+    """
+    Store uploads in the content-addressed upload store (see upload_store.py).
+
+    Each upload is parsed in bounded batches while it is received (see
+    `StreamingCsvIngest`), so its columns are indexed without re-reading the
+    file, and hashed as it goes. Content already in the store is not written
+    again; new content is moved to its blob path. With `resample` ("minute",
+    "hour" or "day") only the aggregated OHLC bars are stored.
+
+    Returns one record per file (stored path, hash, symbol, row count and
+    date range) for `database.replace_user_uploads`.
+    """
+    return [await _store_upload(file, resample) for file in files]
+
+
+async def _store_upload(file: UploadFile, resample: Optional[str]) -> dict:
+    incoming_path = os.path.join(INCOMING_DIR, f"{uuid.uuid4().hex}.csv")
+    ingest = StreamingCsvIngest(incoming_path, file.filename, resample=resample, spool_bytes=UPLOAD_SPOOL_BYTES)
+    spool = _UploadSpool(incoming_path, UPLOAD_SPOOL_BYTES)
+    try:
+        while content := await file.read(UPLOAD_CHUNK_BYTES):  # async read file in chunks
+            await spool.write(ingest.feed(content))
+        await spool.write(ingest.finish())
+
+        path = blob_path(ingest.sha256)
+        stored = not os.path.exists(path)
+        if stored:
+            await spool.move_to(path)
+        else:
+            await spool.discard()
+        if _has_sidecar(path):
+            ingest.abort()
+        else:
+            ingest.commit(path)
+    except Exception:
+        ingest.abort()
+        await spool.discard()
+        raise
+    return {
+        "path": path,
+        "filename": file.filename,
+        "sha256": ingest.sha256,
+        "symbol": ingest.symbol,
+        "row_count": ingest.row_count,
+        "first_date": _date_string(ingest.first_date),
+        "last_date": _date_string(ingest.last_date),
+        "size_bytes": spool.size,
+        "stored": stored,
+    }
+
+async def resolve_file_paths(files: Optional[List[UploadFile]], resample: Optional[str], current_user: UserInDB) -> List[str]:
+    """Save new uploads for the user, or fall back to the files they uploaded before."""
+    if files:
+        # New files uploaded, save them and update user's stored paths
+        try:
+            uploads = await save_uploaded_files(files, resample=resample)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        await run_db(replace_user_uploads, current_user.id, uploads)
+        return [upload["path"] for upload in uploads]
+    # No new files, use previously uploaded files
+    if current_user.uploaded_file_paths:
+        return current_user.uploaded_file_paths
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="No files provided and no previously uploaded files found for this user."
+    )
+
+def load_price_bundle(file_paths: List[str]) -> PriceBundle:
+    """Synchronous counterpart of `process_uploaded_files` for stored paths, for worker threads."""
+    series = []
+    for path in file_paths:
+        parsed = load_parsed(path)
+        series.append(PriceSeries.from_columns(parsed.symbol, parsed.columns))
+    return PriceBundle(series)
+
+async def process_uploaded_files(files_or_paths: List[Union[UploadFile, str]]) -> PriceBundle:
+    """Parse uploads into a PriceBundle with one cleaned, date-sorted PriceSeries per file."""
     processed_data = []
     for item in files_or_paths:
         if isinstance(item, UploadFile):
             contents = await item.read()
-            df = pd.read_csv(io.BytesIO(contents))
-            filename = item.filename
+            df = parse_csv(io.BytesIO(contents), item.filename)
+            parsed = ParsedFile(str(df['symbol'].iloc[0]), typed_columns(df), hashlib.sha256(contents).hexdigest())
         elif isinstance(item, str):
-            with open(item, 'rb') as f:
-                contents = f.read()
-            df = pd.read_csv(io.BytesIO(contents))
-            filename = os.path.basename(item)
+            # Parsed columns are cached on disk next to the upload, so repeat
+            # requests against stored paths skip the CSV parse entirely.
+            parsed = await run_in_pool("io", load_parsed, item)
         else:
             raise ValueError("Invalid item type provided to process_uploaded_files. Expected UploadFile or str (file path).")
 
-        df.columns = [col.strip().lower() for col in df.columns]
-        # Check for required columns
-        required_columns = {'date', 'symbol', 'open', 'high', 'low', 'close', 'unix'}
-        if not required_columns.issubset(df.columns):
-            raise ValueError(f"File {filename} is missing one or more required columns: {required_columns}")
-        
-        # Extract symbol and data
-        symbol = df['symbol'].iloc[0]
-        data = df.to_dict(orient='records')
-        processed_data.append({"symbol": symbol, "data": data})
-    return processed_data
-
+        processed_data.append(PriceSeries.from_columns(parsed.symbol, parsed.columns))
+    return PriceBundle(processed_data)
@@ -0,0 +1,153 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Cached predictions expire after this many seconds; 0 keeps them until evicted.
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL", 3600))
+FORECAST_CACHE_MAX_ENTRIES = int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", 256))
+# Optional directory shared by all workers; entries are also kept in memory.
+FORECAST_CACHE_DIR = os.getenv("FORECAST_CACHE_DIR", "")
+FORECAST_CACHE_FORMAT_VERSION = 1
+
+# A series is tied to its earlier versions by the hash of its first rows, so a
+# file that only gained rows at the end can warm-start from the older model.
+LINEAGE_ROWS = 30
+
+
+def _hash(values: np.ndarray, config_key: str) -> str:
+    digest = hashlib.sha256(config_key.encode())
+    digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def config_key(config: dict) -> str:
+    return json.dumps({"version": FORECAST_CACHE_FORMAT_VERSION, **config}, sort_keys=True, default=list)
+
+
+def series_fingerprint(close: np.ndarray, config: dict) -> str:
+    """Key of a cleaned close series under one model configuration."""
+    return _hash(close, config_key(config))
+
+
+class _Store:
+    """In-process LRU with TTL, backed by one JSON file per key when a directory is set."""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+
+    def _path(self, key: str) -> Optional[str]:
+        if not FORECAST_CACHE_DIR:
+            return None
+        return os.path.join(FORECAST_CACHE_DIR, self.namespace, f"{key}.json")
+
+    @staticmethod
+    def _fresh(entry: dict) -> bool:
+        return FORECAST_CACHE_TTL <= 0 or time.time() - entry["stored_at"] < FORECAST_CACHE_TTL
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._fresh(entry):
+                    self._entries.move_to_end(key)
+                    return entry
+                del self._entries[key]
+
+        path = self._path(key)
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not self._fresh(entry):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, entry: dict):
+        entry = {**entry, "stored_at": time.time()}
+        self._remember(key, entry)
+        path = self._path(key)
+        if path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            # The disk tier is best effort; the in-memory entry still serves this worker
+            pass
+
+    def _remember(self, key: str, entry: dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > FORECAST_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_results = _Store("results")
+_lineage = _Store("lineage")
+
+
+def get_prediction(key: str) -> Optional[dict]:
+    """Return the cached prediction result for `key`, or None."""
+    entry = _results.get(key)
+    return None if entry is None else copy.deepcopy(entry["result"])
+
+
+def warm_start(close: np.ndarray, config: dict) -> Optional[Tuple[tuple, np.ndarray]]:
+    """
+    Return (order, params) of the model fitted on an earlier, shorter version
+    of this series, or None when no such model is cached.
+    """
+    if len(close) <= LINEAGE_ROWS:
+        return None
+    cfg = config_key(config)
+    entry = _lineage.get(_hash(close[:LINEAGE_ROWS], cfg))
+    if entry is None or entry["params"] is None:
+        return None
+    length = entry["length"]
+    if length > len(close) or _hash(close[:length], cfg) != entry["series"]:
+        return None
+    return tuple(entry["order"]), np.asarray(entry["params"], dtype=np.float64)
+
+
+def store_prediction(key: str, close: np.ndarray, config: dict, result: dict,
+                     order: tuple, params: Optional[np.ndarray]):
+    """Cache a prediction result and the fitted model it came from."""
+    _results.put(key, {"result": result})
+    if len(close) <= LINEAGE_ROWS:
+        return
+    _lineage.put(_hash(close[:LINEAGE_ROWS], config_key(config)), {
+        "series": key,
+        "length": len(close),
+        "order": list(order),
+        "params": None if params is None else np.asarray(params, dtype=np.float64).tolist(),
+    })
+
+
+def clear_memory_cache():
+    _results.clear()
+    _lineage.clear()
@@ -0,0 +1,94 @@
+import math
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from app.services.executors import THREAD_POOL_SIZES, run_in_pool
+
+# Password hashing for the whole application. bcrypt is CPU-bound and holds no
+# GIL while it runs, so the "hash" pool (HASH_POOL_SIZE threads, one per core
+# by default) hashes in parallel. At most HASH_MAX_PENDING hashes may be queued
+# or running at once; beyond that callers get HashingBusy (503 + Retry-After)
+# at once instead of waiting behind a backlog that outlasts their timeout.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", 4 * THREAD_POOL_SIZES["hash"]))
+
+# Hashes made with another cost are reported by needs_update and replaced on
+# the user's next successful login, see verify_and_update.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+_lock = threading.Lock()
+_pending = 0
+_rejected = 0
+# Moving average of one hash's duration, for the Retry-After estimate
+_avg_seconds = 0.25
+
+
+class HashingBusy(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Password hashing is saturated; retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def hash_password_sync(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_and_update_sync(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(matches, replacement hash when the stored one uses an outdated cost)."""
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+def _timed(func, *args):
+    global _avg_seconds
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            _avg_seconds += 0.2 * (elapsed - _avg_seconds)
+
+
+def _retry_after_locked() -> int:
+    """Seconds until the pool should have worked through the current backlog."""
+    return max(1, math.ceil(_pending * _avg_seconds / THREAD_POOL_SIZES["hash"]))
+
+
+async def _submit(func, *args):
+    global _pending, _rejected
+    with _lock:
+        if _pending >= HASH_MAX_PENDING:
+            _rejected += 1
+            raise HashingBusy(_retry_after_locked())
+        _pending += 1
+    try:
+        return await run_in_pool("hash", _timed, func, *args)
+    finally:
+        with _lock:
+            _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    """Hash on the hash pool; raises HashingBusy when it is saturated."""
+    return await _submit(hash_password_sync, password)
+
+
+async def verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify on the hash pool; raises HashingBusy when it is saturated."""
+    return await _submit(verify_and_update_sync, password, hashed_password)
+
+
+def hashing_stats() -> dict:
+    with _lock:
+        return {
+            "rounds": BCRYPT_ROUNDS,
+            "workers": THREAD_POOL_SIZES["hash"],
+            "max_pending": HASH_MAX_PENDING,
+            "pending": _pending,
+            "rejected": _rejected,
+            "avg_hash_ms": round(1000 * _avg_seconds, 1),
+        }
@@ -4,64 +4,29 @@ import sqlite3
 from datetime import datetime
 import warnings
 
+from app.services.alignment import aligned_frame
+from app.services.price_series import as_price_bundle
+from app.services.stress import run_stress_test
+
 warnings.filterwarnings("ignore", category=RuntimeWarning)
 
 def combine_uploaded_data(uploaded_data):
-    if not uploaded_data:
+    """Union of the symbols' dates, gaps filled forward then backward."""
+    bundle = as_price_bundle(uploaded_data)
+    if not bundle:
         raise ValueError("Uploaded data is empty. Cannot run strategy.")
 
-    all_dfs = []
-    
-    def identify_price_column(df):
-        if 'close' in df.columns:
-            return 'close'
-        other_cols = [c for c in df.columns if c.lower() not in ['date', 'volume', 'adj close']]
-        if other_cols:
-            return other_cols[-1]
-        raise ValueError("Uploaded DataFrame must contain a 'date' or date-like column and a 'close' or price-like column.")
-
-
-    for crypto in uploaded_data:
-        # support both dict-like (from process_uploaded_files) and object-like inputs
-        if isinstance(crypto, dict):
-            rows = crypto.get('data')
-            symbol = crypto.get('symbol')
-        else:
-            rows = getattr(crypto, 'data', None)
-            symbol = getattr(crypto, 'symbol', None)
-
-        if not rows or not symbol:
-            # skip malformed entries
+    series_list = []
+    for series in bundle:
+        if series.dates is None:
+            raise ValueError(f"DataFrame for {series.symbol} must contain a 'date' or date-like column.")
+        if len(series) == 0:
             continue
+        series_list.append(series)
 
-        df = pd.DataFrame(rows)
-        df.columns = [str(col).strip().lower() for col in df.columns]
-
-        if 'date' not in df.columns:
-            date_col = next((c for c in df.columns if 'date' in c.lower() or 'time' in c.lower()), None)
-            if date_col:
-                df = df.rename(columns={date_col: 'date'})
-            else:
-                raise ValueError(f"DataFrame for {symbol} must contain a 'date' or date-like column.")
-
-        price_col = identify_price_column(df)
-
-        df = df.rename(columns={price_col: symbol, 'date': 'date'})
-        df = df[['date', symbol]]
-        df["date"] = pd.to_datetime(df["date"], errors='coerce')
-        df = df.dropna(subset=['date'])
-        all_dfs.append(df)
-
-    if not all_dfs:
+    if not series_list:
         raise ValueError("No valid data found in uploaded files.")
-    prices_df = all_dfs[0]
-    for df in all_dfs[1:]:
-        prices_df = prices_df.merge(df, on="date", how="outer")
-
-    prices_df = prices_df.sort_values("date").set_index("date").dropna(how='all')
-    prices_df = prices_df.fillna(method='ffill').fillna(method='bfill')
-    
-    return prices_df
+    return aligned_frame(series_list, how="union", fill=("ffill", "bfill"))
 
 def sharpe_weights(prices_df, risk_free_rate=0.0):
     returns = np.log(prices_df / prices_df.shift(1)).dropna()
@@ -93,36 +58,9 @@ def dynamic_weights_and_return(uploaded_data):
 
     return dict(weights), portfolio_return, returns
 
-def stress_test(weights, n=1000):
-    weights = {k.lower(): v for k, v in weights.items()}
-    assets = list(weights.keys())
-
-    scenarios_params = {
-        "Bull Market": (0.04, 0.01),      
-        "Bear Market": (-0.04, 0.015),    
-        "Volatile Market": (0.00, 0.08)   
-    }
-
-    simulated_scenarios = {}
-    for scenario, (mu, sigma) in scenarios_params.items():
-        scenario_df_data = {}
-        for asset in assets:
-            scenario_df_data[asset] = np.random.normal(mu, sigma, n)
-        simulated_scenarios[scenario] = pd.DataFrame(scenario_df_data)
-
-    results = {}
-    for scenario, df in simulated_scenarios.items():
-        weight_vector = np.array([weights.get(col, 0) for col in df.columns])
-        portfolio_returns = df.dot(weight_vector)
-
-        results[scenario] = {
-            "mean_return": float(portfolio_returns.mean()),
-            "volatility": float(portfolio_returns.std()),
-            "min_return": float(portfolio_returns.min()),
-            "max_return": float(portfolio_returns.max())
-        }
-
-    return results
+def stress_test(weights, returns=None, n=None, seed=None):
+    """Correlated Monte Carlo stress test of `weights`; see stress.run_stress_test."""
+    return run_stress_test(weights, returns, n_paths=n, seed=seed)
 
 def interpret_stress_test(results):
     insights = []
@@ -130,6 +68,9 @@ def interpret_stress_test(results):
     bear = results["Bear Market"]
     insights.append(f"Bear Market -> Avg: {bear['mean_return']:.2%}, Worst-case: {bear['min_return']:.2%}. "
                     f"Portfolio faces a downside, and diversification will determine the severity of the loss.")
+    if "var_95" in bear:
+        insights.append(f"Bear Market tail -> 95% VaR: {bear['var_95']:.2%}, 95% CVaR: {bear['cvar_95']:.2%} "
+                        f"(loss not exceeded on 95% of paths, and the average loss on the rest).")
 
     bull = results["Bull Market"]
     insights.append(f"Bull Market -> Avg: {bull['mean_return']:.2%}, Best-case: {bull['max_return']:.2%}. "
@@ -141,9 +82,9 @@ def interpret_stress_test(results):
 
     return insights
 
-def run_investment_strategy(uploaded_data):
+def run_investment_strategy(uploaded_data, n_paths=None, seed=None):
     weights, port_return, returns = dynamic_weights_and_return(uploaded_data)
-    results = stress_test(weights)
+    results = stress_test(weights, returns, n=n_paths, seed=seed)
     insights = interpret_stress_test(results)
     
     return {
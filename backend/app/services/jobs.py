@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+from app.services.executors import get_thread_pool, run_in_pool
+
+# Analytics run on the "jobs" thread pool (JOB_WORKERS threads, see
+# executors.py), off the event loop. The heavy numeric parts release the GIL
+# or use the shared process pool.
+
+# Finished jobs (and their results) are kept this many seconds for polling.
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", 3600))
+# Queued plus running jobs one user may have at a time.
+JOB_MAX_ACTIVE_PER_USER = int(os.getenv("JOB_MAX_ACTIVE_PER_USER", 4))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobLimitExceeded(Exception):
+    pass
+
+
+class Job:
+    """One submitted analytics task and, once finished, its result or error."""
+
+    def __init__(self, kind: str, user_id: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user_id = user_id
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result = None
+        self.error: Optional[str] = None
+        self.future: Optional[Future] = None
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        def iso(ts):
+            return None if ts is None else datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": iso(self.created_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            "error": self.error,
+        }
+        if include_result and self.status == SUCCEEDED:
+            data["result"] = self.result
+        return data
+
+
+_lock = threading.Lock()
+_jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+def _prune_locked(now: float):
+    # Jobs are stored in submission order; drop finished ones past retention.
+    for job_id in [j.id for j in _jobs.values()
+                   if j.status in FINISHED and now - j.finished_at > JOB_RESULT_TTL]:
+        del _jobs[job_id]
+
+
+def _run(job: Job, func: Callable, args, kwargs):
+    with _lock:
+        if job.status != QUEUED:
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        result, error = None, str(e) or e.__class__.__name__
+    else:
+        error = None
+    with _lock:
+        job.finished_at = time.time()
+        if job.status == CANCELLED:
+            # Cancelled while running: the work completed, but nobody wants it
+            return
+        job.status = FAILED if error is not None else SUCCEEDED
+        job.result = result
+        job.error = error
+
+
+def submit_job(kind: str, user_id: int, func: Callable, *args, **kwargs) -> Job:
+    """
+    Queue `func(*args, **kwargs)` on the job workers and return its Job.
+
+    Raises JobLimitExceeded when the user already has JOB_MAX_ACTIVE_PER_USER
+    jobs queued or running.
+    """
+    executor = get_thread_pool("jobs")
+    job = Job(kind, user_id)
+    with _lock:
+        _prune_locked(job.created_at)
+        active = sum(1 for j in _jobs.values() if j.user_id == user_id and j.status in (QUEUED, RUNNING))
+        if active >= JOB_MAX_ACTIVE_PER_USER:
+            raise JobLimitExceeded(f"Too many active jobs (limit {JOB_MAX_ACTIVE_PER_USER}); wait for one to finish")
+        _jobs[job.id] = job
+        job.future = executor.submit(_run, job, func, args, kwargs)
+    return job
+
+
+def get_job(job_id: str, user_id: int) -> Optional[Job]:
+    """Return the user's job, or None if it does not exist, expired or belongs to someone else."""
+    with _lock:
+        _prune_locked(time.time())
+        job = _jobs.get(job_id)
+    if job is None or job.user_id != user_id:
+        return None
+    return job
+
+
+def list_jobs(user_id: int) -> List[Job]:
+    with _lock:
+        _prune_locked(time.time())
+        return [job for job in _jobs.values() if job.user_id == user_id]
+
+
+def cancel_job(job_id: str, user_id: int) -> Optional[Job]:
+    """
+    Cancel a queued or running job. A queued job never starts; a running job
+    cannot be interrupted, so it finishes in the background and its result is
+    discarded (side effects it already made, such as stored metrics, remain).
+    """
+    job = get_job(job_id, user_id)
+    if job is None:
+        return None
+    with _lock:
+        if job.status in (QUEUED, RUNNING):
+            if job.status == QUEUED:
+                job.future.cancel()
+            job.status = CANCELLED
+            job.finished_at = time.time()
+    return job
+
+
+async def run_job_inline(func: Callable, *args, **kwargs):
+    """Run `func` on the job workers and wait for it, without blocking the event loop."""
+    return await run_in_pool("jobs", func, *args, **kwargs)
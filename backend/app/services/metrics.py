@@ -1,11 +1,132 @@
-import pandas as pd
-from typing import List, Optional
+from typing import List, Optional, Union
 from app.models.portfolio import CryptoData
 import numpy as np
-from app.services.database import add_metric
+from app.services.alignment import align_arrays
+from app.services.database import add_metrics_bulk
+from app.services.price_series import PriceBundle, as_price_bundle
 
 
-def calculate_technical_metrics(crypto_data: List[dict], user_id: Optional[int] = None, rows: int = 10):
+METRIC_FIELDS = ['percent_change', 'rolling_volatility_7d', 'average_return_3d', 'sortino', 'beta']
+ROW_FIELDS = ('date', 'percent_change', 'rolling_volatility_7d', 'average_return_3d', 'trading_signal', 'sortino', 'beta')
+
+# Longest look-back among the rolling indicators (ma_20); only the last
+# `rows + MAX_WINDOW - 1` observations of each symbol feed the output rows.
+MAX_WINDOW = 20
+
+
+def _rolling(values: np.ndarray, window: int, reducer, **kwargs) -> np.ndarray:
+    """Apply `reducer` over trailing windows along axis 0; rows without a full window are NaN."""
+    out = np.full(values.shape, np.nan)
+    if values.shape[0] >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)
+        out[window - 1:] = reducer(windows, axis=-1, **kwargs)
+    return out
+
+
+def _nullable(values: np.ndarray) -> list:
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def _iso_dates(dates: np.ndarray) -> list:
+    if (dates.astype('datetime64[s]') == dates).all():
+        return np.datetime_as_string(dates, unit='s').tolist()
+    return np.datetime_as_string(dates, unit='us').tolist()
+
+
+def _aligned_beta(series_list, returns: np.ndarray) -> np.ndarray:
+    """
+    Beta of every symbol against the first one, with returns aligned on date.
+
+    `returns` is the right-aligned (n_obs x n_symbols) percent-change matrix; when
+    any symbol lacks dates the rows are aligned on position instead.
+    """
+    if all(s.dates is not None for s in series_list):
+        return_dates = [s.dates[1:] for s in series_list]
+        _, aligned = align_arrays(
+            return_dates,
+            [returns[returns.shape[0] - len(dates):, j] for j, dates in enumerate(return_dates)],
+            how="union",
+        )
+    else:
+        aligned = returns
+
+    market = aligned[:, :1]
+    mask = ~np.isnan(aligned) & ~np.isnan(market)
+    n = mask.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = np.where(mask, aligned, 0).sum(axis=0) / n
+        m_mean = np.where(mask, market, 0).sum(axis=0) / n
+        dx = np.where(mask, aligned - x_mean, 0)
+        dm = np.where(mask, market - m_mean, 0)
+        # Same estimator as np.cov(...)[0][1] / np.var(market): sample covariance
+        # over population variance.
+        cov = (dx * dm).sum(axis=0) / (n - 1)
+        var = (dm * dm).sum(axis=0) / n
+        beta = np.where((n > 1) & (var != 0), cov / var, np.nan)
+    return beta
+
+
+def _technical_metrics_rows(series_list, rows: int) -> dict:
+    """
+    Compute all indicators for every symbol at once.
+
+    Closes are packed into one (n_obs x n_symbols) matrix aligned on each
+    symbol's latest observation (shorter histories are NaN-padded at the top),
+    so percent change, rolling statistics, signals, Sortino and beta are each a
+    single NumPy expression over all symbols.
+    """
+    depth = max(len(s) for s in series_list)
+    closes = np.full((depth, len(series_list)), np.nan)
+    for j, s in enumerate(series_list):
+        closes[depth - len(s):, j] = s.close
+
+    returns = np.full(closes.shape, np.nan)
+    returns[1:] = closes[1:] / closes[:-1] - 1
+
+    # Sortino ratio (annualized), over each symbol's full history
+    with np.errstate(invalid='ignore', divide='ignore'):
+        counts = (~np.isnan(returns)).sum(axis=0)
+        mean_annual = np.nansum(returns, axis=0) / counts * 252
+        downside = np.where(returns < 0, returns, np.nan)
+        downside_n = (~np.isnan(downside)).sum(axis=0)
+        downside_mean = np.nansum(downside, axis=0) / downside_n
+        downside_var = np.nansum((downside - downside_mean) ** 2, axis=0) / (downside_n - 1)
+        downside_std = np.where(downside_n > 1, np.sqrt(downside_var), np.nan) * np.sqrt(252)
+        sortino = np.where(downside_std != 0, mean_annual / downside_std, np.nan)
+
+    beta = _aligned_beta(series_list, returns)
+
+    # Rolling indicators only need the trailing window that feeds the output rows
+    span = min(depth, rows + MAX_WINDOW - 1)
+    close_tail = closes[-span:]
+    pct_tail = returns[-span:]
+    with np.errstate(invalid='ignore'):
+        volatility = _rolling(pct_tail, 7, np.std, ddof=1)
+        average = _rolling(pct_tail, 3, np.mean)
+        ma_5 = _rolling(close_tail, 5, np.mean)
+        ma_20 = _rolling(close_tail, MAX_WINDOW, np.mean)
+    signal = np.select([ma_5 > ma_20, ma_5 < ma_20], ['Buy', 'Sell'], 'Hold')
+
+    output = {}
+    last = slice(-min(rows, span), None)
+    for j, s in enumerate(series_list):
+        valid = ~np.isnan(pct_tail[last, j])
+        n_valid = int(valid.sum())
+        dates = s.dates[len(s) - n_valid:] if s.dates is not None else None
+        columns = [
+            _iso_dates(dates) if dates is not None else [None] * n_valid,
+            pct_tail[last, j][valid].tolist(),
+            _nullable(volatility[last, j][valid]),
+            _nullable(average[last, j][valid]),
+            signal[last, j][valid].tolist(),
+            [_nullable(sortino[j:j + 1])[0]] * n_valid,
+            [_nullable(beta[j:j + 1])[0]] * n_valid,
+        ]
+        output[s.symbol] = [dict(zip(ROW_FIELDS, values)) for values in zip(*columns)]
+    return output
+
+
+def calculate_technical_metrics(crypto_data: Union[PriceBundle, List[dict]], user_id: Optional[int] = None, rows: int = 10):
     """
     Compute per-symbol time-series technical metrics and store numeric metrics in DB.
 
@@ -13,146 +134,61 @@ def calculate_technical_metrics(crypto_data: List[dict], user_id: Optional[int]
     date, percent_change, rolling_volatility_7d, average_return_3d, trading_signal,
     sortino, beta).
 
-    If `user_id` is provided, numeric metrics will be stored in the DB using `add_metric`.
+    If `user_id` is provided, numeric metrics will be stored in the DB in one `add_metrics_bulk` batch.
     Ensures at least 30 metric rows are written to DB (duplicates latest values if necessary).
     """
-    output = {}
-    all_returns = {}
-
-    # First pass: build DataFrames and returns for each symbol
-    for crypto in crypto_data:
-        df = pd.DataFrame(crypto.get('data', []))
-        if df.empty:
-            continue
-        df.columns = [col.strip().lower() for col in df.columns]
-        if 'close' not in df.columns:
-            continue
-
-        df['close'] = pd.to_numeric(df['close'], errors='coerce')
-        if 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
-            df = df.dropna(subset=['date', 'close'])
-            df = df.sort_values('date')
-        else:
-            df = df.dropna(subset=['close'])
-
-        if df.shape[0] < 2:
-            continue
-
-        returns = df['close'].pct_change().dropna()
-        if returns.empty:
-            continue
-
-        symbol = crypto.get('symbol', 'UNKNOWN')
-        all_returns[symbol] = returns
-        # attach processed df for second pass
-        output[symbol] = {'df': df}
-
-    # Determine market returns as first symbol (if any)
-    market_series = None
-    if all_returns:
-        first_symbol = next(iter(all_returns))
-        market_series = all_returns[first_symbol]
-
-    # Second pass: compute per-symbol metrics and prepare rows
-    for symbol, info in list(output.items()):
-        df = info['df']
-        returns = df['close'].pct_change().dropna()
-
-        # percent_change as decimal
-        df['percent_change'] = df['close'].pct_change()
-        df['rolling_volatility_7d'] = df['percent_change'].rolling(window=7).std()
-        df['average_return_3d'] = df['percent_change'].rolling(window=3).mean()
-
-        # moving averages & signal
-        df['ma_5'] = df['close'].rolling(window=5).mean()
-        df['ma_20'] = df['close'].rolling(window=20).mean()
-        df['trading_signal'] = 'Hold'
-        df.loc[df['ma_5'] > df['ma_20'], 'trading_signal'] = 'Buy'
-        df.loc[df['ma_5'] < df['ma_20'], 'trading_signal'] = 'Sell'
-
-        # Sortino ratio (annualized)
-        downside = returns[returns < 0]
-        downside_std = downside.std() * np.sqrt(252) if not downside.empty else np.nan
-        mean_annual = returns.mean() * 252
-        sortino = (mean_annual / downside_std) if downside_std and downside_std != 0 else np.nan
-
-        # Beta vs market
-        if market_series is not None and symbol in all_returns:
-            # align series
-            aligned = pd.concat([all_returns[symbol], market_series], axis=1).dropna()
-            if aligned.shape[0] > 1:
-                cov = np.cov(aligned.iloc[:, 0], aligned.iloc[:, 1])[0][1]
-                var = np.var(aligned.iloc[:, 1])
-                beta = cov / var if var != 0 else np.nan
-            else:
-                beta = np.nan
-        else:
-            beta = np.nan
-
-        # build rows: take last `rows` non-null entries with metrics
-        metrics_rows = []
-        df_clean = df.dropna(subset=['percent_change'])
-        tail = df_clean.tail(rows)
-        for _, r in tail.iterrows():
-            metrics_rows.append({
-                'date': r['date'].isoformat() if 'date' in r and not pd.isna(r['date']) else None,
-                'percent_change': float(r.get('percent_change', np.nan)),
-                'rolling_volatility_7d': float(r.get('rolling_volatility_7d', np.nan)) if not pd.isna(r.get('rolling_volatility_7d', np.nan)) else None,
-                'average_return_3d': float(r.get('average_return_3d', np.nan)) if not pd.isna(r.get('average_return_3d', np.nan)) else None,
-                'trading_signal': str(r.get('trading_signal', 'Hold')),
-                'sortino': float(sortino) if not pd.isna(sortino) else None,
-                'beta': float(beta) if not pd.isna(beta) else None
-            })
-
-        output[symbol] = metrics_rows
+    # Later uploads of the same symbol replace earlier ones; beta is measured
+    # against the first symbol.
+    selected = {}
+    for series in as_price_bundle(crypto_data):
+        if len(series) >= 2:
+            selected[series.symbol] = series
+    output = _technical_metrics_rows(list(selected.values()), rows) if selected else {}
 
     # If user_id provided, persist numeric metrics to DB (ensure at least 30 rows)
     stored = 0
     if user_id is not None:
+        batch = []
         for symbol, rows_list in output.items():
             for row in rows_list:
                 # store numeric metrics only
-                for metric_name in ['percent_change', 'rolling_volatility_7d', 'average_return_3d', 'sortino', 'beta']:
+                for metric_name in METRIC_FIELDS:
                     val = row.get(metric_name)
                     if val is None or (isinstance(val, float) and np.isnan(val)):
                         continue
-                    metric_key = f"{symbol}_{metric_name}"
-                    try:
-                        add_metric(metric_key, float(val), user_id)
-                        stored += 1
-                    except Exception:
-                        # ignore DB write errors for now
-                        pass
-                    if stored >= 30:
+                    batch.append((f"{symbol}_{metric_name}", float(val)))
+                    if len(batch) >= 30:
                         break
-                if stored >= 30:
+                if len(batch) >= 30:
                     break
-            if stored >= 30:
+            if len(batch) >= 30:
                 break
 
         # if still less than 30, duplicate latest numeric entries until we reach 30
-        if stored < 30:
+        if len(batch) < 30:
             # gather a list of candidate (metric_key, val)
             candidates = []
             for symbol, rows_list in output.items():
                 if not rows_list:
                     continue
                 last = rows_list[-1]
-                for metric_name in ['percent_change', 'rolling_volatility_7d', 'average_return_3d', 'sortino', 'beta']:
+                for metric_name in METRIC_FIELDS:
                     val = last.get(metric_name)
                     if val is None or (isinstance(val, float) and np.isnan(val)):
                         continue
                     candidates.append((f"{symbol}_{metric_name}", float(val)))
 
             ci = 0
-            while stored < 30 and candidates:
+            while len(batch) < 30 and candidates:
                 key, val = candidates[ci % len(candidates)]
-                try:
-                    add_metric(f"{key}_dup{stored}", float(val), user_id)
-                    stored += 1
-                except Exception:
-                    pass
+                batch.append((f"{key}_dup{len(batch)}", val))
                 ci += 1
 
+        try:
+            add_metrics_bulk(batch, user_id)
+            stored = len(batch)
+        except Exception:
+            # ignore DB write errors for now
+            pass
+
     return {'metrics': output, 'stored_count': stored}
@@ -0,0 +1,200 @@
+import sqlite3
+from typing import Callable, List, Tuple, Union
+
+# Schema migrations, applied in order and tracked with `PRAGMA user_version`.
+# Each step is a list of SQL statements or a callable taking the connection.
+# Append new steps at the end; never edit one that has shipped.
+Migration = Tuple[int, str, Union[List[str], Callable[[sqlite3.Connection], None]]]
+
+
+TABLE_DDL = {
+    "users": """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        uploaded_file_paths TEXT DEFAULT '[]'
+    )
+    """,
+    "metrics": """
+    CREATE TABLE IF NOT EXISTS metrics (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        value REAL NOT NULL,
+        user_id INTEGER NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    """,
+    "portfolio_data": """
+    CREATE TABLE IF NOT EXISTS portfolio_data (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        symbol TEXT NOT NULL,
+        date TEXT NOT NULL,
+        close REAL NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    """,
+    "prediction_results": """
+    CREATE TABLE IF NOT EXISTS prediction_results (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        result TEXT NOT NULL, -- Storing complex results as JSON string
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    """,
+    "investment_strategy_results": """
+    CREATE TABLE IF NOT EXISTS investment_strategy_results (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        result TEXT NOT NULL, -- Storing complex results as JSON string
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    """,
+}
+
+
+def _add_missing_timestamps(conn: sqlite3.Connection):
+    # Databases created before these tables had a timestamp column were handled
+    # with OperationalError fallbacks at query time. SQLite cannot ADD COLUMN with
+    # a CURRENT_TIMESTAMP default, so rebuild such tables with the current DDL;
+    # copied rows are stamped with the migration time, keeping their id order.
+    for table in ("metrics", "portfolio_data", "prediction_results", "investment_strategy_results"):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if "timestamp" in columns:
+            continue
+        conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+        conn.execute(TABLE_DDL[table])
+        column_list = ", ".join(columns)
+        conn.execute(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {table}_legacy")
+        conn.execute(f"DROP TABLE {table}_legacy")
+
+
+MIGRATIONS: List[Migration] = [
+    (1, "initial schema", [TABLE_DDL[name] for name in TABLE_DDL]),
+    (2, "timestamp column on legacy tables", _add_missing_timestamps),
+    (3, "per-user time-ordered indexes", [
+        # Covering for get_metrics: the listing never touches the table rows.
+        "CREATE INDEX IF NOT EXISTS idx_metrics_user_ts ON metrics (user_id, timestamp DESC, name, value)",
+        # Covering for the DISTINCT date listing in get_latest_portfolio_analysis.
+        "CREATE INDEX IF NOT EXISTS idx_portfolio_data_user_ts ON portfolio_data (user_id, timestamp DESC, date)",
+        # Result blobs stay in the table; the index gives the order and the rowid.
+        "CREATE INDEX IF NOT EXISTS idx_prediction_results_user_ts ON prediction_results (user_id, timestamp DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_investment_strategy_results_user_ts ON investment_strategy_results (user_id, timestamp DESC)",
+    ]),
+    (4, "incremental risk state", [
+        # One RiskAccumulator (JSON) per user and portfolio, see risk_accumulator.py
+        """
+        CREATE TABLE IF NOT EXISTS risk_state (
+            user_id INTEGER NOT NULL,
+            portfolio_key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, portfolio_key),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+    ]),
+    (5, "alert outbox", [
+        # Risk alerts queued for the background sender, see alerts.py.
+        # next_attempt_at is a unix time: the retry time of a pending alert, or
+        # the lease expiry of one a sender has claimed.
+        """
+        CREATE TABLE IF NOT EXISTS alert_outbox (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            dedup_key TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            sent_at REAL,
+            last_error TEXT
+        )
+        """,
+        # Only undelivered alerts are indexed for the sender, so the claim walks
+        # due rows in order however large the delivered history grows.
+        "CREATE INDEX IF NOT EXISTS idx_alert_outbox_due ON alert_outbox (next_attempt_at) WHERE status IN ('pending', 'sending')",
+        "CREATE INDEX IF NOT EXISTS idx_alert_outbox_created ON alert_outbox (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_alert_outbox_dedup ON alert_outbox (recipient, dedup_key, created_at)",
+    ]),
+    (6, "materialized dashboard", [
+        # Pre-serialized /metrics/dashboard body per user, see database.py.
+        # Existing users get theirs on first read.
+        """
+        CREATE TABLE IF NOT EXISTS dashboard_snapshots (
+            user_id INTEGER PRIMARY KEY,
+            body TEXT NOT NULL,
+            etag TEXT NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+    ]),
+    (7, "content-addressed uploads", [
+        # Each user's current files as references to blobs named by sha256, see
+        # upload_store.py. Users who have not uploaded since keep the legacy
+        # users.uploaded_file_paths list.
+        """
+        CREATE TABLE IF NOT EXISTS uploads (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            first_date TEXT,
+            last_date TEXT,
+            size_bytes INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        # Rows of one user in id (upload) order
+        "CREATE INDEX IF NOT EXISTS idx_uploads_user ON uploads (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_uploads_sha256 ON uploads (sha256)",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Bring the database up to SCHEMA_VERSION and return the number of steps applied.
+
+    Each step runs in its own IMMEDIATE transaction together with the version
+    bump, so concurrent workers starting at the same time apply it only once.
+    """
+    applied = 0
+    for version, _description, step in MIGRATIONS:
+        if schema_version(conn) >= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have applied it while we waited for the lock
+            if schema_version(conn) < version:
+                if callable(step):
+                    step(conn)
+                else:
+                    for statement in step:
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version}")
+                applied += 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
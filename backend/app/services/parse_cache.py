@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# Parsed uploads are stored next to the CSV as one .npy file per column, so any
+# worker process can memory-map them instead of re-parsing the CSV.
+PARSE_CACHE_DIR_NAME = ".parsed"
+PARSE_CACHE_FORMAT_VERSION = 1
+# Upper bound on the column bytes kept mapped by this process (LRU eviction).
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+REQUIRED_COLUMNS = {'date', 'symbol', 'open', 'high', 'low', 'close', 'unix'}
+NUMERIC_COLUMNS = ('open', 'high', 'low', 'close', 'unix')
+
+_lock = threading.Lock()
+_entries: "OrderedDict[tuple, ParsedFile]" = OrderedDict()
+_entries_bytes = 0
+
+
+class ParsedFile:
+    """Typed columns of one uploaded CSV: `date` as datetime64[ns], prices as float64."""
+
+    def __init__(self, symbol: str, columns: Dict[str, np.ndarray], sha256: str):
+        self.symbol = symbol
+        self.columns = columns
+        self.sha256 = sha256
+
+    @property
+    def nbytes(self) -> int:
+        return sum(col.nbytes for col in self.columns.values())
+
+    def __len__(self):
+        return len(self.columns['date'])
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sidecar_dir(path: str) -> str:
+    return os.path.join(os.path.dirname(path), PARSE_CACHE_DIR_NAME, os.path.basename(path))
+
+
+def parse_csv(source, filename: str) -> pd.DataFrame:
+    """Read a CSV and normalise its header, validating the required columns."""
+    df = pd.read_csv(source)
+    df.columns = [str(col).strip().lower() for col in df.columns]
+    if not REQUIRED_COLUMNS.issubset(df.columns):
+        raise ValueError(f"File {filename} is missing one or more required columns: {REQUIRED_COLUMNS}")
+    return df
+
+
+def typed_columns(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    columns = {'date': pd.to_datetime(df['date'], errors='coerce').to_numpy(dtype='datetime64[ns]')}
+    for name in NUMERIC_COLUMNS:
+        columns[name] = pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float64)
+    return columns
+
+
+def _read_meta(directory: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != PARSE_CACHE_FORMAT_VERSION:
+        return None
+    return meta
+
+
+def _load_sidecar(path: str, st: os.stat_result) -> Optional[ParsedFile]:
+    directory = sidecar_dir(path)
+    meta = _read_meta(directory)
+    if meta is None:
+        return None
+    if meta["mtime_ns"] != st.st_mtime_ns or meta["size"] != st.st_size:
+        # The file was touched or rewritten; only trust the sidecar if the bytes match.
+        if meta["size"] != st.st_size or file_sha256(path) != meta["sha256"]:
+            return None
+        meta["mtime_ns"] = st.st_mtime_ns
+        _write_meta(directory, meta)
+    try:
+        columns = {
+            name: np.load(os.path.join(directory, file_name), mmap_mode='r')
+            for name, file_name in meta["columns"].items()
+        }
+    except (OSError, ValueError):
+        return None
+    return ParsedFile(meta["symbol"], columns, meta["sha256"])
+
+
+def _write_meta(directory: str, meta: dict):
+    tmp_path = os.path.join(directory, f"meta.json.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+
+def column_file_name(name: str, sha256: str) -> str:
+    # Column files are named after the content hash so concurrent readers never
+    # see a half-replaced set; meta.json is swapped in last and is the commit point.
+    return f"{name}.{sha256[:16]}.npy"
+
+
+def commit_sidecar(path: str, symbol: str, sha256: str, file_names: Dict[str, str],
+                   st: Optional[os.stat_result] = None) -> Optional[ParsedFile]:
+    """Publish column files already written to the sidecar directory of `path`."""
+    st = st or os.stat(path)
+    directory = sidecar_dir(path)
+    _write_meta(directory, {
+        "version": PARSE_CACHE_FORMAT_VERSION,
+        "mtime_ns": st.st_mtime_ns,
+        "size": st.st_size,
+        "sha256": sha256,
+        "symbol": symbol,
+        "columns": file_names,
+    })
+    for stale in set(os.listdir(directory)) - set(file_names.values()) - {"meta.json"}:
+        if not stale.endswith(".tmp"):
+            try:
+                os.remove(os.path.join(directory, stale))
+            except OSError:
+                pass
+    return _load_sidecar(path, st)
+
+
+def store_sidecar(path: str, parsed: ParsedFile, st: Optional[os.stat_result] = None) -> ParsedFile:
+    """Persist parsed columns next to `path` and return a memory-mapped view of them."""
+    directory = sidecar_dir(path)
+    os.makedirs(directory, exist_ok=True)
+
+    file_names = {}
+    for name, values in parsed.columns.items():
+        file_name = column_file_name(name, parsed.sha256)
+        tmp_path = os.path.join(directory, f"{file_name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(values))
+        os.replace(tmp_path, os.path.join(directory, file_name))
+        file_names[name] = file_name
+
+    return commit_sidecar(path, parsed.symbol, parsed.sha256, file_names, st) or parsed
+
+
+def _parse_and_store(path: str, st: os.stat_result) -> ParsedFile:
+    df = parse_csv(path, os.path.basename(path))
+    parsed = ParsedFile(str(df['symbol'].iloc[0]), typed_columns(df), file_sha256(path))
+    return store_sidecar(path, parsed, st)
+
+
+def _remember(key: tuple, parsed: ParsedFile):
+    global _entries_bytes
+    size = parsed.nbytes
+    if size > PARSE_CACHE_MAX_BYTES:
+        return
+    with _lock:
+        if key in _entries:
+            return
+        _entries[key] = parsed
+        _entries_bytes += size
+        while _entries_bytes > PARSE_CACHE_MAX_BYTES:
+            _, evicted = _entries.popitem(last=False)
+            _entries_bytes -= evicted.nbytes
+
+
+def load_parsed(path: str) -> ParsedFile:
+    """
+    Return the typed columns of the CSV at `path`, parsing it at most once.
+
+    Lookups go through an in-process LRU keyed by (path, mtime, size), then the
+    on-disk sidecar validated against the file's content hash, and only then fall
+    back to parsing the CSV and writing a fresh sidecar.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _lock:
+        parsed = _entries.get(key)
+        if parsed is not None:
+            _entries.move_to_end(key)
+            return parsed
+
+    parsed = _load_sidecar(path, st) or _parse_and_store(path, st)
+    _remember(key, parsed)
+    return parsed
+
+
+def clear_memory_cache():
+    global _entries_bytes
+    with _lock:
+        _entries.clear()
+        _entries_bytes = 0
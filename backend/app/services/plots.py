@@ -0,0 +1,173 @@
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Rendered plots are content-addressed: the id is a hash of everything drawn,
+# so identical analyses share one image and an id never changes meaning.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PLOT_DIR = os.path.join(BASE_DIR, "data", "plots")
+PLOT_CACHE_MAX_BYTES = int(os.getenv("PLOT_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+# Bound on data/plots; the least recently served images are deleted past it
+# (a deleted plot is redrawn by the next analysis that needs it).
+PLOT_DIR_MAX_BYTES = int(os.getenv("PLOT_DIR_MAX_BYTES", 256 * 1024 * 1024))
+PLOT_FORMAT_VERSION = 1
+
+_PLOT_ID = re.compile(r"^[0-9a-f]{64}$")
+
+_lock = threading.Lock()
+_images: "OrderedDict[str, bytes]" = OrderedDict()
+_images_bytes = 0
+# Bytes in PLOT_DIR as of this process's last scan plus what it wrote since;
+# None until the first write. Other workers' writes are seen at the next scan.
+_disk_bytes = None
+# One figure per thread, cleared and redrawn for each plot. Figures created
+# through matplotlib.figure (not pyplot) hold no global state, so threads
+# render concurrently on the Agg canvas.
+_local = threading.local()
+
+
+def plot_fingerprint(title: str, frame: pd.DataFrame) -> str:
+    digest = hashlib.sha256(f"{PLOT_FORMAT_VERSION}\0{title}\0".encode())
+    digest.update("\0".join(map(str, frame.columns)).encode())
+    digest.update(np.ascontiguousarray(frame.index.to_numpy(dtype=np.float64)).tobytes())
+    digest.update(np.ascontiguousarray(frame.to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+def _figure():
+    fig = getattr(_local, "figure", None)
+    if fig is None:
+        # matplotlib is loaded on the first plot rather than at API startup
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(10, 6))
+        FigureCanvasAgg(fig)
+        fig.add_subplot()
+        _local.figure = fig
+    return fig
+
+
+def _render(title: str, frame: pd.DataFrame) -> bytes:
+    fig = _figure()
+    ax = fig.axes[0]
+    ax.clear()
+    for col in frame.columns:
+        ax.plot(frame.index, frame[col], label=col)
+    ax.legend()
+    ax.set_title(title)
+    ax.set_xlabel("Days")
+    ax.set_ylabel("Returns (%)")
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+def _remember(plot_id: str, image: bytes):
+    global _images_bytes
+    if len(image) > PLOT_CACHE_MAX_BYTES:
+        return
+    with _lock:
+        if plot_id in _images:
+            _images.move_to_end(plot_id)
+            return
+        _images[plot_id] = image
+        _images_bytes += len(image)
+        while _images_bytes > PLOT_CACHE_MAX_BYTES:
+            _, evicted = _images.popitem(last=False)
+            _images_bytes -= len(evicted)
+
+
+def get_plot(plot_id: str) -> Optional[bytes]:
+    """Return the PNG for `plot_id` from memory or disk, or None if unknown."""
+    if not _PLOT_ID.match(plot_id):
+        return None
+    with _lock:
+        image = _images.get(plot_id)
+        if image is not None:
+            _images.move_to_end(plot_id)
+            return image
+    path = os.path.join(PLOT_DIR, f"{plot_id}.png")
+    try:
+        with open(path, "rb") as f:
+            image = f.read()
+        os.utime(path)  # the mtime orders disk eviction
+    except OSError:
+        return None
+    _remember(plot_id, image)
+    return image
+
+
+def _scan_plot_dir():
+    """(mtime, size, path) of every stored plot, oldest first."""
+    entries = []
+    try:
+        with os.scandir(PLOT_DIR) as it:
+            for entry in it:
+                if entry.name.endswith(".png"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        pass
+    entries.sort()
+    return entries
+
+
+def _account_disk_write(size: int):
+    global _disk_bytes
+    with _lock:
+        if _disk_bytes is not None:
+            _disk_bytes += size
+            if _disk_bytes <= PLOT_DIR_MAX_BYTES:
+                return
+        entries = _scan_plot_dir()
+        total = sum(size for _, size, _ in entries)
+        # Prune to 90% of the bound so the next few writes skip the scan
+        target = PLOT_DIR_MAX_BYTES * 0.9 if total > PLOT_DIR_MAX_BYTES else total
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        _disk_bytes = total
+
+
+def render_returns_plot(title: str, frame: pd.DataFrame) -> str:
+    """
+    Render one line per column of `frame` and return the plot id.
+
+    The PNG is only drawn when no plot with the same id exists; it is kept in
+    an in-process LRU and written once under data/plots for other workers,
+    which holds up to PLOT_DIR_MAX_BYTES.
+    """
+    plot_id = plot_fingerprint(title, frame)
+    if get_plot(plot_id) is not None:
+        return plot_id
+    image = _render(title, frame)
+    _remember(plot_id, image)
+    os.makedirs(PLOT_DIR, exist_ok=True)
+    tmp_path = os.path.join(PLOT_DIR, f"{plot_id}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(image)
+    os.replace(tmp_path, os.path.join(PLOT_DIR, f"{plot_id}.png"))
+    _account_disk_write(len(image))
+    return plot_id
+
+
+def clear_memory_cache():
+    global _images_bytes
+    with _lock:
+        _images.clear()
+        _images_bytes = 0
@@ -2,113 +2,150 @@ import numpy as np
 import pandas as pd
 import sqlite3
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import matplotlib.pyplot as plt
-import os
 
-# Get the base directory (backend folder)
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-def cap_weights(weights, cap=0.5):
-    capped = {s: min(w, cap) for s, w in weights.items()}
-    total_capped = sum(capped.values())
+from app.services.alignment import aligned_frame
+from app.services.plots import render_returns_plot
+from app.services.price_series import as_price_bundle
+
+# --- Weighting engine ---
+# Prices are a (days x assets) matrix in date order and every rule returns one
+# raw weight per asset; results are only rounded at the API edge.
+WEIGHT_CAP = 0.5
+WEIGHTING_RULES = {}
+# Optional second form of a rule computed from WindowStats, for callers that
+# keep running window statistics instead of slicing prices (see backtest.py)
+WINDOW_RULES = {}
+
+def weighting_rule(name):
+    """Register `func(prices, returns) -> raw weights` as the rule `name`."""
+    def register(func):
+        WEIGHTING_RULES[name] = func
+        # A stats form registered for an earlier definition no longer matches
+        WINDOW_RULES.pop(name, None)
+        return func
+    return register
+
+def window_rule(name):
+    """Register `func(stats: WindowStats) -> raw weights` as the stats form of rule `name`."""
+    def register(func):
+        if name not in WEIGHTING_RULES:
+            raise ValueError(f"Unknown rule: {name}")
+        WINDOW_RULES[name] = func
+        return func
+    return register
+
+class WindowStats:
+    """
+    A lookback window of a (days x assets) price matrix, summarised: its first
+    and last price rows, and the count, mean and population variance of each
+    asset's percent returns (the `returns` a weighting rule is given).
+    """
+
+    __slots__ = ('first_prices', 'last_prices', 'n_returns', 'mean', 'var')
+
+    def __init__(self, first_prices, last_prices, n_returns, mean, var):
+        self.first_prices = first_prices
+        self.last_prices = last_prices
+        self.n_returns = n_returns
+        self.mean = mean
+        self.var = var
+
+def cap_weights(weights, cap=WEIGHT_CAP):
+    """Cap each weight at `cap`, hand the excess to the uncapped assets pro rata and renormalise."""
+    weights = np.asarray(weights, dtype=np.float64)
+    capped = np.minimum(weights, cap)
+    total_capped = capped.sum()
     excess = 1 - total_capped
     if abs(excess) < 1e-9:
-        return {s: round(capped[s], 6) for s in capped}
-    uncapped_assets = [s for s in weights if weights[s] < cap]
-    if not uncapped_assets:
-        return {s: round(capped[s] / total_capped, 6) for s in capped}
-    uncapped_total = sum(weights[s] for s in uncapped_assets)
-    for s in uncapped_assets:
-        add = (weights[s] / uncapped_total) * excess
-        capped[s] += add
-        if capped[s] > cap:
-            capped[s] = cap
-    total_final = sum(capped.values())
-    return {s: round(capped[s] / total_final, 6) for s in capped}
-
-def equal_weight(symbols):
-    w = 1 / len(symbols)
-    weights = {s: round(w, 6) for s in symbols}
-    return cap_weights(weights)
-
-def price_weight(symbols, prices):
-    prices = {s: float(prices[s]) for s in symbols}
-    total = sum(prices.values())
-    weights = {s: prices[s] / total for s in symbols}
-    return cap_weights(weights)
-
-def inverse_volatility(symbols, returns):
-    vols = {s: float(np.std(returns[s])) for s in symbols}
-    inv = {s: 1 / vols[s] if vols[s] > 0 else 0 for s in symbols}
-    total = sum(inv.values())
-    weights = {s: inv[s] / total for s in symbols}
-    return cap_weights(weights)
+        return capped
+    uncapped = weights < cap
+    if not uncapped.any():
+        return capped / total_capped
+    capped[uncapped] += weights[uncapped] / weights[uncapped].sum() * excess
+    np.minimum(capped, cap, out=capped)
+    return capped / capped.sum()
+
+@weighting_rule("Equal")
+def equal_weight(prices, returns):
+    return np.full(prices.shape[1], 1 / prices.shape[1])
+
+@window_rule("Equal")
+def _equal_weight_stats(stats):
+    return np.full(len(stats.first_prices), 1 / len(stats.first_prices))
+
+@weighting_rule("Price")
+def price_weight(prices, returns):
+    first = prices[0]
+    return first / first.sum()
+
+@window_rule("Price")
+def _price_weight_stats(stats):
+    return stats.first_prices / stats.first_prices.sum()
+
+@weighting_rule("InvVol")
+def inverse_volatility(prices, returns):
+    return _inverse_of(returns.std(axis=0))
+
+@window_rule("InvVol")
+def _inverse_volatility_stats(stats):
+    return _inverse_of(np.sqrt(stats.var))
+
+def _inverse_of(vols):
+    inv = np.divide(1, vols, out=np.zeros_like(vols), where=vols > 0)
+    if inv.sum() == 0:
+        # No asset moved at all: nothing to weight by
+        return np.full(len(vols), 1 / len(vols))
+    return inv / inv.sum()
+
+def rule_weights(rule, prices, returns=None):
+    """Capped weight vector of `rule` for a (days x assets) price matrix."""
+    if rule not in WEIGHTING_RULES:
+        raise ValueError(f"Unknown rule: {rule}")
+    if returns is None:
+        returns = percent_change(prices)
+    return cap_weights(WEIGHTING_RULES[rule](prices, returns))
+
+def window_rule_weights(rule, stats):
+    """Capped weights of `rule` from WindowStats, or None if the rule has no stats form."""
+    func = WINDOW_RULES.get(rule)
+    return None if func is None else cap_weights(func(stats))
 
 def percent_change(prices):
-    changes = []
-    for i in range(1, len(prices)):
-        change = ((prices[i] - prices[i - 1]) / prices[i - 1]) * 100
-        changes.append(round(change, 6))
-    return changes
+    """Day-over-day percent change of every column of a (days x assets) matrix."""
+    prices = np.asarray(prices, dtype=np.float64)
+    return (prices[1:] - prices[:-1]) / prices[:-1] * 100
 
 def portfolio_return(weights, returns):
-    min_len = min(len(r) for r in returns.values())
-    port = []
-    for i in range(min_len):
-        r = sum(weights[s] * returns[s][i] for s in weights)
-        port.append(round(r, 2))
-    return port
+    """Daily portfolio returns as one matrix-vector product."""
+    return returns @ weights
 
 def portfolio_risk(port):
     return round(np.std(port), 2)
 
 def fetch_prices_from_request(uploaded_data):
+    """Closes on the dates every symbol shares, one column per upper-cased symbol."""
     data = {}
-    for crypto in uploaded_data:
-        df = pd.DataFrame(crypto['data'])
-        df.columns = [col.strip().lower() for col in df.columns]
-        if 'close' in df.columns and 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
-            df = df.dropna(subset=['date', 'close'])
-            df.set_index("date", inplace=True)
-            data[crypto['symbol'].upper()] = df["close"]
-    if not data:
-        return pd.DataFrame()
-    prices_df = pd.concat(data, axis=1).dropna(how="any")
-    return prices_df
+    for series in as_price_bundle(uploaded_data):
+        if series.dates is not None:
+            data[series.symbol.upper()] = series
+    return aligned_frame(data.values(), how="intersection", names=list(data))
 
 def run_and_plot_strategy(selected_rule="Equal", processed_data=None, user_id=None):
     prices_df = fetch_prices_from_request(processed_data)
     if prices_df.empty:
         raise ValueError("No price data available")
 
-    returns = {col: percent_change(prices_df[col].tolist()) for col in prices_df.columns}
-    prices = {col: prices_df[col].iloc[0] for col in prices_df.columns}
-    symbols = list(returns.keys())
-
-    rules = {
-        "Equal": equal_weight,
-        "Price": price_weight,
-        "InvVol": inverse_volatility,
-    }
-
-    if selected_rule not in rules:
-        raise ValueError(f"Unknown rule: {selected_rule}")
-
-    if selected_rule == "Equal":
-        w = rules[selected_rule](symbols)
-    elif selected_rule == "Price":
-        w = rules[selected_rule](symbols, prices)
-    elif selected_rule == "InvVol":
-        w = rules[selected_rule](symbols, returns)
-    else:
-        raise ValueError(f"Unknown rule: {selected_rule}")
-        
-    port_ret = portfolio_return(w, returns)
+    symbols = list(prices_df.columns)
+    prices = prices_df.to_numpy(dtype=np.float64)
+    returns = percent_change(prices)
+    weights = rule_weights(selected_rule, prices, returns)
+    port_ret = portfolio_return(weights, returns)
 
+    # Round once, at the output edge
+    w = {s: round(float(x), 6) for s, x in zip(symbols, weights)}
     n = min(15, len(port_ret))
-    comparison_df = pd.DataFrame({f"{s}_Return": returns[s][:n] for s in symbols})
-    comparison_df[f"{selected_rule}_Portfolio"] = port_ret[:n]
+    comparison_df = pd.DataFrame({f"{s}_Return": np.round(returns[:n, i], 6) for i, s in enumerate(symbols)})
+    comparison_df[f"{selected_rule}_Portfolio"] = np.round(port_ret[:n], 2)
 
     insights = ""
     for col in comparison_df.columns:
@@ -116,20 +153,7 @@ def run_and_plot_strategy(selected_rule="Equal", processed_data=None, user_id=No
         risk = np.std(comparison_df[col])
         insights += f"{col} -> Avg Return={avg_ret:.2f}%, Risk={risk:.2f}\n"
 
-    plt.figure(figsize=(10, 6))
-    for col in comparison_df.columns:
-        plt.plot(comparison_df.index, comparison_df[col], label=col)
-    plt.legend()
-    plt.title("Portfolio Analysis (Last 15 days)")
-    plt.xlabel("Days")
-    plt.ylabel("Returns (%)")
-    
-    # Use dynamic path based on current directory structure
-    data_dir = os.path.join(BASE_DIR, "data")
-    os.makedirs(data_dir, exist_ok=True)  # Ensure the data directory exists
-    plot_path = os.path.join(data_dir, f"portfolio_analysis_{user_id}.png")
-    
-    plt.savefig(plot_path)
-    plt.close()
-
-    return comparison_df.to_dict(), insights, w, plot_path
+    # Rendered in memory and cached by content, so concurrent requests never share a file
+    plot_id = render_returns_plot("Portfolio Analysis (Last 15 days)", comparison_df)
+
+    return comparison_df.to_dict(), insights, w, plot_id
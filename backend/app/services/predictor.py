@@ -1,157 +1,239 @@
+import asyncio
+import copy
+import logging
+import os
+import time
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
 import pandas as pd
 import numpy as np
-from statsmodels.tsa.arima.model import ARIMA
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 from datetime import datetime, timedelta
+from app.services import forecast_cache
+from app.services.executors import get_process_pool, reset_process_pool
+from app.services.price_series import as_price_bundle
 import warnings
 warnings.filterwarnings('ignore')
 
-def run_predictor(uploaded_data):
+logger = logging.getLogger(__name__)
+
+# Validation refits the model on the expanding window every this many holdout
+# points; in between, the state-space filter is advanced with fixed parameters.
+# 0 fits once on the training split and never refits.
+PREDICTOR_REFIT_EVERY = int(os.getenv("PREDICTOR_REFIT_EVERY", 0))
+# Optimizer iterations per candidate fit (the statsmodels default). This bounds
+# the work of a fit independently of server load, so the chosen order is too.
+PREDICTOR_FIT_MAXITER = int(os.getenv("PREDICTOR_FIT_MAXITER", 50))
+# Seconds one candidate order may spend fitting before it is dropped from the
+# search. The clock starts inside the worker when the fit begins, so time spent
+# queued behind other requests' work never counts; it only cuts off fits that
+# are pathologically slow on their own. The budget is checked by the optimizer
+# after each iteration, so an overrun fails that fit alone and the shared pool
+# worker carries on with other requests' tasks.
+PREDICTOR_FIT_TIMEOUT = float(os.getenv("PREDICTOR_FIT_TIMEOUT", 30))
+
+# Share of the series used to fit the model; the rest is the validation holdout
+TRAIN_RATIO = 0.8
+
+# Longest forecast horizon accepted, in periods
+MAX_HORIZON = int(os.getenv("PREDICTOR_MAX_HORIZON", 90))
+
+# Candidate ARIMA orders, in tie-break order for equal AIC
+PARAM_GRID = [
+    (1, 1, 0), (1, 1, 1), (2, 1, 0), (2, 1, 1),
+    (3, 1, 0), (3, 1, 1), (5, 1, 0), (5, 1, 1),
+    (1, 1, 2), (2, 1, 2), (3, 1, 2)
+]
+
+
+def _arima(*args, **kwargs):
+    # statsmodels takes about a second to import, so it is loaded on the first
+    # fit rather than when the API starts
+    from statsmodels.tsa.arima.model import ARIMA
+    return ARIMA(*args, **kwargs)
+
+
+class _FitTimeout(Exception):
+    pass
+
+
+def _fit_order(train_data, order):
     """
-    Run enhanced ARIMA prediction on uploaded crypto data with model validation.
-    Returns format matching frontend expectations with additional accuracy metrics:
-    {
-        "predicted_value": float,
-        "confidence_interval": [lower, upper],
-        "next_period": "YYYY-MM-DD",
-        "r2_score": float,
-        "rmse": float,
-        "mae": float,
-        "mape": float,
-        "model_order": [p, d, q],
-        "training_size": int,
-        "validation_size": int
-    }
+    Fit one candidate order; runs in a pool worker, so it must stay importable
+    at module level. Returns (aic, params), or None when the fit raised, did
+    not converge, ran past PREDICTOR_FIT_TIMEOUT or produced a non-finite AIC.
     """
-    if not uploaded_data:
-        raise ValueError("No data provided for prediction")
-    
-    # Use first crypto data for prediction
-    crypto = uploaded_data[0]
-    
-    # Support both dict-like (from process_uploaded_files) and object-like inputs
-    if isinstance(crypto, dict):
-        rows = crypto.get('data')
-        symbol = crypto.get('symbol', 'UNKNOWN')
-    else:
-        rows = getattr(crypto, 'data', None)
-        symbol = getattr(crypto, 'symbol', 'UNKNOWN')
-    
-    if not rows:
-        raise ValueError("No data found in uploaded file")
-    
-    df = pd.DataFrame(rows)
-    df.columns = [str(col).strip().lower() for col in df.columns]
-    
-    if 'close' not in df.columns:
-        raise ValueError("'close' column not found in data")
-    
-    # Parse date if available
-    if 'date' in df.columns:
-        df['date'] = pd.to_datetime(df['date'], errors='coerce')
-        df = df.dropna(subset=['date'])
-        df = df.sort_values('date')
-        last_date = df['date'].iloc[-1]
-        next_period = (last_date + timedelta(days=1)).strftime('%Y-%m-%d')
+    warnings.filterwarnings('ignore')
+    deadline = time.monotonic() + PREDICTOR_FIT_TIMEOUT
+
+    def check_deadline(_params):
+        # Called by the optimizer after every iteration
+        if time.monotonic() > deadline:
+            raise _FitTimeout()
+
+    try:
+        fit = _arima(train_data, order=order).fit(
+            method_kwargs={"maxiter": PREDICTOR_FIT_MAXITER, "callback": check_deadline})
+    except Exception:
+        return None
+    if not fit.mle_retvals.get('converged', True) or not np.isfinite(fit.aic):
+        return None
+    return float(fit.aic), np.asarray(fit.params)
+
+
+def _search_orders(train_data, param_grid, parallel=True):
+    """Fit every order and return {order: (aic, params)} for the usable fits."""
+    fits = {}
+    pool = get_process_pool() if parallel else None
+    if pool is not None:
+        for attempt in range(2):
+            try:
+                _search_orders_in_pool(pool, train_data, [o for o in param_grid if o not in fits], fits)
+                break
+            except BrokenProcessPool:
+                # A worker died: keep the finished fits and retry the rest once
+                # on a fresh pool. Orders that break that one too are dropped
+                # rather than fitted here, where a crash would take the API down.
+                reset_process_pool(pool)
+                pool = get_process_pool()
+        else:
+            logger.warning("Dropped ARIMA orders that broke the process pool: %s",
+                           [o for o in param_grid if o not in fits])
     else:
-        next_period = datetime.now().strftime('%Y-%m-%d')
-    
-    df['close'] = pd.to_numeric(df['close'], errors='coerce')
-    df = df.dropna(subset=['close'])
-    
-    if df.shape[0] < 30:
-        raise ValueError("Insufficient data points for prediction (need at least 30 for accurate modeling)")
-    
-    # Use close prices for prediction
-    close_prices = df['close'].values
-    
+        fits = {order: _fit_order(train_data, order) for order in param_grid}
+    return {order: fit for order, fit in fits.items() if fit is not None}
+
+
+def _search_orders_in_pool(pool, train_data, param_grid, fits):
+    """Fit `param_grid` on the pool, adding each finished order's result (or None) to `fits`."""
+    # No timeout here: fits may wait in the shared pool's queue for as long as
+    # other requests keep it busy, and each one bounds its own running time.
+    futures = {pool.submit(_fit_order, train_data, order): order for order in param_grid}
+    for future in as_completed(futures):
+        try:
+            fits[futures[future]] = future.result()
+        except BrokenProcessPool:
+            raise
+        except Exception:
+            fits[futures[future]] = None
+
+
+def _select_model(train_data, warm, parallel=True):
+    """Return (order, aic, fitted results) for the training split."""
+    if warm is not None:
+        # The series only gained rows since the cached model: keep its order
+        # and re-estimate from its parameters instead of searching again.
+        order, start_params = warm
+        try:
+            model_fit = _arima(train_data, order=order).fit(start_params=start_params)
+            return order, model_fit.aic, model_fit
+        except Exception:
+            pass
+
+    best_order = None
+    best_aic = np.inf
+    fits = _search_orders(train_data, PARAM_GRID, parallel)
+    # Walk the grid in order so equal AICs always resolve to the same model
+    for order in PARAM_GRID:
+        if order in fits and fits[order][0] < best_aic:
+            best_aic, best_params = fits[order]
+            best_order = order
+
+    if best_order is not None:
+        # Rebuild the winning fit locally from its parameters; filtering is cheap
+        return best_order, best_aic, _arima(train_data, order=best_order).filter(best_params)
+
+    # Fallback to simple model
+    model_fit = _arima(train_data, order=(1, 1, 0)).fit()
+    return (1, 1, 0), model_fit.aic, model_fit
+
+
+def _one_step_predictions(close_prices, split_idx, order, train_fit, refit_every):
+    """
+    One-step-ahead predictions for every point after `split_idx`.
+
+    Each prediction only uses observations before the predicted point. Instead
+    of refitting per point, the fitted results are extended with the next
+    block of observations, which runs the Kalman filter forward from the last
+    state using the already estimated parameters.
+    """
+    n = len(close_prices)
+    predictions = np.empty(n - split_idx)
+    fit = train_fit
+    pos = split_idx
+    while pos < n:
+        stop = n if refit_every <= 0 else min(n, pos + refit_every)
+        try:
+            predictions[pos - split_idx:stop - split_idx] = np.asarray(fit.extend(close_prices[pos:stop]).fittedvalues)
+        except Exception:
+            # If the filter fails, use last known value
+            predictions[pos - split_idx:stop - split_idx] = close_prices[pos - 1:stop - 1]
+        pos = stop
+        if pos < n:
+            try:
+                fit = _arima(close_prices[:pos], order=order).fit(start_params=fit.params)
+            except Exception:
+                pass
+    return predictions
+
+
+def _fit_and_forecast(close_prices, horizons, refit_every, warm, parallel=True):
+    """
+    Select, validate and refit the model on one close series.
+
+    Returns (result, order, final params); the result has no period labels,
+    which depend on the dates rather than the prices. `parallel` runs the
+    order search on the shared process pool.
+    """
     # Split data: 80% training, 20% validation
-    split_idx = int(len(close_prices) * 0.8)
+    split_idx = int(len(close_prices) * TRAIN_RATIO)
     train_data = close_prices[:split_idx]
     test_data = close_prices[split_idx:]
     
     # Try multiple ARIMA configurations and select the best
-    best_order = None
-    best_aic = np.inf
-    best_model = None
-    
-    # Grid search over common ARIMA parameters
-    param_grid = [
-        (1, 1, 0), (1, 1, 1), (2, 1, 0), (2, 1, 1),
-        (3, 1, 0), (3, 1, 1), (5, 1, 0), (5, 1, 1),
-        (1, 1, 2), (2, 1, 2), (3, 1, 2)
-    ]
-    
-    for order in param_grid:
-        try:
-            model = ARIMA(train_data, order=order)
-            model_fit = model.fit()
-            if model_fit.aic < best_aic:
-                best_aic = model_fit.aic
-                best_order = order
-                best_model = model_fit
-        except:
-            continue
-    
-    if best_model is None:
-        # Fallback to simple model
-        best_order = (1, 1, 0)
-        model = ARIMA(train_data, order=best_order)
-        best_model = model.fit()
+    best_order, best_aic, best_model = _select_model(train_data, warm, parallel)
     
-    # Validate on test set
-    predictions = []
-    actuals = []
-    
-    for i in range(len(test_data)):
-        # Retrain with expanding window
-        temp_train = close_prices[:split_idx + i]
-        try:
-            temp_model = ARIMA(temp_train, order=best_order)
-            temp_fit = temp_model.fit()
-            pred = temp_fit.forecast(steps=1)[0]
-            predictions.append(pred)
-            actuals.append(test_data[i])
-        except:
-            # If model fails, use last known value
-            predictions.append(temp_train[-1])
-            actuals.append(test_data[i])
+    # Validate on test set with expanding-window one-step-ahead forecasts
+    predictions = _one_step_predictions(close_prices, split_idx, best_order, best_model, refit_every)
+    actuals = test_data
     
     # Calculate validation metrics
+    from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
     try:
         r2 = r2_score(actuals, predictions)
         rmse = np.sqrt(mean_squared_error(actuals, predictions))
         mae = mean_absolute_error(actuals, predictions)
-        mape = np.mean(np.abs((np.array(actuals) - np.array(predictions)) / np.array(actuals))) * 100
+        mape = np.mean(np.abs((actuals - predictions) / actuals)) * 100
     except:
         r2 = 0.0
         rmse = 0.0
         mae = 0.0
         mape = 0.0
     
-    # Train final model on all data and make prediction
+    # Train final model on all data and forecast every horizon in one pass
+    steps = max(horizons)
+    final_params = None
     try:
-        final_model = ARIMA(close_prices, order=best_order)
-        final_fit = final_model.fit()
+        final_model = _arima(close_prices, order=best_order)
+        final_fit = final_model.fit(start_params=best_model.params)
+        final_params = final_fit.params
         
-        # Make prediction
-        forecast = final_fit.get_forecast(steps=1)
-        predicted_value = float(forecast.predicted_mean.iloc[0])
-        conf_int = forecast.conf_int().iloc[0].tolist()
-        confidence_interval = [float(conf_int[0]), float(conf_int[1])]
+        # The model is fitted on an ndarray, so the forecast results are arrays
+        forecast = final_fit.get_forecast(steps=steps)
+        predicted = np.asarray(forecast.predicted_mean)
+        conf_int = np.asarray(forecast.conf_int())
+        lower, upper = conf_int[:, 0], conf_int[:, 1]
     except Exception as e:
         # Fallback to weighted moving average with trend
         recent_window = close_prices[-10:]
         weights = np.arange(1, len(recent_window) + 1)
-        predicted_value = float(np.average(recent_window, weights=weights))
-        std = float(np.std(recent_window))
-        confidence_interval = [predicted_value - 1.96 * std, predicted_value + 1.96 * std]
+        predicted = np.full(steps, float(np.average(recent_window, weights=weights)))
+        # Random-walk widening of the one-step interval
+        half_width = 1.96 * float(np.std(recent_window)) * np.sqrt(np.arange(1, steps + 1))
+        lower, upper = predicted - half_width, predicted + half_width
     
-    return {
-        "predicted_value": predicted_value,
-        "confidence_interval": confidence_interval,
-        "next_period": next_period,
+    result = {
+        "predicted_value": float(predicted[0]),
+        "confidence_interval": [float(lower[0]), float(upper[0])],
         "r2_score": round(float(r2), 4),
         "rmse": round(float(rmse), 4),
         "mae": round(float(mae), 4),
@@ -159,5 +241,167 @@ def run_predictor(uploaded_data):
         "model_order": list(best_order),
         "training_size": split_idx,
         "validation_size": len(test_data),
-        "aic": round(float(best_aic), 2)
+        "aic": round(float(best_aic), 2),
+        "forecasts": [
+            {
+                "horizon": h,
+                "predicted_value": float(predicted[h - 1]),
+                "confidence_interval": [float(lower[h - 1]), float(upper[h - 1])],
+            }
+            for h in horizons
+        ],
+    }
+    return result, best_order, final_params
+
+
+def _forecast_worker(close_prices, horizons, refit_every, warm):
+    """Pool entry point for one symbol of a batch; the order search runs in this process."""
+    warnings.filterwarnings('ignore')
+    return _fit_and_forecast(close_prices, horizons, refit_every, warm, parallel=False)
+
+
+def _check_series(series):
+    if len(series) == 0:
+        raise ValueError("No data found in uploaded file")
+    if len(series) < 30:
+        raise ValueError("Insufficient data points for prediction (need at least 30 for accurate modeling)")
+
+
+def _prediction_config(horizons, refit_every):
+    return {"grid": PARAM_GRID, "train_ratio": TRAIN_RATIO, "refit_every": refit_every, "horizons": list(horizons)}
+
+
+def _label_periods(result, series):
+    """Set `next_period` and each forecast's `period`, counting one period per day."""
+    if series.dates is not None:
+        next_date = pd.Timestamp(series.dates[-1]) + timedelta(days=1)
+    else:
+        next_date = pd.Timestamp(datetime.now())
+    result["next_period"] = next_date.strftime('%Y-%m-%d')
+    for forecast in result.get("forecasts", ()):
+        forecast["period"] = (next_date + timedelta(days=forecast["horizon"] - 1)).strftime('%Y-%m-%d')
+    return result
+
+
+def parse_horizons(horizons) -> tuple:
+    """Normalise horizons given as "1,7,30" or a sequence into sorted unique ints."""
+    if isinstance(horizons, str):
+        horizons = [h for h in horizons.split(',') if h.strip()]
+    try:
+        values = sorted({int(h) for h in horizons})
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid forecast horizons: {horizons}")
+    if not values or values[0] < 1 or values[-1] > MAX_HORIZON:
+        raise ValueError(f"Forecast horizons must be between 1 and {MAX_HORIZON}")
+    return tuple(values)
+
+
+def predict_series(series, horizons=(1,), refit_every=None):
+    """
+    Forecast one PriceSeries over `horizons` periods ahead, with validation metrics.
+
+    Results are cached by a fingerprint of the close series and the model
+    configuration, so repeat predictions on unchanged files skip the fitting.
+    """
+    _check_series(series)
+    horizons = parse_horizons(horizons)
+    if refit_every is None:
+        refit_every = PREDICTOR_REFIT_EVERY
+    close_prices = np.asarray(series.close)
+    
+    config = _prediction_config(horizons, refit_every)
+    cache_key = forecast_cache.series_fingerprint(close_prices, config)
+    cached = forecast_cache.get_prediction(cache_key)
+    if cached is not None:
+        return _label_periods(cached, series)
+    
+    warm = forecast_cache.warm_start(close_prices, config)
+    result, order, params = _fit_and_forecast(close_prices, horizons, refit_every, warm)
+    forecast_cache.store_prediction(cache_key, close_prices, config, result, order, params)
+    return _label_periods(copy.deepcopy(result), series)
+
+
+async def iter_batch_forecasts(uploaded_data, horizons, refit_every=None):
+    """
+    Forecast every uploaded symbol and yield one result dict per symbol as it
+    finishes (cached symbols first). Symbols are fitted in parallel on the
+    shared process pool; a symbol that cannot be forecast yields an `error`.
+    """
+    bundle = as_price_bundle(uploaded_data)
+    if not bundle:
+        raise ValueError("No data provided for prediction")
+    horizons = parse_horizons(horizons)
+    if refit_every is None:
+        refit_every = PREDICTOR_REFIT_EVERY
+    config = _prediction_config(horizons, refit_every)
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+
+    pending = {}
+    for series in bundle:
+        try:
+            _check_series(series)
+        except ValueError as e:
+            yield {"symbol": series.symbol, "error": str(e)}
+            continue
+        close_prices = np.ascontiguousarray(series.close)
+        cache_key = forecast_cache.series_fingerprint(close_prices, config)
+        cached = forecast_cache.get_prediction(cache_key)
+        if cached is not None:
+            yield {"symbol": series.symbol, **_label_periods(cached, series)}
+            continue
+        warm = forecast_cache.warm_start(close_prices, config)
+        task = loop.run_in_executor(pool, _forecast_worker, close_prices, horizons, refit_every, warm)
+        pending[task] = (series, close_prices, cache_key)
+
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                series, close_prices, cache_key = pending.pop(task)
+                try:
+                    result, order, params = task.result()
+                except BrokenProcessPool:
+                    reset_process_pool(pool)
+                    yield {"symbol": series.symbol, "error": "Forecast worker crashed"}
+                    continue
+                except Exception as e:
+                    yield {"symbol": series.symbol, "error": str(e)}
+                    continue
+                forecast_cache.store_prediction(cache_key, close_prices, config, result, order, params)
+                yield {"symbol": series.symbol, **_label_periods(copy.deepcopy(result), series)}
+    finally:
+        # The client went away: drop the symbols that have not started yet
+        for task in pending:
+            task.cancel()
+
+
+def run_predictor(uploaded_data, refit_every=None):
+    """
+    Run enhanced ARIMA prediction on uploaded crypto data with model validation.
+    Returns format matching frontend expectations with additional accuracy metrics:
+    {
+        "predicted_value": float,
+        "confidence_interval": [lower, upper],
+        "next_period": "YYYY-MM-DD",
+        "r2_score": float,
+        "rmse": float,
+        "mae": float,
+        "mape": float,
+        "model_order": [p, d, q],
+        "training_size": int,
+        "validation_size": int
     }
+
+    Only the first uploaded symbol is forecast, one period ahead; use
+    `iter_batch_forecasts` for every symbol and longer horizons.
+    `refit_every` overrides PREDICTOR_REFIT_EVERY for the validation pass.
+    """
+    bundle = as_price_bundle(uploaded_data)
+    if not bundle:
+        raise ValueError("No data provided for prediction")
+    
+    # Use first crypto data for prediction
+    result = predict_series(bundle[0], refit_every=refit_every)
+    result.pop("forecasts", None)
+    return result
@@ -0,0 +1,175 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+OHLC_COLUMNS = ('open', 'high', 'low', 'close', 'unix')
+NON_PRICE_COLUMNS = ('date', 'volume', 'adj close')
+
+
+def format_dates(dates: np.ndarray) -> np.ndarray:
+    """Render datetime64 values as CSV-style strings (date-only for daily bars)."""
+    valid = ~np.isnat(dates)
+    day = dates.astype('datetime64[D]')
+    if (dates[valid] == day[valid]).all():
+        return np.datetime_as_string(day)
+    return np.char.replace(np.datetime_as_string(dates, unit='s'), 'T', ' ')
+
+
+def identify_price_column(columns, date_col: Optional[str] = None) -> Optional[str]:
+    """'close' if present, else the last column that is not a date or volume."""
+    if 'close' in columns:
+        return 'close'
+    other_cols = [c for c in columns if c != date_col and c not in NON_PRICE_COLUMNS]
+    return other_cols[-1] if other_cols else None
+
+
+class PriceSeries:
+    """
+    One symbol's OHLC history as NumPy arrays, cleaned and sorted by date once.
+
+    `dates` is datetime64[ns] (or None when the source had no date column) and
+    every price column is float64 and aligned with it. Arrays may be read-only
+    memory maps from the parse cache, so callers must not modify them in place.
+    """
+
+    __slots__ = ('symbol', 'dates', 'close', 'open', 'high', 'low', 'unix')
+
+    def __init__(self, symbol: str, dates: Optional[np.ndarray], close: np.ndarray,
+                 open: Optional[np.ndarray] = None, high: Optional[np.ndarray] = None,
+                 low: Optional[np.ndarray] = None, unix: Optional[np.ndarray] = None):
+        self.symbol = symbol
+        self.dates = dates
+        self.close = close
+        self.open = open
+        self.high = high
+        self.low = low
+        self.unix = unix
+
+    @classmethod
+    def from_columns(cls, symbol: str, columns: Dict[str, np.ndarray]) -> "PriceSeries":
+        """Drop rows without a date or close and order the rest by date."""
+        dates = columns.get('date')
+        close = columns['close']
+        valid = ~np.isnan(close)
+        if dates is not None:
+            valid &= ~np.isnat(dates)
+
+        if dates is None:
+            order = None if valid.all() else np.flatnonzero(valid)
+        elif valid.all() and (len(dates) < 2 or (dates[1:] >= dates[:-1]).all()):
+            order = None
+        elif valid.all() and (dates[1:] < dates[:-1]).all():
+            # Exchange dumps are usually newest-first; a reversed view avoids a copy.
+            order = slice(None, None, -1)
+        else:
+            idx = np.flatnonzero(valid)
+            order = idx[np.argsort(dates[idx], kind='stable')]
+
+        def take(values):
+            if values is None or order is None:
+                return values
+            return values[order]
+
+        return cls(
+            symbol,
+            take(dates),
+            take(close),
+            **{name: take(columns.get(name)) for name in OHLC_COLUMNS if name != 'close'},
+        )
+
+    @classmethod
+    def from_records(cls, symbol: str, rows: List[dict]) -> Optional["PriceSeries"]:
+        """Compatibility adapter for the legacy `{"symbol", "data": [row, ...]}` form."""
+        df = pd.DataFrame(rows)
+        df.columns = [str(col).strip().lower() for col in df.columns]
+        date_col = 'date' if 'date' in df.columns else next(
+            (c for c in df.columns if 'date' in c or 'time' in c), None)
+        price_col = identify_price_column(df.columns, date_col)
+        if price_col is None:
+            return None
+
+        columns = {}
+        if date_col is not None:
+            columns['date'] = pd.to_datetime(df[date_col], errors='coerce').to_numpy(dtype='datetime64[ns]')
+        for name in OHLC_COLUMNS:
+            if name in df.columns:
+                columns[name] = pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float64)
+        columns['close'] = pd.to_numeric(df[price_col], errors='coerce').to_numpy(dtype=np.float64)
+        return cls.from_columns(symbol, columns)
+
+    def __len__(self):
+        return len(self.close)
+
+    @property
+    def data(self) -> List[dict]:
+        """Row dicts in the legacy `process_uploaded_files` shape."""
+        return self.to_frame(index=False).to_dict(orient='records')
+
+    def date_strings(self) -> Optional[np.ndarray]:
+        return None if self.dates is None else format_dates(self.dates)
+
+    def to_frame(self, index: bool = True) -> pd.DataFrame:
+        columns = {name: getattr(self, name) for name in OHLC_COLUMNS if getattr(self, name) is not None}
+        if self.dates is None:
+            return pd.DataFrame(columns)
+        if index:
+            return pd.DataFrame(columns, index=pd.DatetimeIndex(self.dates, name='date'))
+        return pd.DataFrame({'date': self.date_strings(), 'symbol': self.symbol, **columns})
+
+    def close_series(self) -> pd.Series:
+        index = None if self.dates is None else pd.DatetimeIndex(self.dates, name='date')
+        return pd.Series(self.close, index=index, name=self.symbol)
+
+
+class PriceBundle:
+    """The uploaded symbols of one request, in upload order."""
+
+    def __init__(self, series: Iterable[PriceSeries] = ()):
+        self.series: List[PriceSeries] = list(series)
+
+    def __iter__(self) -> Iterator[PriceSeries]:
+        return iter(self.series)
+
+    def __len__(self):
+        return len(self.series)
+
+    def __getitem__(self, i) -> PriceSeries:
+        return self.series[i]
+
+    @property
+    def symbols(self) -> List[str]:
+        return [s.symbol for s in self.series]
+
+    def to_records(self) -> List[dict]:
+        return [{"symbol": s.symbol, "data": s.data} for s in self.series]
+
+
+def as_price_bundle(uploaded_data) -> PriceBundle:
+    """
+    Accept a PriceBundle, a list of PriceSeries, or the legacy list of
+    `{"symbol", "data"}` dicts / objects with `.symbol` and `.data`, and return a
+    PriceBundle. Entries without a symbol, rows or a price column are skipped.
+    """
+    if isinstance(uploaded_data, PriceBundle):
+        return uploaded_data
+    if not uploaded_data:
+        return PriceBundle()
+
+    series = []
+    for crypto in uploaded_data:
+        if isinstance(crypto, PriceSeries):
+            series.append(crypto)
+            continue
+        if isinstance(crypto, dict):
+            rows = crypto.get('data')
+            symbol = crypto.get('symbol')
+        else:
+            rows = getattr(crypto, 'data', None)
+            symbol = getattr(crypto, 'symbol', None)
+        if not rows or not symbol:
+            continue
+        s = PriceSeries.from_records(symbol, rows)
+        if s is not None:
+            series.append(s)
+    return PriceBundle(series)
@@ -0,0 +1,188 @@
+import hashlib
+import math
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+STATE_VERSION = 2
+
+
+class RunningMoments:
+    """Count, mean and sum of squared deviations (Welford), merged one batch at a time."""
+
+    def __init__(self, n: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.n, self.mean, self.m2 = n, mean, m2
+
+    def update(self, values: np.ndarray) -> float:
+        """Fold in `values` (Chan et al. pairwise merge); return the mean shift for co-moments."""
+        if len(values) == 0:
+            return 0.0
+        n_b = len(values)
+        mean_b = float(values.mean())
+        m2_b = float(((values - mean_b) ** 2).sum())
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta * delta * self.n * n_b / n
+        self.n = n
+        return delta
+
+    def std(self, ddof: int = 1) -> float:
+        return math.sqrt(self.m2 / (self.n - ddof)) if self.n > ddof else float("nan")
+
+    def var(self, ddof: int = 1) -> float:
+        return self.m2 / (self.n - ddof) if self.n > ddof else float("nan")
+
+
+class RiskAccumulator:
+    """
+    Running state behind `risk_checker.compute_metrics` for one equal-weight
+    portfolio: moments of the portfolio returns, of the negative ones and of the
+    market (first asset) returns, their co-moment, and the compounded value,
+    peak and worst drawdown. Appending k rows costs O(k); the state is a small
+    JSON-serialisable dict, which includes a fingerprint of the rows it was
+    built from so a history edited anywhere is recomputed rather than extended.
+    """
+
+    def __init__(self, symbols, last_date: Optional[str] = None, last_prices=None, rows: int = 0,
+                 prefix_sha256: Optional[str] = None,
+                 portfolio=None, downside=None, market=None, co_moment: float = 0.0,
+                 value: float = 1.0, peak: float = 0.0, max_drawdown: float = float("nan")):
+        self.symbols = list(symbols)
+        self.last_date = last_date
+        self.last_prices = None if last_prices is None else np.asarray(last_prices, dtype=np.float64)
+        self.prefix_sha256 = prefix_sha256
+        self._digest = None  # hash object over the first `rows` rows, once verified or built
+        self.rows = rows  # price rows seen, one more than the returns
+        self.portfolio = portfolio or RunningMoments()
+        self.downside = downside or RunningMoments()
+        self.market = market or RunningMoments()
+        self.co_moment = co_moment
+        self.value = value
+        self.peak = peak
+        self.max_drawdown = max_drawdown
+
+    # --- Updates ---
+    def continues(self, prices: pd.DataFrame) -> bool:
+        """
+        True if `prices` is the history this state was built from plus rows
+        appended after it: the dates and prices up to `last_date` must hash to
+        the saved fingerprint, so a corrected older row forces a rebuild.
+        """
+        if self.last_date is None or list(prices.columns) != self.symbols:
+            return False
+        if not prices.index.is_monotonic_increasing:
+            return False
+        position = prices.index.searchsorted(pd.Timestamp(self.last_date), side="right")
+        if position != self.rows or position == 0:
+            return False
+        digest = hashlib.sha256(_row_bytes(prices.iloc[:position]))
+        if digest.hexdigest() != self.prefix_sha256:
+            return False
+        self._digest = digest
+        return True
+
+    def append(self, prices: pd.DataFrame):
+        """Fold in the rows of `prices` after `last_date` (all rows for a fresh state)."""
+        new = prices.iloc[self.rows:].to_numpy(dtype=np.float64)
+        if len(new) == 0:
+            return
+        if self.last_prices is not None:
+            new = np.vstack([self.last_prices, new])
+        returns = new[1:] / new[:-1] - 1
+        # Same filter as pct_change(...).dropna(): rows with a missing return are skipped
+        returns = returns[~np.isnan(returns).any(axis=1)]
+        self._add_returns(returns)
+        # The fingerprint is extended with the appended rows only
+        if self._digest is None:
+            self._digest = hashlib.sha256(_row_bytes(prices.iloc[:self.rows]))
+        self._digest.update(_row_bytes(prices.iloc[self.rows:]))
+        self.prefix_sha256 = self._digest.hexdigest()
+        self.rows = len(prices)
+        self.last_date = str(prices.index[-1])
+        self.last_prices = new[-1]
+
+    def _add_returns(self, returns: np.ndarray):
+        if len(returns) == 0:
+            return
+        port = returns.mean(axis=1)
+        market = returns[:, 0]
+        n_a = self.portfolio.n
+        n_b = len(port)
+        # Batch co-moment, then the cross term from the shift of both means
+        co_b = float(((port - port.mean()) * (market - market.mean())).sum())
+        delta_p = self.portfolio.update(port)
+        delta_m = self.market.update(market)
+        self.co_moment += co_b + delta_p * delta_m * n_a * n_b / (n_a + n_b)
+        self.downside.update(port[port < 0])
+
+        values = self.value * np.cumprod(1 + port)
+        peaks = np.maximum.accumulate(np.maximum(values, self.peak))
+        drawdown = float(((values - peaks) / peaks).min())
+        self.max_drawdown = drawdown if math.isnan(self.max_drawdown) else min(self.max_drawdown, drawdown)
+        self.value = float(values[-1])
+        self.peak = float(peaks[-1])
+
+    # --- Results ---
+    def metrics(self) -> dict:
+        """The `compute_metrics` dict, from the running state alone."""
+        std = self.portfolio.std()
+        mean = self.portfolio.mean if self.portfolio.n else float("nan")
+        downside = self.downside.std()
+        market_var = self.market.var(ddof=0)
+        # np.cov is sample (ddof=1) while np.var is population; kept as in compute_metrics
+        cov = self.co_moment / (self.portfolio.n - 1) if self.portfolio.n > 1 else float("nan")
+        n_assets = len(self.symbols)
+        return {
+            "volatility": std * np.sqrt(TRADING_DAYS) if self.portfolio.n else np.nan,
+            "sharpe": (mean / std) * np.sqrt(TRADING_DAYS) if std != 0 else np.nan,
+            "sortino": (mean / downside) * np.sqrt(TRADING_DAYS) if downside != 0 else np.nan,
+            "max_drawdown": self.max_drawdown if self.portfolio.n else np.nan,
+            "beta": cov / market_var if market_var != 0 else np.nan,
+            "max_weight": 1 / n_assets if n_assets else np.nan,
+        }
+
+    # --- Persistence ---
+    def to_dict(self) -> dict:
+        moments = lambda m: [m.n, m.mean, m.m2]
+        return {
+            "version": STATE_VERSION,
+            "symbols": self.symbols,
+            "last_date": self.last_date,
+            "last_prices": None if self.last_prices is None else self.last_prices.tolist(),
+            "rows": self.rows,
+            "prefix_sha256": self.prefix_sha256,
+            "portfolio": moments(self.portfolio),
+            "downside": moments(self.downside),
+            "market": moments(self.market),
+            "co_moment": self.co_moment,
+            "value": self.value,
+            "peak": self.peak,
+            "max_drawdown": self.max_drawdown,
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> Optional["RiskAccumulator"]:
+        """Rebuild a saved accumulator, or None if it was saved by another state version."""
+        if state.get("version") != STATE_VERSION:
+            return None
+        return cls(
+            state["symbols"], state["last_date"], state["last_prices"], state["rows"], state["prefix_sha256"],
+            RunningMoments(*state["portfolio"]), RunningMoments(*state["downside"]),
+            RunningMoments(*state["market"]), state["co_moment"], state["value"], state["peak"],
+            state["max_drawdown"],
+        )
+
+
+def _row_bytes(prices: pd.DataFrame) -> bytes:
+    """Each row's date and float64 prices, row after row, so a history hashes in appendable pieces."""
+    dates = prices.index.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    values = np.ascontiguousarray(prices.to_numpy(dtype=np.float64)).view(np.int64)
+    return np.column_stack([dates, values]).tobytes()
+
+
+def portfolio_key(prices: pd.DataFrame) -> str:
+    """Identify a portfolio by its ordered symbols (the first one is the beta market)."""
+    return "|".join(map(str, prices.columns))
@@ -1,12 +1,10 @@
-import pandas as pd
 import numpy as np
-import smtplib
-from email.mime.text import MIMEText
-from datetime import datetime
-from dotenv import load_dotenv
-import os
 
-load_dotenv()
+from app.services.alerts import queue_alert
+from app.services.alignment import aligned_frame
+from app.services.database import get_risk_state, save_risk_state
+from app.services.price_series import as_price_bundle
+from app.services.risk_accumulator import RiskAccumulator, portfolio_key
 
 THRESHOLDS = {
     "volatility": 0.05,
@@ -17,50 +15,18 @@ THRESHOLDS = {
     "max_weight": 0.5
 }
 
-EMAIL_USER = os.getenv("EMAIL_USER")
-EMAIL_PASS = os.getenv("EMAIL_PASS")
-
-SMTP_SERVER = os.getenv("SMTP_SERVER")
-SMTP_PORT = os.getenv("SMTP_PORT")
-
 def fetch_data(uploaded_data=None):
-    # uploaded_data may be a list of dicts (from process_uploaded_files)
-    # or objects with .data and .symbol attributes. Handle both.
-    if not uploaded_data:
-        return pd.DataFrame()
-
+    # uploaded_data may be a PriceBundle (from process_uploaded_files) or the
+    # legacy list of dicts / objects with .data and .symbol attributes.
     series_list = {}
 
-    for crypto in uploaded_data:
-        # support both dict-like and object-like inputs
-        if isinstance(crypto, dict):
-            rows = crypto.get('data')
-            symbol = crypto.get('symbol')
-        else:
-            rows = getattr(crypto, 'data', None)
-            symbol = getattr(crypto, 'symbol', None)
-
-        if not rows or not symbol:
+    for series in as_price_bundle(uploaded_data):
+        if series.dates is None or len(series) == 0:
             continue
+        series_list[series.symbol] = series
 
-        df = pd.DataFrame(rows)
-        # normalize column names to lower-case and stripped
-        df.columns = [str(col).strip().lower() for col in df.columns]
-
-        if 'close' in df.columns and 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
-            df = df.dropna(subset=['date', 'close'])
-            if df.empty:
-                continue
-            df.set_index('date', inplace=True)
-            series_list[symbol] = pd.to_numeric(df['close'], errors='coerce')
-
-    if not series_list:
-        return pd.DataFrame()
-
-    prices = pd.concat(series_list, axis=1)
-    prices = prices.dropna(how='any')
-    return prices
+    # Only the dates every symbol shares
+    return aligned_frame(series_list.values(), how="intersection", names=list(series_list))
 
 def compute_metrics(prices):
     returns = prices.pct_change(fill_method=None).dropna()
@@ -98,6 +64,23 @@ def compute_metrics(prices):
         "max_weight": max_weight
     }
 
+def compute_metrics_incremental(prices, user_id):
+    """
+    `compute_metrics` from the user's saved accumulator for this portfolio,
+    folding in only the rows appended since the last check. The state is
+    rebuilt from scratch when the earlier history no longer matches.
+    """
+    key = portfolio_key(prices)
+    saved = get_risk_state(user_id, key)
+    accumulator = RiskAccumulator.from_dict(saved) if saved else None
+    if accumulator is None or not accumulator.continues(prices):
+        accumulator = RiskAccumulator(prices.columns)
+    appended = len(prices) - accumulator.rows
+    accumulator.append(prices)
+    if appended:
+        save_risk_state(user_id, key, accumulator.to_dict())
+    return accumulator.metrics()
+
 def check_and_prepare_alert(metrics):
     violations = []
 
@@ -119,23 +102,20 @@ def check_and_prepare_alert(metrics):
 
     return f"Risk Alert Triggered: {', '.join(violations)}"
 
-def run_risk_check(user_email, uploaded_data=None):
+def run_risk_check(user_email, uploaded_data=None, send_alert=True, user_id=None):
+    """
+    Compute the risk metrics and alert text. With `send_alert` the alert is put
+    in the outbox for the background sender (see alerts.py); with a `user_id`
+    the metrics are updated incrementally.
+    """
     prices = fetch_data(uploaded_data)
-    metrics = compute_metrics(prices)
+    if user_id is not None and not prices.empty:
+        metrics = compute_metrics_incremental(prices, user_id)
+    else:
+        metrics = compute_metrics(prices)
     alert_message = check_and_prepare_alert(metrics)
 
-    if alert_message and EMAIL_USER and EMAIL_PASS and user_email and SMTP_SERVER and SMTP_PORT:
-        try:
-            email = MIMEText(alert_message)
-            email["Subject"] = "Crypto Risk Alert"
-            email["From"] = EMAIL_USER
-            email["To"] = user_email
-
-            with smtplib.SMTP(SMTP_SERVER, int(SMTP_PORT)) as server:
-                server.starttls()
-                server.login(EMAIL_USER, EMAIL_PASS)
-                server.send_message(email)
-        except Exception as e:
-            print(f"Failed to send risk alert email: {e}")
+    if send_alert:
+        queue_alert(user_id, user_email, alert_message)
 
     return metrics, alert_message
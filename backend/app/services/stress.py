@@ -0,0 +1,165 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.services.executors import get_process_pool, reset_process_pool
+from app.services.risk_accumulator import RunningMoments
+
+# Scenario: (daily mean, daily volatility) applied to every asset. Shocks are
+# correlated across assets with the empirical correlation of their returns.
+STRESS_SCENARIOS = {
+    "Bull Market": (0.04, 0.01),
+    "Bear Market": (-0.04, 0.015),
+    "Volatile Market": (0.00, 0.08),
+}
+STRESS_TEST_PATHS = int(os.getenv("STRESS_TEST_PATHS", 200_000))
+# Upper bound for the `paths` a request may ask for, per scenario
+MAX_STRESS_TEST_PATHS = int(os.getenv("MAX_STRESS_TEST_PATHS", 5_000_000))
+# Shocks are drawn in float32 chunks of at most this many values (16 MiB) and
+# each chunk is folded into the summary before the next is drawn. Besides the
+# chunk, a scenario only keeps the lowest (1 - min(VAR_CONFIDENCE)) share of
+# the returns for VaR/CVaR.
+STRESS_TEST_CHUNK_VALUES = int(os.getenv("STRESS_TEST_CHUNK_VALUES", 4 * 1024 * 1024))
+# Below this many paths per scenario the process round trip costs more than it saves.
+STRESS_TEST_PARALLEL_MIN_PATHS = int(os.getenv("STRESS_TEST_PARALLEL_MIN_PATHS", 1_000_000))
+VAR_CONFIDENCE = (0.95, 0.99)
+
+
+def correlation_factor(returns: Optional[pd.DataFrame], assets) -> np.ndarray:
+    """
+    Lower Cholesky factor of the assets' return correlation matrix.
+
+    Assets missing from `returns`, or without variance, are uncorrelated with
+    the rest. A matrix that is not numerically positive definite (e.g. two
+    identical series) gets a growing ridge on its diagonal until it factors.
+    """
+    n = len(assets)
+    corr = np.eye(n)
+    if returns is not None and not returns.empty and n > 1:
+        columns = {str(c).lower(): c for c in returns.columns}
+        present = [i for i, a in enumerate(assets) if a in columns]
+        if len(present) > 1:
+            sub = returns[[columns[assets[i]] for i in present]].corr().to_numpy()
+            sub = np.nan_to_num(sub, nan=0.0)
+            np.fill_diagonal(sub, 1.0)
+            corr[np.ix_(present, present)] = sub
+    ridge = 0.0
+    while True:
+        try:
+            return np.linalg.cholesky(corr + ridge * np.eye(n)) / np.sqrt(1 + ridge)
+        except np.linalg.LinAlgError:
+            ridge = max(ridge * 10, 1e-10)
+
+
+def _simulate_scenario(mu: float, sigma: float, weights: np.ndarray, factor: np.ndarray,
+                       n_paths: int, seed: np.random.SeedSequence) -> dict:
+    """
+    Summary of the portfolio returns of `n_paths` correlated draws `mu + sigma * factor @ z`.
+
+    The portfolio return is `w @ shock`, so each chunk only needs one product of
+    the standard normals with `factor.T @ w`; nothing (paths x assets) outlives
+    its chunk, and the returns themselves are only kept in the VaR tail.
+    """
+    rng = np.random.default_rng(seed)
+    drift = np.float32(mu * weights.sum())
+    loadings = (sigma * factor.T @ weights).astype(np.float32)
+    chunk = max(1, STRESS_TEST_CHUNK_VALUES // len(weights))
+    summary = _StreamingSummary(n_paths)
+    portfolio = np.empty(min(chunk, n_paths), dtype=np.float32)
+    for start in range(0, n_paths, chunk):
+        rows = min(chunk, n_paths - start)
+        z = rng.standard_normal((rows, len(weights)), dtype=np.float32)
+        out = portfolio[:rows]
+        np.matmul(z, loadings, out=out)
+        out += drift
+        summary.update(out)
+    return summary.result()
+
+
+def _tail_size(confidence: float, n_paths: int) -> int:
+    """Returns at or below the VaR quantile: the (k+1) lowest, k = floor((1 - c) * n)."""
+    return int((1 - confidence) * n_paths) + 1
+
+
+class _StreamingSummary:
+    """Moments, extremes and the VaR tail of returns that arrive one chunk at a time."""
+
+    def __init__(self, n_paths: int):
+        self.n_paths = n_paths
+        self.moments = RunningMoments()
+        self.min = np.inf
+        self.max = -np.inf
+        self.tail_size = max(_tail_size(c, n_paths) for c in VAR_CONFIDENCE)
+        self.tail = np.empty(0, dtype=np.float32)
+
+    def update(self, returns: np.ndarray):
+        self.moments.update(returns.astype(np.float64))
+        self.min = min(self.min, float(returns.min()))
+        self.max = max(self.max, float(returns.max()))
+        # Keep only the lowest tail_size returns seen so far
+        if len(returns) > self.tail_size:
+            returns = np.partition(returns, self.tail_size - 1)[:self.tail_size]
+        merged = np.concatenate((self.tail, returns))
+        if len(merged) > self.tail_size:
+            merged = np.partition(merged, self.tail_size - 1)[:self.tail_size]
+        self.tail = merged
+
+    def result(self) -> dict:
+        stats = {
+            "mean_return": self.moments.mean,
+            "volatility": self.moments.std() if self.moments.n > 1 else 0.0,
+            "min_return": self.min,
+            "max_return": self.max,
+        }
+        # VaR and CVaR are reported as losses: the return at the tail quantile and
+        # the mean return beyond it, with the sign flipped.
+        for confidence in VAR_CONFIDENCE:
+            k = _tail_size(confidence, self.n_paths)
+            tail = np.partition(self.tail, k - 1)[:k]
+            label = f"{round(confidence * 100)}"
+            stats[f"var_{label}"] = float(-tail.max())
+            stats[f"cvar_{label}"] = float(-tail.mean(dtype=np.float64))
+        stats["paths"] = self.moments.n
+        return stats
+
+
+def check_paths(n_paths: Optional[int]) -> int:
+    """The path count to simulate per scenario; raises ValueError when out of range."""
+    n_paths = STRESS_TEST_PATHS if n_paths is None else int(n_paths)
+    if not 1 < n_paths <= MAX_STRESS_TEST_PATHS:
+        raise ValueError(f"Stress test paths must be between 2 and {MAX_STRESS_TEST_PATHS}")
+    return n_paths
+
+
+def run_stress_test(weights: Dict[str, float], returns: Optional[pd.DataFrame] = None,
+                    n_paths: Optional[int] = None, seed: Optional[int] = None,
+                    parallel: bool = True) -> dict:
+    """
+    Monte Carlo stress test of `weights` under each scenario in STRESS_SCENARIOS.
+
+    Scenarios draw from independent child streams of `seed`, so a seeded run
+    gives the same numbers whether scenarios run in-process or on the
+    analytics process pool.
+    """
+    n_paths = check_paths(n_paths)
+    assets = [str(a).lower() for a in weights]
+    if not assets:
+        raise ValueError("No weights to stress test")
+    w = np.array([weights[a] for a in weights], dtype=np.float64)
+    factor = correlation_factor(returns, assets)
+    seeds = np.random.SeedSequence(seed).spawn(len(STRESS_SCENARIOS))
+    args = [(mu, sigma, w, factor, n_paths, s) for (mu, sigma), s in zip(STRESS_SCENARIOS.values(), seeds)]
+
+    pool = get_process_pool() if parallel and n_paths >= STRESS_TEST_PARALLEL_MIN_PATHS else None
+    outcomes = None
+    if pool is not None:
+        try:
+            outcomes = list(pool.map(_simulate_scenario, *zip(*args)))
+        except BrokenProcessPool:
+            reset_process_pool(pool)
+    if outcomes is None:
+        outcomes = [_simulate_scenario(*a) for a in args]
+    return dict(zip(STRESS_SCENARIOS, outcomes))
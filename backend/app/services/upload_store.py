@@ -0,0 +1,17 @@
+import os
+
+# Uploads are stored once per distinct content, named by the SHA-256 of the
+# stored bytes, and the uploads table (see database.py) records which of them
+# make up each user's current files. A blob is never rewritten, so everything
+# derived from its path (the parse-cache sidecar, the in-process LRU) is keyed
+# on the content hash and shared by every user who uploads the same data.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+UPLOAD_DIR = os.path.join(BASE_DIR, "data", "user_uploads")
+BLOB_DIR = os.path.join(UPLOAD_DIR, "blobs")
+# Uploads too large to hold in memory are received here before being moved
+# to their blob path (same filesystem, so the move is an atomic rename).
+INCOMING_DIR = os.path.join(BLOB_DIR, ".incoming")
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(BLOB_DIR, sha256[:2], f"{sha256}.csv")
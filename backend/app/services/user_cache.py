@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from app.models.user import UserInDB
+
+# Users resolved from bearer tokens, so authenticated requests skip the JWT
+# check and the users lookup. Entries are keyed by the exact token string, which
+# fixes its subject and expiry: a hit needs no decoding, and an entry never
+# outlives its token. Writes to a user's row invalidate it in this process;
+# other worker processes see the change after at most USER_CACHE_TTL seconds.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))  # 0 disables the cache
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", 4096))
+
+_lock = threading.Lock()
+# token -> (valid until, user)
+_entries: "OrderedDict[str, tuple]" = OrderedDict()
+_tokens_by_user: Dict[int, Set[str]] = {}
+_tokens_by_email: Dict[str, Set[str]] = {}
+_generation = 0
+
+
+def generation() -> int:
+    """Read before loading a user from the database and pass to `put`."""
+    return _generation
+
+
+def get(token: str) -> Optional[UserInDB]:
+    entry = _entries.get(token)
+    if entry is None:
+        return None
+    if entry[0] <= time.time():
+        with _lock:
+            _drop_locked(token)
+        return None
+    return entry[1]
+
+
+def put(token: str, user: UserInDB, token_expiry: float, loaded_at_generation: int):
+    """
+    Cache `user` for `token` until the token expires or USER_CACHE_TTL passes.
+
+    Skipped if any user was invalidated since `loaded_at_generation`, as the
+    row read may predate that write.
+    """
+    if USER_CACHE_TTL <= 0:
+        return
+    valid_until = min(token_expiry, time.time() + USER_CACHE_TTL)
+    with _lock:
+        if loaded_at_generation != _generation:
+            return
+        _drop_locked(token)
+        _entries[token] = (valid_until, user)
+        _tokens_by_user.setdefault(user.id, set()).add(token)
+        _tokens_by_email.setdefault(user.email, set()).add(token)
+        while len(_entries) > USER_CACHE_MAX_ENTRIES:
+            _drop_locked(next(iter(_entries)))
+
+
+def _drop_locked(token: str):
+    entry = _entries.pop(token, None)
+    if entry is None:
+        return
+    user = entry[1]
+    for index, key in ((_tokens_by_user, user.id), (_tokens_by_email, user.email)):
+        tokens = index.get(key)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del index[key]
+
+
+def invalidate(user_id: Optional[int] = None, email: Optional[str] = None):
+    """Forget every cached token of the user with `user_id` or `email`."""
+    global _generation
+    with _lock:
+        _generation += 1
+        tokens = set(_tokens_by_user.get(user_id, ())) | set(_tokens_by_email.get(email, ()))
+        for token in tokens:
+            _drop_locked(token)
+
+
+def clear():
+    global _generation
+    with _lock:
+        _generation += 1
+        _entries.clear()
+        _tokens_by_user.clear()
+        _tokens_by_email.clear()
@@ -0,0 +1,82 @@
+"""
+Benchmark the shared alignment engine in `alignment` against the previous
+per-service implementations (a symbol-by-symbol outer merge with ffill/bfill,
+and pd.concat with dropna), check that they produce the same frames, then
+time uploads of up to 500 symbols with ragged, gappy histories.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_alignment [max_symbols] [days]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.services.investment_rule import combine_uploaded_data
+from app.services.portfolio_math import fetch_prices_from_request
+from app.services.price_series import PriceSeries, PriceBundle
+
+
+# --- Previous implementations ---
+def legacy_union(bundle):
+    all_dfs = [pd.DataFrame({"date": s.dates, s.symbol: s.close}) for s in bundle]
+    prices_df = all_dfs[0]
+    for df in all_dfs[1:]:
+        prices_df = prices_df.merge(df, on="date", how="outer")
+    prices_df = prices_df.sort_values("date").set_index("date").dropna(how="all")
+    return prices_df.ffill().bfill()
+
+
+def legacy_intersection(bundle):
+    data = {s.symbol.upper(): s.close_series() for s in bundle}
+    return pd.concat(data, axis=1, sort=True).dropna(how="any")
+
+
+def ragged_bundle(n_symbols, n_days, seed=0):
+    """Symbols listed on different days, each missing ~5% of the calendar."""
+    rng = np.random.default_rng(seed)
+    calendar = pd.date_range("2015-01-01", periods=n_days, freq="D").to_numpy().astype("datetime64[ns]")
+    series = []
+    for i in range(n_symbols):
+        start = int(rng.integers(0, n_days // 4))
+        keep = np.flatnonzero(rng.random(n_days - start) > 0.05) + start
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(keep))))
+        series.append(PriceSeries(f"s{i}", calendar[keep], close))
+    return PriceBundle(series)
+
+
+def timed(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    max_symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_days = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    for n_symbols in (2, 10, 60):
+        bundle = ragged_bundle(n_symbols, 500, seed=n_symbols)
+        pd.testing.assert_frame_equal(combine_uploaded_data(bundle), legacy_union(bundle), check_freq=False)
+        pd.testing.assert_frame_equal(fetch_prices_from_request(bundle), legacy_intersection(bundle), check_freq=False)
+    print("union (ffill/bfill) and intersection frames match the previous implementations")
+
+    print(f"alignment of ragged uploads, {n_days} calendar days (best of 3):")
+    for n_symbols in sorted({10, 100, max_symbols}):
+        bundle = ragged_bundle(n_symbols, n_days)
+        old_union = timed(legacy_union, bundle, repeat=1)
+        new_union = timed(combine_uploaded_data, bundle)
+        old_inter = timed(legacy_intersection, bundle)
+        new_inter = timed(fetch_prices_from_request, bundle)
+        print(f"  {n_symbols:4d} symbols  union: merge {old_union * 1000:8.1f} ms  engine {new_union * 1000:6.1f} ms"
+              f" ({old_union / new_union:5.0f}x)   intersection: concat {old_inter * 1000:6.1f} ms"
+              f"  engine {new_inter * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
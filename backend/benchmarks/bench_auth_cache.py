@@ -0,0 +1,56 @@
+"""
+Time `auth.get_current_user` with the user cache cold (JWT decode plus a
+users query on the db pool) against a cache hit, and check that updating the
+user's upload paths is visible on the next request.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_auth_cache [requests]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from app.models.user import User
+from app.services import database, user_cache
+from app.services.auth import create_access_token, get_current_user
+from app.services.upload_store import blob_path
+
+
+async def per_request_us(token, n, cold):
+    start = time.perf_counter()
+    for _ in range(n):
+        if cold:
+            user_cache.clear()
+        await get_current_user(token)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+async def run(n):
+    token = create_access_token({"sub": "bench@example.com"}, timedelta(minutes=30))
+    cold = await per_request_us(token, n // 10, cold=True)
+    hot = await per_request_us(token, n, cold=False)
+    print(f"get_current_user: uncached {cold:8.1f} us  cached {hot:6.2f} us  ({cold / hot:5.0f}x)")
+
+    user = await get_current_user(token)
+    upload = {"filename": "new.csv", "sha256": "0" * 64, "symbol": "BTC", "row_count": 1,
+              "first_date": None, "last_date": None, "size_bytes": 1}
+    await database.run_db(database.replace_user_uploads, user.id, [upload])
+    assert (await get_current_user(token)).uploaded_file_paths == [blob_path(upload["sha256"])]
+    print("an upload-path update is visible on the next request")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_URL = os.path.join(tmp, "auth.db")
+        database.init_db()
+        database.add_user(User(name="bench", email="bench@example.com", password="x"), hashed_password="x")
+        asyncio.run(run(n))
+
+
+if __name__ == "__main__":
+    main()
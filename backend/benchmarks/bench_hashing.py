@@ -0,0 +1,89 @@
+"""
+Measure login throughput (`auth.authenticate_user`: a users query plus a bcrypt
+verify on the hash pool) for hash pool sizes from 1 up to the core count, then
+fire a burst larger than HASH_MAX_PENDING to show the excess turned away with
+a Retry-After, and check that a login upgrades a hash made with another cost.
+
+Run from the backend folder (BCRYPT_ROUNDS sets the cost being measured):
+
+    python -m benchmarks.bench_hashing [logins per pool size]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from passlib.context import CryptContext
+
+from app.models.user import User
+from app.services import database, executors, hashing
+from app.services.auth import authenticate_user
+
+EMAIL = "bench@example.com"
+PASSWORD = "correct horse battery staple"
+
+
+def pool_sizes():
+    cores = os.cpu_count() or 1
+    sizes, size = [], 1
+    while size < cores:
+        sizes.append(size)
+        size *= 2
+    return sizes + [cores]
+
+
+async def logins_per_second(n):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(authenticate_user(EMAIL, PASSWORD) for _ in range(n)))
+    elapsed = time.perf_counter() - start
+    assert all(results)
+    return n / elapsed
+
+
+async def burst(n):
+    outcomes = await asyncio.gather(*(authenticate_user(EMAIL, PASSWORD) for _ in range(n)), return_exceptions=True)
+    busy = [o for o in outcomes if isinstance(o, hashing.HashingBusy)]
+    assert len(busy) + sum(o is not False and not isinstance(o, Exception) for o in outcomes) == n
+    return len(busy), max((b.retry_after for b in busy), default=0)
+
+
+async def run(n):
+    print(f"bcrypt cost {hashing.BCRYPT_ROUNDS}, {os.cpu_count()} core(s)")
+    limit = hashing.HASH_MAX_PENDING
+    baseline = None
+    for size in pool_sizes():
+        executors.shutdown_executors()
+        executors.THREAD_POOL_SIZES["hash"] = size
+        hashing.HASH_MAX_PENDING = n  # measure throughput without admission control
+        rate = await logins_per_second(n)
+        baseline = baseline or rate
+        print(f"hash pool {size:3d} thread(s): {rate:8.1f} logins/s  ({rate / baseline:4.2f}x)")
+
+    hashing.HASH_MAX_PENDING = limit
+    rejected, retry_after = await burst(3 * limit)
+    print(f"burst of {3 * limit} logins with HASH_MAX_PENDING={limit}: "
+          f"{rejected} rejected with 503, Retry-After up to {retry_after}s")
+
+    # A hash made with a different cost is replaced on the next login
+    old_cost = 4 if hashing.BCRYPT_ROUNDS != 4 else 5
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=old_cost).hash(PASSWORD)
+    user = database.get_user(EMAIL)
+    database.update_user_password(user["id"], old_hash)
+    assert await authenticate_user(EMAIL, PASSWORD)
+    stored = database.get_user(EMAIL)["hashed_password"]
+    assert not hashing.pwd_context.needs_update(stored)
+    print(f"login rehashed a cost-{old_cost} hash to cost {hashing.BCRYPT_ROUNDS}")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_URL = os.path.join(tmp, "hashing.db")
+        database.init_db()
+        database.add_user(User(name="bench", email=EMAIL, password=PASSWORD))
+        asyncio.run(run(n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Startup budget check for `import app.main`.
+
+Imports the application in fresh interpreters with `python -X importtime`,
+reports the cumulative import time of the slowest top-level modules, and fails
+when the median exceeds the budget or when a stack that must load lazily
+(statsmodels, sklearn, matplotlib) is imported at startup.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_import_time [--budget-ms 1500] [--runs 5]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+LAZY_PACKAGES = ("statsmodels", "sklearn", "matplotlib")
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", 1500))
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_profile():
+    """Return {module: (cumulative_us, depth)} for one cold `import app.main`."""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=backend_dir, capture_output=True, text=True, check=True,
+    )
+    profile = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            _self_us, cumulative_us, indent, module = match.groups()
+            profile[module] = (int(cumulative_us), len(indent) // 2)
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    totals = []
+    profile = {}
+    for _ in range(args.runs):
+        profile = import_profile()
+        totals.append(profile["app.main"][0] / 1000)
+    median_ms = statistics.median(totals)
+
+    top_level = sorted(((us, m) for m, (us, depth) in profile.items() if depth == 1), reverse=True)
+    print("slowest top-level imports (last run):")
+    for us, module in top_level[:8]:
+        print(f"  {us / 1000:8.1f} ms  {module}")
+    print(f"import app.main: median {median_ms:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+
+    failures = []
+    eager = sorted({m.split(".")[0] for m in profile} & set(LAZY_PACKAGES))
+    if eager:
+        failures.append(f"imported at startup but must load lazily: {', '.join(eager)}")
+    if median_ms > args.budget_ms:
+        failures.append(f"startup import time {median_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark the vectorized technical-metrics engine against the previous
+per-symbol pandas implementation and check that both produce the same rows.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_metrics [n_symbols] [n_rows]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.services.metrics import _technical_metrics_rows
+from app.services.price_series import PriceBundle, PriceSeries, as_price_bundle
+
+
+def legacy_technical_metrics(crypto_data, rows=10):
+    """The per-symbol `iterrows` implementation that the engine replaced (DB writes omitted)."""
+    output = {}
+    all_returns = {}
+
+    # First pass: build DataFrames and returns for each symbol
+    for series in as_price_bundle(crypto_data):
+        if len(series) < 2:
+            continue
+        df = pd.DataFrame({'close': series.close})
+        if series.dates is not None:
+            df.insert(0, 'date', series.dates)
+
+        returns = df['close'].pct_change().dropna()
+        if returns.empty:
+            continue
+
+        symbol = series.symbol
+        all_returns[symbol] = returns
+        # attach processed df for second pass
+        output[symbol] = {'df': df}
+
+    # Determine market returns as first symbol (if any)
+    market_series = None
+    if all_returns:
+        first_symbol = next(iter(all_returns))
+        market_series = all_returns[first_symbol]
+
+    # Second pass: compute per-symbol metrics and prepare rows
+    for symbol, info in list(output.items()):
+        df = info['df']
+        returns = df['close'].pct_change().dropna()
+
+        # percent_change as decimal
+        df['percent_change'] = df['close'].pct_change()
+        df['rolling_volatility_7d'] = df['percent_change'].rolling(window=7).std()
+        df['average_return_3d'] = df['percent_change'].rolling(window=3).mean()
+
+        # moving averages & signal
+        df['ma_5'] = df['close'].rolling(window=5).mean()
+        df['ma_20'] = df['close'].rolling(window=20).mean()
+        df['trading_signal'] = 'Hold'
+        df.loc[df['ma_5'] > df['ma_20'], 'trading_signal'] = 'Buy'
+        df.loc[df['ma_5'] < df['ma_20'], 'trading_signal'] = 'Sell'
+
+        # Sortino ratio (annualized)
+        downside = returns[returns < 0]
+        downside_std = downside.std() * np.sqrt(252) if not downside.empty else np.nan
+        mean_annual = returns.mean() * 252
+        sortino = (mean_annual / downside_std) if downside_std and downside_std != 0 else np.nan
+
+        # Beta vs market
+        if market_series is not None and symbol in all_returns:
+            # align series
+            aligned = pd.concat([all_returns[symbol], market_series], axis=1).dropna()
+            if aligned.shape[0] > 1:
+                cov = np.cov(aligned.iloc[:, 0], aligned.iloc[:, 1])[0][1]
+                var = np.var(aligned.iloc[:, 1])
+                beta = cov / var if var != 0 else np.nan
+            else:
+                beta = np.nan
+        else:
+            beta = np.nan
+
+        # build rows: take last `rows` non-null entries with metrics
+        metrics_rows = []
+        df_clean = df.dropna(subset=['percent_change'])
+        tail = df_clean.tail(rows)
+        for _, r in tail.iterrows():
+            metrics_rows.append({
+                'date': r['date'].isoformat() if 'date' in r and not pd.isna(r['date']) else None,
+                'percent_change': float(r.get('percent_change', np.nan)),
+                'rolling_volatility_7d': float(r.get('rolling_volatility_7d', np.nan)) if not pd.isna(r.get('rolling_volatility_7d', np.nan)) else None,
+                'average_return_3d': float(r.get('average_return_3d', np.nan)) if not pd.isna(r.get('average_return_3d', np.nan)) else None,
+                'trading_signal': str(r.get('trading_signal', 'Hold')),
+                'sortino': float(sortino) if not pd.isna(sortino) else None,
+                'beta': float(beta) if not pd.isna(beta) else None
+            })
+
+        output[symbol] = metrics_rows
+
+    return output
+
+
+def make_bundle(n_symbols, n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2015-01-01", periods=n_rows, freq="D").to_numpy()
+    series = []
+    for i in range(n_symbols):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, n_rows)))
+        series.append(PriceSeries(f"SYM{i}", dates, close))
+    return PriceBundle(series)
+
+
+def assert_same(expected, actual):
+    assert list(expected) == list(actual), "symbol order differs"
+    for symbol in expected:
+        assert len(expected[symbol]) == len(actual[symbol]), symbol
+        for old, new in zip(expected[symbol], actual[symbol]):
+            for key, value in old.items():
+                other = new[key]
+                if isinstance(value, float):
+                    assert other is not None and np.isclose(value, other, rtol=1e-9, atol=1e-15), (symbol, key, value, other)
+                else:
+                    assert value == other, (symbol, key, value, other)
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    n_symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    bundle = make_bundle(n_symbols, n_rows)
+
+    legacy_time, expected = best_of(lambda: legacy_technical_metrics(bundle))
+    engine_time, actual = best_of(lambda: _technical_metrics_rows(list(bundle), 10))
+    assert_same(expected, actual)
+
+    print(f"{n_symbols} symbols x {n_rows} rows")
+    print(f"  legacy:     {legacy_time * 1000:8.2f} ms")
+    print(f"  vectorized: {engine_time * 1000:8.2f} ms  ({legacy_time / engine_time:.1f}x)")
+    print("  outputs identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark the NumPy weighting engine in `portfolio_math` against the previous
+dict-and-loop implementation, check that both give the same weights and
+portfolio returns, then time the engine alone on large price matrices.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_portfolio_math [max_assets] [max_days]
+"""
+import sys
+import time
+
+import numpy as np
+
+from app.services.portfolio_math import percent_change, portfolio_return, rule_weights
+
+RULES = ("Equal", "Price", "InvVol")
+
+
+# --- Previous implementation (per-day, per-asset Python loops on dicts) ---
+def legacy_cap_weights(weights, cap=0.5):
+    capped = {s: min(w, cap) for s, w in weights.items()}
+    total_capped = sum(capped.values())
+    excess = 1 - total_capped
+    if abs(excess) < 1e-9:
+        return {s: round(capped[s], 6) for s in capped}
+    uncapped_assets = [s for s in weights if weights[s] < cap]
+    if not uncapped_assets:
+        return {s: round(capped[s] / total_capped, 6) for s in capped}
+    uncapped_total = sum(weights[s] for s in uncapped_assets)
+    for s in uncapped_assets:
+        add = (weights[s] / uncapped_total) * excess
+        capped[s] += add
+        if capped[s] > cap:
+            capped[s] = cap
+    total_final = sum(capped.values())
+    return {s: round(capped[s] / total_final, 6) for s in capped}
+
+
+def legacy_percent_change(prices):
+    changes = []
+    for i in range(1, len(prices)):
+        change = ((prices[i] - prices[i - 1]) / prices[i - 1]) * 100
+        changes.append(round(change, 6))
+    return changes
+
+
+def legacy_portfolio_return(weights, returns):
+    min_len = min(len(r) for r in returns.values())
+    port = []
+    for i in range(min_len):
+        r = sum(weights[s] * returns[s][i] for s in weights)
+        port.append(round(r, 2))
+    return port
+
+
+def legacy_run(rule, prices):
+    symbols = [f"S{i}" for i in range(prices.shape[1])]
+    returns = {s: legacy_percent_change(prices[:, i].tolist()) for i, s in enumerate(symbols)}
+    if rule == "Equal":
+        w = legacy_cap_weights({s: round(1 / len(symbols), 6) for s in symbols})
+    elif rule == "Price":
+        first = {s: float(prices[0, i]) for i, s in enumerate(symbols)}
+        total = sum(first.values())
+        w = legacy_cap_weights({s: first[s] / total for s in symbols})
+    else:
+        vols = {s: float(np.std(returns[s])) for s in symbols}
+        inv = {s: 1 / vols[s] if vols[s] > 0 else 0 for s in symbols}
+        total = sum(inv.values())
+        w = legacy_cap_weights({s: inv[s] / total for s in symbols})
+    return np.array(list(w.values())), np.array(legacy_portfolio_return(w, returns))
+
+
+def engine_run(rule, prices):
+    returns = percent_change(prices)
+    weights = rule_weights(rule, prices, returns)
+    return weights, portfolio_return(weights, returns)
+
+
+def price_matrix(n_assets, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, 0.02, size=(n_days, n_assets)) * rng.uniform(0.5, 2.0, size=n_assets)
+    return 100 * rng.uniform(0.1, 10, size=n_assets) * np.exp(np.cumsum(steps, axis=0))
+
+
+def timed(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    max_assets = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    max_days = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    print("equivalence and speed-up against the loop implementation:")
+    for n_assets, n_days in ((3, 365), (20, 2000), (100, 5000)):
+        prices = price_matrix(n_assets, n_days)
+        for rule in RULES:
+            old_w, old_port = legacy_run(rule, prices)
+            new_w, new_port = engine_run(rule, prices)
+            # The old code rounded intermediates, so results agree to its rounding
+            assert np.allclose(np.round(new_w, 6), old_w, atol=2e-6), (rule, n_assets, n_days)
+            assert np.allclose(np.round(new_port, 2), old_port, atol=0.011), (rule, n_assets, n_days)
+        old = timed(legacy_run, "InvVol", prices, repeat=1)
+        new = timed(engine_run, "InvVol", prices)
+        print(f"  {n_assets:5d} assets x {n_days:6d} days  loops {old * 1000:9.1f} ms"
+              f"  engine {new * 1000:7.2f} ms  ({old / new:6.0f}x)")
+
+    print("engine scaling (InvVol, best of 3):")
+    shapes = [(100, 10000), (1000, 10000), (max_assets, max_days // 2), (max_assets, max_days)]
+    for n_assets, n_days in shapes:
+        prices = price_matrix(n_assets, n_days)
+        elapsed = timed(engine_run, "InvVol", prices)
+        print(f"  {n_assets:5d} assets x {n_days:6d} days  {elapsed * 1000:8.1f} ms"
+              f"  ({n_assets * n_days / elapsed / 1e6:6.1f} M cells/s)")
+
+
+if __name__ == "__main__":
+    main()
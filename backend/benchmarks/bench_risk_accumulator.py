@@ -0,0 +1,85 @@
+"""
+Check the incremental `RiskAccumulator` against the batch
+`risk_checker.compute_metrics` while a price history grows in uneven appends
+(round-tripping the state through JSON each time, as the API does), check
+that editing an old row forces a rebuild, then time a small append against a
+full recomputation on long histories.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_risk_accumulator [max_days]
+"""
+import json
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from app.services.risk_accumulator import RiskAccumulator
+from app.services.risk_checker import compute_metrics
+
+RTOL = 1e-9
+
+
+def price_frame(n_days, n_assets=3, seed=0):
+    rng = np.random.default_rng(seed)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, size=(n_days, n_assets)), axis=0))
+    index = pd.date_range("1700-01-01", periods=n_days, freq="D", name="date")
+    return pd.DataFrame(prices, index=index, columns=[f"S{i}" for i in range(n_assets)])
+
+
+def assert_close(incremental, batch):
+    for name, expected in batch.items():
+        actual = incremental[name]
+        if np.isnan(expected) and np.isnan(actual):
+            continue
+        assert abs(actual - expected) <= RTOL * max(1.0, abs(expected)), (name, actual, expected)
+
+
+def main():
+    max_days = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    # Batch metrics of one- and two-row histories warn about empty slices
+    warnings.simplefilter("ignore", RuntimeWarning)
+
+    prices = price_frame(5000)
+    state = None
+    for end in (1, 2, 3, 50, 51, 400, 1200, 4999, 5000):
+        history = prices.iloc[:end]
+        accumulator = RiskAccumulator.from_dict(json.loads(json.dumps(state))) if state else None
+        if accumulator is None or not accumulator.continues(history):
+            accumulator = RiskAccumulator(history.columns)
+        accumulator.append(history)
+        assert_close(accumulator.metrics(), compute_metrics(history))
+        state = accumulator.to_dict()
+    print(f"incremental metrics match the batch computation (rtol {RTOL:g}) across appends")
+
+    # A re-upload correcting an old row must not extend the saved state
+    corrected = prices.copy()
+    corrected.iloc[2500] *= 0.5
+    accumulator = RiskAccumulator.from_dict(json.loads(json.dumps(state)))
+    assert not accumulator.continues(corrected)
+    accumulator = RiskAccumulator(corrected.columns)
+    accumulator.append(corrected)
+    assert_close(accumulator.metrics(), compute_metrics(corrected))
+    print("a history edited before the last check is recomputed, not extended")
+
+    for n_days in (10_000, max_days):
+        prices = price_frame(n_days)
+        accumulator = RiskAccumulator(prices.columns)
+        accumulator.append(prices.iloc[:-5])
+        start = time.perf_counter()
+        assert accumulator.continues(prices)
+        accumulator.append(prices)
+        incremental = time.perf_counter() - start
+        start = time.perf_counter()
+        batch = compute_metrics(prices)
+        full = time.perf_counter() - start
+        assert_close(accumulator.metrics(), batch)
+        print(f"  {n_days:7d} days, 5 appended rows: incremental {incremental * 1000:6.2f} ms"
+              f"  batch {full * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark the correlated Monte Carlo stress test in `stress`: check the
+simulated portfolio volatility and 95% VaR against their closed form, then
+time growing path counts and report the peak memory, which stays flat as
+the paths grow (one chunk of draws plus the VaR tail).
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_stress [assets] [max_paths]
+
+(max_paths above MAX_STRESS_TEST_PATHS needs that variable raised too.)
+"""
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from app.services.stress import STRESS_SCENARIOS, correlation_factor, run_stress_test
+
+Z_05 = -1.6448536269514722  # 5% quantile of the standard normal
+
+
+def sample_returns(n_assets, n_days=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0, 0.02, size=(n_days, 1))
+    idiosyncratic = rng.normal(0, 0.02, size=(n_days, n_assets))
+    betas = rng.uniform(0.3, 1.5, size=n_assets)
+    return pd.DataFrame(market * betas + idiosyncratic, columns=[f"S{i}" for i in range(n_assets)])
+
+
+def main():
+    n_assets = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    max_paths = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000_000
+    returns = sample_returns(n_assets)
+    weights = {c: 1 / n_assets for c in returns.columns}
+
+    factor = correlation_factor(returns, [c.lower() for c in returns.columns])
+    w = np.full(n_assets, 1 / n_assets)
+    spread = np.sqrt(w @ factor @ factor.T @ w)
+    result = run_stress_test(weights, returns, n_paths=1_000_000, seed=1, parallel=False)
+    for name, (mu, sigma) in STRESS_SCENARIOS.items():
+        stats = result[name]
+        assert abs(stats["volatility"] / (sigma * spread) - 1) < 0.01, name
+        assert abs(stats["var_95"] + mu + sigma * spread * Z_05) < 0.02 * sigma * spread, name
+    print(f"{n_assets} correlated assets: volatility and 95% VaR match the closed form")
+
+    for paths in sorted({p for p in (10_000, 100_000, 1_000_000) if p < max_paths} | {max_paths}):
+        tracemalloc.start()
+        start = time.perf_counter()
+        run_stress_test(weights, returns, n_paths=paths, seed=1, parallel=False)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  {paths:9d} paths x {len(STRESS_SCENARIOS)} scenarios  {elapsed * 1000:8.1f} ms"
+              f"  peak {peak / 2**20:6.1f} MiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Delivery check for the risk alert outbox in `app.services.alerts`, against a
+local aiosmtpd server standing in for the mail relay (aiosmtpd is in
+requirements-dev.txt).
+
+Runs the real queue and delivery paths against a throwaway database and
+asserts that duplicate alerts are dropped, that alerts to one recipient go out
+as one message per batch over a reused SMTP session, that a refused delivery
+is retried with exponential backoff and abandoned after ALERT_MAX_ATTEMPTS,
+that a claim whose sender never reports back is picked up again once its lease
+expires, and that a session dropped by the server is reopened. Exits non-zero
+on a failure.
+
+Run from the backend folder:
+
+    python -m benchmarks.check_alerts
+"""
+import os
+import socket
+import sys
+import tempfile
+import time
+from email import message_from_bytes
+
+from app.services import alerts, database
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+class Recorder:
+    """aiosmtpd handler keeping every received message and the sessions used."""
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        self.messages.append((envelope.rcpt_tos, message_from_bytes(envelope.content)))
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def outbox():
+    conn = database.get_connection()
+    columns = ("id", "recipient", "status", "attempts", "next_attempt_at")
+    return [dict(zip(columns, row)) for row in conn.execute(f"SELECT {', '.join(columns)} FROM alert_outbox ORDER BY id")]
+
+
+def clear_outbox():
+    conn = database.get_connection()
+    conn.execute("DELETE FROM alert_outbox")
+    conn.commit()
+
+
+def use_server(port: int):
+    alerts.SMTP_SERVER, alerts.SMTP_PORT = "127.0.0.1", str(port)
+
+
+# --- Checks ---
+def check_dedup_and_batching(sender, recorder):
+    assert alerts.queue_alert(1, "a@example.com", "BTC drawdown")
+    assert not alerts.queue_alert(1, "a@example.com", "BTC drawdown"), "duplicate within the window was queued"
+    assert alerts.queue_alert(1, "a@example.com", "ETH volatility")
+    assert alerts.queue_alert(2, "b@example.com", "BTC drawdown")
+    assert sender.deliver_due() == 3
+
+    by_recipient = {tuple(rcpt): msg for rcpt, msg in recorder.messages}
+    assert len(recorder.messages) == 2 and set(by_recipient) == {("a@example.com",), ("b@example.com",)}, recorder.messages
+    batched = by_recipient[("a@example.com",)]
+    assert batched["Subject"] == f"{alerts.ALERT_SUBJECT} (2 alerts)", batched["Subject"]
+    assert "BTC drawdown" in batched.get_payload() and "ETH volatility" in batched.get_payload()
+    assert all(row["status"] == "sent" for row in outbox())
+    assert not alerts.queue_alert(1, "a@example.com", "BTC drawdown"), "an alert already sent was queued again"
+    return "duplicates dropped, one message per recipient"
+
+
+def check_session_reuse(sender, recorder):
+    assert alerts.queue_alert(1, "a@example.com", "SOL drawdown")
+    assert sender.deliver_due() == 1
+    assert len(recorder.sessions) == 1, f"{len(recorder.sessions)} SMTP sessions for two batches"
+    return "later batches reuse the SMTP session"
+
+
+def check_backoff(sender, refused_port):
+    use_server(refused_port)
+    alerts.queue_alert(1, "a@example.com", "refused")
+    for attempt in range(1, alerts.ALERT_MAX_ATTEMPTS + 1):
+        failed_at = time.time()
+        assert sender.deliver_due() == 1
+        row = outbox()[0]
+        assert row["attempts"] == attempt, row
+        if attempt == alerts.ALERT_MAX_ATTEMPTS:
+            assert row["status"] == "failed", row
+            break
+        delay = row["next_attempt_at"] - failed_at
+        assert row["status"] == "pending" and abs(delay - alerts.retry_delay(attempt)) < 1, (row, delay)
+        assert sender.deliver_due() == 0, "alert retried before its backoff elapsed"
+        # Make the retry due now instead of waiting for it
+        conn = database.get_connection()
+        conn.execute("UPDATE alert_outbox SET next_attempt_at = ? WHERE id = ?", (time.time(), row["id"]))
+        conn.commit()
+    delays = [alerts.retry_delay(a) for a in range(1, alerts.ALERT_MAX_ATTEMPTS)]
+    return f"refused delivery retried after {delays} s, then abandoned"
+
+
+def check_lease_expiry():
+    alerts.queue_alert(1, "a@example.com", "claimed by a sender that died")
+    now = time.time()
+    claimed = database.claim_due_alerts(10, alerts.ALERT_LEASE, now)
+    assert len(claimed) == 1
+    # The sender never marks it sent or failed
+    assert database.claim_due_alerts(10, alerts.ALERT_LEASE, now + alerts.ALERT_LEASE - 1) == []
+    reclaimed = database.claim_due_alerts(10, alerts.ALERT_LEASE, now + alerts.ALERT_LEASE + 1)
+    assert [a["id"] for a in reclaimed] == [claimed[0]["id"]], reclaimed
+    return f"unresolved claim picked up again after the {alerts.ALERT_LEASE:.0f} s lease"
+
+
+def check_reconnect(sender, port):
+    recorder = Recorder()
+    controller = Controller(recorder, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        use_server(port)
+        alerts.queue_alert(1, "a@example.com", "before restart")
+        assert sender.deliver_due() == 1 and len(recorder.messages) == 1
+        controller.stop()  # drops the open session
+        controller = Controller(recorder, hostname="127.0.0.1", port=port)
+        controller.start()
+        alerts.queue_alert(1, "a@example.com", "after restart")
+        assert sender.deliver_due() == 1
+        assert len(recorder.messages) == 2 and [row["status"] for row in outbox()] == ["sent", "sent"], outbox()
+    finally:
+        controller.stop()
+    return "a session dropped by the server is reopened on the next send"
+
+
+def main():
+    if Controller is None:
+        print("aiosmtpd is required: pip install -r requirements-dev.txt")
+        sys.exit(1)
+    alerts.SMTP_STARTTLS = False
+    alerts.EMAIL_USER = alerts.EMAIL_PASS = None
+    alerts.ALERT_FROM = "alerts@example.com"
+    alerts.ALERT_MAX_ATTEMPTS = 3
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_URL = os.path.join(tmp, "alerts.db")
+        database.init_db()
+
+        recorder = Recorder()
+        controller = Controller(recorder, hostname="127.0.0.1", port=free_port())
+        controller.start()
+        sender = alerts.AlertSender()
+        checks = [
+            lambda: check_dedup_and_batching(sender, recorder),
+            lambda: check_session_reuse(sender, recorder),
+            lambda: check_backoff(alerts.AlertSender(), free_port()),
+            check_lease_expiry,
+            lambda: check_reconnect(alerts.AlertSender(), free_port()),
+        ]
+        try:
+            use_server(controller.port)
+            for check in checks:
+                try:
+                    print(f"[ok] {check()}")
+                except AssertionError as e:
+                    print(f"[FAIL] {e}")
+                    failures += 1
+                clear_outbox()
+        finally:
+            sender.connection.close()
+            controller.stop()
+
+    if failures:
+        print(f"{failures} alert delivery check(s) failed")
+        sys.exit(1)
+    print(f"all {len(checks)} alert delivery checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Query-plan regression check for the per-user, time-ordered queries.
+
+Runs the real read and prune paths in `app.services.database` against a
+throwaway database, captures every SELECT/UPDATE/DELETE they issue, and asserts that
+SQLite serves each one from an index without a table scan or a temp B-tree
+sort. Exits non-zero on a regression.
+
+Run from the backend folder:
+
+    python -m benchmarks.check_query_plans
+"""
+import os
+import sys
+import tempfile
+
+from app.models.user import User
+from app.services import database
+
+QUERIES = [
+    lambda: database.get_metrics(1),
+    lambda: database.get_metrics(1, limit=5),
+    lambda: database.get_latest_portfolio_analysis(1, limit=5),
+    lambda: database.get_latest_prediction(1, limit=5),
+    lambda: database.get_latest_investment_strategy(1, limit=5),
+    lambda: database.add_metrics_bulk([("m", 1.0)], 1),
+    lambda: database.add_prediction_data(1, {"predicted_value": 1.0}),
+    lambda: database.add_investment_strategy_data(1, {"weights": {}}),
+    lambda: database.add_portfolio_data([{"user_id": 1, "symbol": "BTC", "date": "2024-01-01", "close": 1.0}]),
+    lambda: database.enqueue_alert(1, "a@example.com", "s", "b", "k", 3600, 1000.0),
+    lambda: database.claim_due_alerts(50, 300, 1000.0),
+    lambda: database.prune_alerts(0.0),
+    lambda: database.add_user(User(name="a", email="a@example.com", password="x"), hashed_password="x"),
+    lambda: database.get_user("a@example.com"),
+    lambda: database.get_user_uploads(1),
+    lambda: database.replace_user_uploads(1, []),
+]
+
+
+def plan_problems(conn, sql):
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    problems = []
+    for detail in plan:
+        if detail.startswith("SCAN ") and "USING" not in detail:
+            problems.append(detail)
+        if "USE TEMP B-TREE FOR ORDER BY" in detail:
+            problems.append(detail)
+    if not any("USING INDEX" in d or "USING COVERING INDEX" in d or "USING INTEGER PRIMARY KEY" in d for d in plan):
+        problems.append("no index used: " + " | ".join(plan))
+    return problems
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_URL = os.path.join(tmp, "plans.db")
+        database.init_db()
+        conn = database.get_connection()
+
+        statements = []
+        conn.set_trace_callback(statements.append)
+        for query in QUERIES:
+            query()
+        conn.set_trace_callback(None)
+
+        failures = 0
+        checked = set()
+        for sql in statements:
+            normalized = " ".join(sql.split())
+            keyword = normalized.split(" ", 1)[0].upper()
+            if keyword not in ("SELECT", "DELETE", "UPDATE") or normalized in checked:
+                continue
+            checked.add(normalized)
+            problems = plan_problems(conn, sql)
+            status = "FAIL" if problems else "ok"
+            print(f"[{status}] {normalized[:110]}")
+            for problem in problems:
+                print(f"       {problem}")
+            failures += bool(problems)
+
+    if failures:
+        print(f"{failures} query plan regression(s)")
+        sys.exit(1)
+    print(f"all {len(checked)} queries use their indexes")
+
+
+if __name__ == "__main__":
+    main()